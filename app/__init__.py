@@ -2,31 +2,56 @@ from flask import Flask
 from flask_cors import CORS
 from prometheus_flask_exporter import PrometheusMetrics
 from flask_mail import Mail
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 from app.config import Config
-from app.extensions import mongo, redis_client, mail
+from app.extensions import (
+    mongo, redis_client, mail, mail_queue, local_cache, fill_lock, password_hasher, instrumentation,
+    reminder_scheduler, rate_limiter
+)
+from app.serialization import JSONProvider
+from app.indexes import init_indexes
+from app.commands import register_commands
+from app.models.task import cache_codec
 from app.routes.auth import auth_bp
 from app.routes.tasks import tasks_bp
 from app.routes.metrics import metrics_bp
 
+# Response headers that browsers may read on cross-origin requests
+CORS_EXPOSE_HEADERS = ["Content-Range", "X-Total-Count", "X-Next-Cursor", "ETag", "Retry-After"]
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = JSONProvider(app)
+    if app.config['PROXY_FIX_X_FOR']:
+        # Take remote_addr from X-Forwarded-For, as set by the trusted proxies
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
 
     # Initialize extensions
     CORS(app, resources={
         r"/api/*": {
             "origins": app.config['CORS_ORIGINS'],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
-            "expose_headers": ["Content-Range", "X-Total-Count"],
+            "allow_headers": ["Content-Type", "Authorization", "If-None-Match", "If-Match"],
+            "expose_headers": CORS_EXPOSE_HEADERS,
             "supports_credentials": True
         }
     })
     PrometheusMetrics(app)
+    instrumentation.init_app(app)
     mail.init_app(app)
-    mongo.init_app(app)
+    mail_queue.init_app(app)
+    reminder_scheduler.init_app(app)
+    mongo.init_app(app, event_listeners=[instrumentation.command_listener])
     redis_client.init_app(app)
+    rate_limiter.init_app(app)
+    local_cache.init_app(app)
+    fill_lock.init_app(app)
+    cache_codec.init_app(app)
+    password_hasher.init_app(app)
+    init_indexes(app)
+    register_commands(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
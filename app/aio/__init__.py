@@ -0,0 +1,36 @@
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.routing import Mount
+
+from app import create_app
+from app.config import Config
+from app.aio.extensions import async_mongo, async_redis
+from app.aio.middleware import RequestMetricsMiddleware
+
+
+def create_asgi_app(config_class=Config):
+    """Create the ASGI app.
+
+    The login, registration, logout, task and metrics routes are served natively
+    with Motor and redis.asyncio, sharing keys, cache entries and JSON shapes with
+    the Flask implementation, and recorded in the same metrics. Every other route
+    (password reset, batch, summary, CORS preflights) is served by the Flask app
+    from create_app, mounted as a WSGI fallback.
+    """
+    from app.aio.routes import http_exception, routes
+
+    flask_app = create_app(config_class)
+    async_mongo.init_app(flask_app)
+    async_redis.init_app(flask_app)
+
+    app = Starlette(
+        routes=[*routes, Mount('/', app=WSGIMiddleware(flask_app))],
+        middleware=[Middleware(RequestMetricsMiddleware, routes=routes, flask_app=flask_app)],
+        exception_handlers={HTTPException: http_exception},
+        on_shutdown=[async_mongo.close, async_redis.close]
+    )
+    app.state.flask_app = flask_app
+    app.state.config = flask_app.config
+    return app
@@ -0,0 +1,39 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import uri_parser
+import redis.asyncio as redis
+
+from app.extensions import instrumentation
+from app.instrumentation import instrument_async_redis
+
+
+class AsyncMongo:
+    """Motor counterpart of flask_pymongo's PyMongo."""
+
+    def __init__(self):
+        self.cx = None
+        self.db = None
+
+    def init_app(self, app):
+        uri = app.config['MONGO_URI']
+        self.cx = AsyncIOMotorClient(uri, event_listeners=[instrumentation.command_listener])
+        self.db = self.cx[uri_parser.parse_uri(uri)['database']]
+
+    async def close(self):
+        self.cx.close()
+
+
+class AsyncRedisClient:
+    """redis.asyncio counterpart of RedisClient."""
+
+    def __init__(self):
+        self.client = None
+
+    def init_app(self, app):
+        self.client = instrument_async_redis(redis.from_url(app.config['REDIS_URL']))
+
+    async def close(self):
+        await self.client.close()
+
+
+async_mongo = AsyncMongo()
+async_redis = AsyncRedisClient()
@@ -0,0 +1,71 @@
+import time
+
+from starlette.routing import Match
+
+from app.extensions import instrumentation
+from app.instrumentation import RequestTimings, current_timings, http_request_metrics
+
+
+class RequestMetricsMiddleware:
+    """ASGI counterpart of PrometheusMetrics and Instrumentation for the native routes.
+
+    Records the flask_http_request_* metrics and the MongoDB and Redis round
+    trips of each request, adds the Server-Timing header and logs slow
+    requests, labelled with the name of the route. Requests that fall through
+    to the mounted Flask app are left to its own hooks.
+    """
+
+    def __init__(self, app, routes, flask_app):
+        self.app = app
+        self.routes = routes
+        self.logger = flask_app.logger
+        self.duration, self.total, self.exceptions = http_request_metrics()
+
+    def endpoint(self, scope):
+        """Name of the native route that serves a request, or None if Flask does."""
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.name
+        return None
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.endpoint(scope) if scope['type'] == 'http' else None
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope['method'], scope['path']
+        timings = RequestTimings(endpoint)
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        responded = False
+
+        async def send_with_timings(message):
+            nonlocal responded
+            if message['type'] == 'http.response.start':
+                responded = True
+                status = message['status']
+                self.duration.labels(method=method, path=path, status=status).observe(
+                    max(time.perf_counter() - started, 0)
+                )
+                self.total.labels(method=method, status=status).inc()
+                server_timing = instrumentation.report(timings, endpoint, method, path, self.logger)
+                if server_timing:
+                    message = {**message, 'headers': [
+                        *message.get('headers', []), (b'server-timing', server_timing.encode('latin-1'))
+                    ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timings)
+        except Exception:
+            self.exceptions.labels(method=method, status=500).inc()
+            if not responded:
+                self.duration.labels(method=method, path=path, status=500).observe(
+                    max(time.perf_counter() - started, 0)
+                )
+                self.total.labels(method=method, status=500).inc()
+            raise
+        finally:
+            current_timings.reset(token)
@@ -0,0 +1,235 @@
+import asyncio
+from collections import OrderedDict
+import json
+import math
+import os
+import random
+import threading
+import time
+from typing import Callable, List
+
+import redis
+from prometheus_client import Counter
+
+INVALIDATION_CHANNEL = 'cache:invalidate'
+
+L1_HITS = Counter('task_l1_cache_hits_total', 'Task L1 cache hits')
+L1_MISSES = Counter('task_l1_cache_misses_total', 'Task L1 cache misses')
+L1_EVICTIONS = Counter('task_l1_cache_evictions_total', 'Task L1 cache evictions', ['reason'])
+FILL_WAITS = Counter(
+    'cache_fill_waits_total', 'Cache misses that waited for another worker to fill the entry', ['outcome']
+)
+EARLY_REFRESHES = Counter('cache_early_refreshes_total', 'Cache entries recomputed before they expired')
+
+
+class LocalCache:
+    """Per-process LRU cache in front of Redis, for the task cache (Task.get_json_by_id).
+
+    Entries are bounded by count, total size and TTL. Writers call invalidate(),
+    which drops the keys locally and publishes them on INVALIDATION_CHANNEL so
+    that every other worker, on this host or another, drops them too.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 5
+        self.max_entries = 1024
+        self.max_bytes = 16 * 1024 * 1024
+        self.generation = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._redis_url = None
+        self._listener_pid = None
+
+    def init_app(self, app):
+        self.enabled = app.config['L1_CACHE_ENABLED']
+        self.ttl = app.config['L1_CACHE_TTL']
+        self.max_entries = app.config['L1_CACHE_MAX_ENTRIES']
+        self.max_bytes = app.config['L1_CACHE_MAX_BYTES']
+        self._redis_url = app.config['REDIS_URL']
+        self.clear()
+
+    def get(self, key):
+        """Return the cached value or None."""
+        if not self.enabled:
+            return None
+        self._ensure_listener()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                L1_MISSES.inc()
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                L1_EVICTIONS.labels(reason='expired').inc()
+                L1_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            L1_HITS.inc()
+            return entry[2]
+
+    def set(self, key, value, size: int, generation: int) -> None:
+        """Cache a value read from Redis or Mongo.
+
+        generation is the value of self.generation read before the lookup; if any
+        invalidation arrived since then the value may be stale and is not stored.
+        """
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                L1_EVICTIONS.labels(reason='capacity').inc()
+
+    def invalidate(self, redis_conn, *keys: str) -> None:
+        """Drop keys in this process and publish them to every other process."""
+        if not self.enabled:
+            return
+        self._drop(keys)
+        redis_conn.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.generation += 1
+
+    def _drop(self, keys) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+
+    def _remove(self, key) -> None:
+        self._size -= self._entries.pop(key)[1]
+
+    def _ensure_listener(self) -> None:
+        # Started lazily and per pid, so that it survives gunicorn forking workers
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name='l1-cache-invalidation', daemon=True).start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = redis.from_url(self._redis_url).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Invalidations may have been missed while we were not subscribed
+                self.clear()
+                for message in pubsub.listen():
+                    self._drop(json.loads(message['data']))
+            except (redis.RedisError, ValueError):
+                self.clear()
+                time.sleep(1)
+
+
+class FillLock:
+    """Single-flight recomputation of cache entries.
+
+    The first worker to miss an entry takes its lock (SET NX with a TTL of
+    CACHE_FILL_LOCK_MS) and recomputes it; the others poll the entry and the
+    lock in one round trip every CACHE_FILL_POLL_MS until it is filled. They
+    recompute it themselves if the lock is released without a fill (e.g. it
+    was rejected as stale) or expires. Entries with a known recompute time
+    are also refreshed by one worker shortly before they expire, see
+    refresh_early.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self.ttl_ms = 2000
+        self.poll_interval = 0.02
+        self.beta = 1.0
+
+    def init_app(self, app):
+        self.ttl_ms = app.config['CACHE_FILL_LOCK_MS']
+        self.poll_interval = app.config['CACHE_FILL_POLL_MS'] / 1000
+        self.beta = app.config['CACHE_EARLY_REFRESH_BETA']
+
+    @staticmethod
+    def key(cache_key: str) -> str:
+        return f'lock:{cache_key}'
+
+    def acquire(self, cache_key: str) -> bool:
+        """Take the lock of an entry about to be recomputed. False if another worker holds it."""
+        return bool(self.redis_client.client.set(self.key(cache_key), 1, nx=True, px=self.ttl_ms))
+
+    def queue_release(self, pipe, cache_key: str) -> None:
+        """Queue the release of a lock on a (sync or asyncio) pipeline, after the fill queued on it."""
+        pipe.delete(self.key(cache_key))
+
+    def wait(self, cache_key: str, queue_read: Callable) -> List:
+        """Wait for another worker to fill an entry.
+
+        queue_read queues the commands reading the entry on a pipeline; a
+        truthy first result is a hit. Returns the results of the last poll:
+        a hit, or a miss once the lock is gone or after waiting for as long
+        as it lives.
+        """
+        deadline = time.monotonic() + self.ttl_ms / 1000
+        while True:
+            time.sleep(self.poll_interval)
+            pipe = self.redis_client.client.pipeline(transaction=False)
+            queue_read(pipe)
+            pipe.exists(self.key(cache_key))
+            *results, locked = pipe.execute()
+            outcome = self._outcome(results, locked, deadline)
+            if outcome:
+                FILL_WAITS.labels(outcome=outcome).inc()
+                return results
+
+    async def acquire_async(self, client, cache_key: str) -> bool:
+        """acquire() on a redis.asyncio client, for the ASGI routes."""
+        return bool(await client.set(self.key(cache_key), 1, nx=True, px=self.ttl_ms))
+
+    async def wait_async(self, client, cache_key: str, queue_read: Callable) -> List:
+        """wait() on a redis.asyncio client, for the ASGI routes."""
+        deadline = time.monotonic() + self.ttl_ms / 1000
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            pipe = client.pipeline(transaction=False)
+            queue_read(pipe)
+            pipe.exists(self.key(cache_key))
+            *results, locked = await pipe.execute()
+            outcome = self._outcome(results, locked, deadline)
+            if outcome:
+                FILL_WAITS.labels(outcome=outcome).inc()
+                return results
+
+    @staticmethod
+    def _outcome(results: List, locked: int, deadline: float):
+        if results[0]:
+            return 'filled'
+        if not locked:
+            return 'released'
+        if time.monotonic() >= deadline:
+            return 'timeout'
+        return None
+
+    def refresh_early(self, ttl_ms: int, delta_ms: float) -> bool:
+        """Whether to recompute an entry before it expires (XFetch).
+
+        ttl_ms is the entry's remaining PTTL and delta_ms the time it took to
+        compute. The probability grows as the expiry nears, and earlier for
+        entries that are slow to compute, so that usually a single request
+        recomputes a hot entry before it expires. CACHE_EARLY_REFRESH_BETA
+        above 1 favors earlier refreshes, 0 disables them.
+        """
+        if ttl_ms <= 0 or delta_ms <= 0:
+            return False
+        if -delta_ms * self.beta * math.log(1.0 - random.random()) < ttl_ms:
+            return False
+        EARLY_REFRESHES.inc()
+        return True
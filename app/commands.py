@@ -0,0 +1,70 @@
+import gzip
+import socket
+import sys
+import time
+import click
+
+from app.extensions import mail_queue, reminder_scheduler
+from app.models.stats import TaskStats
+from app.models.task import ImportInterrupted, Task
+
+
+def register_commands(app) -> None:
+    """Register the maintenance CLI commands."""
+
+    @app.cli.command('reconcile-stats')
+    @click.option('--interval', type=int, default=0,
+                  help='Keep running and reconcile every INTERVAL seconds.')
+    def reconcile_stats_command(interval):
+        """Rebuild the task counters in Redis from MongoDB."""
+        while True:
+            started = time.monotonic()
+            users = TaskStats.reconcile_all()
+            click.echo(f'Reconciled task stats for {users} users in {time.monotonic() - started:.2f}s')
+            if not interval:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('mail-worker')
+    @click.option('--name', default=socket.gethostname, show_default='hostname',
+                  help='Worker name; a restarted worker requeues the jobs its previous run left in flight.')
+    @click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+    def mail_worker_command(name, once):
+        """Deliver the queued emails."""
+        click.echo(f'Mail worker {name} started')
+        mail_queue.run(name, once=once)
+
+    @app.cli.command('reminder-scheduler')
+    @click.option('--once', is_flag=True, help='Exit once no reminder is due.')
+    @click.option('--rebuild', is_flag=True, help='First schedule the reminders of existing tasks.')
+    def reminder_scheduler_command(once, rebuild):
+        """Queue the due date reminder emails as they come due."""
+        if rebuild:
+            click.echo(f'Scheduled {reminder_scheduler.rebuild()} reminders')
+        click.echo('Reminder scheduler started')
+        reminder_scheduler.run(once=once)
+
+    @app.cli.command('import-tasks')
+    @click.argument('path')
+    @click.option('--user-id', help='Import every task for this user instead of the user_id of each record.')
+    @click.option('--chunk-size', type=int, default=None, help='Tasks per insert_many (TASKS_IMPORT_CHUNK_SIZE).')
+    def import_tasks_command(path, user_id, chunk_size):
+        """Import tasks from an NDJSON file (gzipped if it ends in .gz, - for stdin)."""
+        if path == '-':
+            stream = sys.stdin.buffer
+        else:
+            stream = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        interrupted = None
+        with stream:
+            try:
+                report = Task.import_ndjson(stream, user_id, chunk_size or app.config['TASKS_IMPORT_CHUNK_SIZE'])
+            except ImportInterrupted as e:
+                report, interrupted = e.report, e.__cause__
+        for error in report['errors']:
+            click.echo(f"Line {error['line']}: {error['error']}", err=True)
+        click.echo(
+            f"Imported {report['imported']} tasks, {report['failed']} failed, in {report['seconds']:.2f}s "
+            f"({report['tasks_per_second'] or 0} tasks/s)"
+        )
+        if interrupted:
+            raise click.ClickException(f'The input broke off: {interrupted}')
@@ -14,14 +14,58 @@ class Config:
 
     # MongoDB
     MONGO_URI = os.getenv('MONGODB_URI')
+    MONGO_ENSURE_INDEXES = os.getenv('MONGO_ENSURE_INDEXES', 'False').lower() == 'true'  # at startup, in every process
+    MONGO_QUERY_PLAN_CHECK = os.getenv('MONGO_QUERY_PLAN_CHECK', 'warn')  # off, warn or fail
 
     # Redis
     REDIS_URL = os.getenv('REDIS_URI')
 
+    # MongoDB/Redis round trip accounting per request
+    SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'False').lower() == 'true'
+    SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))  # log a breakdown of slower requests, 0 to disable
+
+    # Per-worker L1 cache in front of Redis for single task reads (GET /api/tasks/<task_id>)
+    L1_CACHE_ENABLED = os.getenv('L1_CACHE_ENABLED', 'False').lower() == 'true'
+    L1_CACHE_TTL = int(os.getenv('L1_CACHE_TTL', 5))
+    L1_CACHE_MAX_ENTRIES = int(os.getenv('L1_CACHE_MAX_ENTRIES', 1024))
+    L1_CACHE_MAX_BYTES = int(os.getenv('L1_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+
+    # Cache stampede protection: single-flight fills and early refreshes of the task caches
+    CACHE_FILL_LOCK_MS = int(os.getenv('CACHE_FILL_LOCK_MS', 2000))  # longest wait for another worker's fill
+    CACHE_FILL_POLL_MS = int(os.getenv('CACHE_FILL_POLL_MS', 20))
+    CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1.0))  # 0 disables early refreshes
+
+    # Encoding of the tasks in the user list cache: json, served as it is, or msgpack, about half the
+    # memory but decoded and re-encoded on every read (see benchmarks/cache_codec.py)
+    TASK_CACHE_CODEC = os.getenv('TASK_CACHE_CODEC', 'json')
+    TASK_CACHE_COMPRESS_MIN_BYTES = int(os.getenv('TASK_CACHE_COMPRESS_MIN_BYTES', 1024))  # 0 disables compression
+
+    # Task listing
+    TASKS_PAGE_SIZE = int(os.getenv('TASKS_PAGE_SIZE', 50))
+    TASKS_MAX_PAGE_SIZE = int(os.getenv('TASKS_MAX_PAGE_SIZE', 200))
+    TASKS_BATCH_LIMIT = int(os.getenv('TASKS_BATCH_LIMIT', 500))
+    TASKS_SEARCH_MAX_RESULTS = int(os.getenv('TASKS_SEARCH_MAX_RESULTS', 1000))  # deepest result a search pages to
+    TASKS_EXPORT_BATCH_SIZE = int(os.getenv('TASKS_EXPORT_BATCH_SIZE', 1000))  # documents per Mongo round trip
+    TASKS_IMPORT_CHUNK_SIZE = int(os.getenv('TASKS_IMPORT_CHUNK_SIZE', 1000))  # documents per insert_many
+
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = int(os.getenv('JWT_ACCESS_TOKEN_EXPIRES', 300))  # 5 minutes
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    PRINCIPAL_CACHE_TTL = int(os.getenv('PRINCIPAL_CACHE_TTL', 60))  # seconds
+
+    # Password hashing
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', 2))  # hashing threads per worker process
+    BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', 6))  # waiting operations before shedding with 503
+
+    # Rate limits, as "<requests>/<seconds>" token buckets
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMIT_AUTH_IP = os.getenv('RATE_LIMIT_AUTH_IP', '30/60')  # register, login and password resets per client IP
+    RATE_LIMIT_AUTH_EMAIL = os.getenv('RATE_LIMIT_AUTH_EMAIL', '5/60')  # logins and password resets per email
+    RATE_LIMIT_TASK_WRITES = os.getenv('RATE_LIMIT_TASK_WRITES', '120/60')  # task writes, batches and imports per user
+    # Reverse proxies in front of the app trusted to append the client to X-Forwarded-For, 0 to use the peer address
+    PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
 
     # Mail
     MAIL_SERVER = os.getenv('MAIL_SERVER')
@@ -29,4 +73,13 @@ class Config:
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'True').lower() == 'true'
-    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER') 
\ No newline at end of file
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER')
+    MAIL_QUEUE_BATCH_SIZE = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 50))  # messages per SMTP connection
+    MAIL_MAX_ATTEMPTS = int(os.getenv('MAIL_MAX_ATTEMPTS', 5))
+    MAIL_RETRY_BACKOFF = int(os.getenv('MAIL_RETRY_BACKOFF', 30))  # seconds before the first retry, doubled after each
+
+    # Due date reminders
+    REMINDER_LEAD_SECONDS = int(os.getenv('REMINDER_LEAD_SECONDS', 3600))  # how long before the due date
+    REMINDER_BATCH_SIZE = int(os.getenv('REMINDER_BATCH_SIZE', 100))
+    REMINDER_LEASE_SECONDS = int(os.getenv('REMINDER_LEASE_SECONDS', 60))  # before another scheduler takes over a batch
+    REMINDER_POLL_INTERVAL = float(os.getenv('REMINDER_POLL_INTERVAL', 5))
@@ -1,21 +1,108 @@
 from flask_pymongo import PyMongo
 from flask_mail import Mail
+from contextlib import contextmanager
 import redis
-from flask import current_app
+from flask import current_app, g, has_request_context
+from app.cache import FillLock, LocalCache
+from app.hashing import PasswordHasher
+from app.instrumentation import Instrumentation, instrument_redis
+from app.mail_queue import MailQueue
+from app.rate_limit import RateLimiter
+from app.reminders import ReminderScheduler
 
 class RedisClient:
+    """Redis connection with request-scoped batching.
+
+    Within a request, writes that can wait (cache fills and invalidations) are
+    queued with deferred() on one MULTI pipeline executed when the response is
+    finalized, and reads known up front are fetched together with prefetch()
+    and then served by get().
+    """
+
     def __init__(self):
         self._redis_client = None
+        self._scripts = {}
 
     def init_app(self, app):
-        self._redis_client = redis.from_url(app.config['REDIS_URL'])
+        self._redis_client = instrument_redis(redis.from_url(app.config['REDIS_URL']))
+        self._scripts = {}
+        app.after_request(self._flush_response)
+        app.teardown_request(self._flush_teardown)
 
     @property
     def client(self):
         if self._redis_client is None:
-            self._redis_client = redis.from_url(current_app.config['REDIS_URL'])
+            self._redis_client = instrument_redis(redis.from_url(current_app.config['REDIS_URL']))
         return self._redis_client
 
+    def script(self, source):
+        """Return a registered Lua script (EVALSHA, falling back to EVAL on first use)."""
+        if source not in self._scripts:
+            self._scripts[source] = self.client.register_script(source)
+        return self._scripts[source]
+
+    def prefetch(self, *keys: str) -> None:
+        """Read keys the request is about to GET in a single MGET."""
+        if not has_request_context():
+            return
+        prefetched = g.setdefault('redis_prefetched', {})
+        prefetched.update(zip(keys, self.client.mget(keys)))
+
+    def get(self, key: str):
+        """GET a key, answered from the values prefetched for this request if possible."""
+        if has_request_context():
+            prefetched = g.get('redis_prefetched')
+            if prefetched and key in prefetched:
+                return prefetched.pop(key)
+        return self.client.get(key)
+
+    @contextmanager
+    def deferred(self):
+        """Yield the pipeline of the writes that can wait for the end of the request.
+
+        Commands queued on it are sent in one MULTI when the response is
+        finalized, before it goes out, so the next request of the client sees
+        them. Writes to the same keys must be deferred too, or they would land
+        before these. Outside a request the pipeline is executed on leaving the block.
+        """
+        if not has_request_context():
+            pipe = self.client.pipeline()
+            yield pipe
+            pipe.execute()
+            return
+
+        if 'redis_deferred' not in g:
+            g.redis_deferred = self.client.pipeline()
+        # The values read earlier may be about to change
+        g.pop('redis_prefetched', None)
+        yield g.redis_deferred
+
+    def flush(self) -> None:
+        """Send the writes deferred so far in this request."""
+        pipe = g.pop('redis_deferred', None)
+        if pipe is not None and len(pipe):
+            pipe.execute()
+
+    def _flush_response(self, response):
+        self.flush()
+        return response
+
+    def _flush_teardown(self, exc):
+        g.pop('redis_prefetched', None)
+        # Only left over when the response was never finalized
+        if 'redis_deferred' in g:
+            try:
+                self.flush()
+            except redis.RedisError:
+                current_app.logger.exception('Failed to flush deferred Redis writes')
+
 mongo = PyMongo()
 redis_client = RedisClient()
-mail = Mail() 
\ No newline at end of file
+mail = Mail()
+local_cache = LocalCache()
+fill_lock = FillLock(redis_client)
+password_hasher = PasswordHasher()
+instrumentation = Instrumentation()
+mail_queue = MailQueue(redis_client, mail)
+reminder_scheduler = ReminderScheduler(redis_client, mongo, mail_queue)
+rate_limiter = RateLimiter(redis_client) 
\ No newline at end of file
@@ -0,0 +1,91 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import bcrypt
+from flask import jsonify
+from prometheus_client import Counter, Histogram
+
+BCRYPT_QUEUE_WAIT = Histogram('bcrypt_queue_wait_seconds', 'Time bcrypt operations wait for a hashing thread')
+BCRYPT_TIME = Histogram('bcrypt_hash_seconds', 'Time spent in bcrypt', ['op'])
+BCRYPT_REJECTED = Counter('bcrypt_rejected_total', 'bcrypt operations shed because the queue was full')
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small bounded thread pool.
+
+    bcrypt releases the GIL, so hashing threads don't block the threads serving
+    other requests. At most BCRYPT_WORKERS + BCRYPT_MAX_QUEUE operations may be
+    in flight per worker process; beyond that PasswordHasherBusy is raised and
+    the request is answered with a 503 straight away.
+    """
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = 2
+        self.max_pending = 8
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config['BCRYPT_ROUNDS']
+        self.workers = app.config['BCRYPT_WORKERS']
+        self.max_pending = app.config['BCRYPT_WORKERS'] + app.config['BCRYPT_MAX_QUEUE']
+        self._pid = None
+        app.register_error_handler(PasswordHasherBusy, self._busy_response)
+
+    def hash(self, password: str) -> bytes:
+        return self._run('hash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def check(self, password: str, hashed: bytes) -> bool:
+        return self._run('check', bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed: bytes) -> bool:
+        """Whether a hash was made with a different work factor than the configured one."""
+        try:
+            # $2b$<rounds>$<salt and hash>
+            return int(hashed.split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def _run(self, op, fn, *args):
+        executor = self._get_executor()
+        if not self._slots.acquire(blocking=False):
+            BCRYPT_REJECTED.inc()
+            raise PasswordHasherBusy()
+
+        queued_at = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            BCRYPT_QUEUE_WAIT.observe(started - queued_at)
+            try:
+                return fn(*args)
+            finally:
+                BCRYPT_TIME.labels(op=op).observe(time.perf_counter() - started)
+
+        try:
+            return executor.submit(timed).result()
+        finally:
+            self._slots.release()
+
+    def _get_executor(self):
+        # Created per pid, so that it survives gunicorn forking workers
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pid = os.getpid()
+        return self._executor
+
+    @staticmethod
+    def _busy_response(e):
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
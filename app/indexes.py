@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+import click
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+from app.extensions import mongo
+
+# Indexes required by the hot queries, declared per collection.
+# create_indexes is a no-op for indexes that already exist with the same spec.
+INDEXES: Dict[str, List[IndexModel]] = {
+    'tasks': [
+        # The list cache fill (Task._read_user_list) and the default created_at ordering of GET /api/tasks
+        IndexModel([('user_id', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_created_at'),
+        # GET /api/tasks?sort=due_date and due_from/due_to filters
+        IndexModel([('user_id', ASCENDING), ('due_date', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_due_date'),
+        # GET /api/tasks?sort=updated_at
+        IndexModel([('user_id', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_updated_at'),
+        # GET /api/tasks?status=..., ordered and paged by (created_at, _id)
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING), ('created_at', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_status_created_at_id'),
+        # GET /api/tasks?status=...&sort=due_date and status with due_from/due_to filters
+        IndexModel([('user_id', ASCENDING), ('status', ASCENDING), ('due_date', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_status_due_date'),
+        # GET /api/tasks/search (text mode); every text query has an equality on user_id
+        IndexModel([('user_id', ASCENDING), ('title', TEXT), ('description', TEXT)],
+                   name='user_id_text', weights={'title': 3, 'description': 1}),
+        # GET /api/tasks/search?mode=prefix and GET /api/tasks?sort=title
+        IndexModel([('user_id', ASCENDING), ('title', ASCENDING), ('_id', ASCENDING)],
+                   name='user_id_title'),
+        # Tasks due today in /api/metrics
+        IndexModel([('due_date', ASCENDING)], name='due_date'),
+    ],
+    'users': [
+        # Login, register and password reset
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+}
+
+# Indexes of earlier releases that no query uses any more, dropped by ensure_indexes
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    # Tasks by status in /api/metrics, now read from the task counters, and
+    # user_id_status_created_at_id without the _id tie-breaker of the page order
+    'tasks': ['status', 'user_id_status_created_at'],
+}
+
+
+def _canonical_queries(db) -> Dict[str, object]:
+    """Cursors for the queries that must never fall back to a collection scan or an in-memory sort."""
+    user_id = str(ObjectId())
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'tasks by user': db.tasks.find({'user_id': user_id}).sort(
+            [('created_at', ASCENDING), ('_id', ASCENDING)]),
+        'task by id and user': db.tasks.find({'_id': ObjectId(), 'user_id': user_id}).limit(1),
+        'tasks by user and update time': db.tasks.find({'user_id': user_id}).sort(
+            [('updated_at', ASCENDING), ('_id', ASCENDING)]),
+        'tasks by user and status': db.tasks.find({'user_id': user_id, 'status': 'todo'}).sort(
+            [('created_at', ASCENDING), ('_id', ASCENDING)]),
+        'tasks by user and status due in a range': db.tasks.find(
+            {'user_id': user_id, 'status': 'todo', 'due_date': {'$gte': today, '$lt': today + timedelta(days=7)}}
+        ).sort([('due_date', ASCENDING), ('_id', ASCENDING)]),
+        'task search': db.tasks.find({'user_id': user_id, '$text': {'$search': 'report'}}),
+        'task title prefix': db.tasks.find(
+            {'user_id': user_id, 'title': {'$regex': '^rep', '$options': 'i'}}).sort(
+            [('title', ASCENDING), ('_id', ASCENDING)]),
+        'tasks due today': db.tasks.find(
+            {'due_date': {'$gte': today, '$lt': today + timedelta(days=1)}}),
+        'user by email': db.users.find({'email': 'user@example.com'}).limit(1),
+    }
+
+
+def _plan_stages(plan: Dict) -> Iterator[str]:
+    """Yield every stage name in an explain() plan tree."""
+    if 'stage' in plan:
+        yield plan['stage']
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+def ensure_indexes(db=None) -> List[str]:
+    """Create the declared indexes and drop the obsolete ones. Returns the names of the indexes ensured."""
+    db = db if db is not None else mongo.db
+    names = []
+    for collection, indexes in INDEXES.items():
+        names.extend(db[collection].create_indexes(indexes))
+    for collection, obsolete in OBSOLETE_INDEXES.items():
+        existing = db[collection].index_information()
+        for name in obsolete:
+            if name in existing:
+                db[collection].drop_index(name)
+    return names
+
+
+def check_query_plans(db=None) -> List[str]:
+    """Explain the canonical queries. Returns the names of those that use a COLLSCAN or a blocking SORT."""
+    db = db if db is not None else mongo.db
+    collscans = []
+    for name, cursor in _canonical_queries(db).items():
+        winning_plan = cursor.explain()['queryPlanner']['winningPlan']
+        if {'COLLSCAN', 'SORT'} & set(_plan_stages(winning_plan)):
+            collscans.append(name)
+    return collscans
+
+
+def init_indexes(app) -> None:
+    """Register the CLI command, and ensure indexes and verify query plans at startup if MONGO_ENSURE_INDEXES.
+
+    The startup step runs in every process that creates the app (each gunicorn
+    worker and CLI command), so deployments run `flask ensure-indexes` once
+    instead and leave it off.
+    """
+
+    @app.cli.command('ensure-indexes')
+    @click.option('--check/--no-check', default=True, help='Verify the query plans after creating indexes.')
+    def ensure_indexes_command(check):
+        """Create the MongoDB indexes and verify the query plans."""
+        for name in ensure_indexes():
+            click.echo(f'Index ensured: {name}')
+        if check:
+            collscans = check_query_plans()
+            for name in collscans:
+                click.echo(f'COLLSCAN or in-memory SORT: {name}', err=True)
+            if collscans:
+                raise click.ClickException('Some queries are not covered by an index')
+            click.echo('All canonical queries use an index')
+
+    if not app.config['MONGO_ENSURE_INDEXES']:
+        return
+
+    mode = app.config['MONGO_QUERY_PLAN_CHECK']
+    with app.app_context():
+        try:
+            ensure_indexes()
+            collscans = check_query_plans() if mode != 'off' else []
+        except PyMongoError as e:
+            if mode == 'fail':
+                raise
+            app.logger.error('Could not ensure MongoDB indexes: %s', e)
+            return
+
+    if collscans:
+        message = f"Queries falling back to a COLLSCAN or an in-memory SORT: {', '.join(collscans)}"
+        if mode == 'fail':
+            raise RuntimeError(message)
+        app.logger.warning(message)
@@ -0,0 +1,238 @@
+from contextvars import ContextVar
+import functools
+import time
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, g, has_request_context, request
+from prometheus_client import REGISTRY, Histogram
+from pymongo import monitoring
+
+ROUND_TRIP_SECONDS = Histogram(
+    'db_round_trip_seconds', 'MongoDB and Redis round trip time', ['service', 'endpoint', 'command'],
+    buckets=(.0002, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+)
+ROUND_TRIPS_PER_REQUEST = Histogram(
+    'db_round_trips_per_request', 'MongoDB and Redis round trips per request', ['service', 'endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Time per request spent waiting on MongoDB and Redis', ['service', 'endpoint']
+)
+
+SERVICES = ('mongo', 'redis')
+
+
+class RequestTimings:
+    """Round trips of one request: (service, command) -> [count, seconds].
+
+    endpoint names the endpoint of requests served outside of Flask.
+    """
+
+    def __init__(self, endpoint: Optional[str] = None):
+        self.started = time.perf_counter()
+        self.endpoint = endpoint
+        self.commands: Dict[Tuple[str, str], list] = {}
+
+    def add(self, service: str, command: str, seconds: float) -> None:
+        entry = self.commands.setdefault((service, command), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def totals(self, service: str) -> Tuple[int, float]:
+        count, seconds = 0, 0.0
+        for (entry_service, _), (entry_count, entry_seconds) in self.commands.items():
+            if entry_service == service:
+                count += entry_count
+                seconds += entry_seconds
+        return count, seconds
+
+
+# Timings of the request being handled in this thread or task, if any
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('current_timings', default=None)
+
+
+def _endpoint() -> str:
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    timings = current_timings.get()
+    return timings.endpoint if timings is not None and timings.endpoint else 'none'
+
+
+def record(service: str, command: str, seconds: float) -> None:
+    ROUND_TRIP_SECONDS.labels(service=service, endpoint=_endpoint(), command=command).observe(seconds)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(service, command, seconds)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """pymongo listener timing every MongoDB command."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        record('mongo', event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        record('mongo', event.command_name, event.duration_micros / 1e6)
+
+
+def instrument_redis(client):
+    """Time every round trip of a Redis client: single commands and pipeline executions.
+
+    Wraps the instance's execute_command and the execute of the pipelines it
+    creates, so the commands queued on a pipeline count as one round trip.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    @functools.wraps(execute_command)
+    def timed_execute_command(*args, **options):
+        started = time.perf_counter()
+        try:
+            return execute_command(*args, **options)
+        finally:
+            record('redis', str(args[0]).upper(), time.perf_counter() - started)
+
+    @functools.wraps(pipeline)
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        @functools.wraps(execute)
+        def timed_execute(*execute_args, **execute_kwargs):
+            started = time.perf_counter()
+            try:
+                return execute(*execute_args, **execute_kwargs)
+            finally:
+                record('redis', 'MULTI' if pipe.transaction else 'PIPELINE', time.perf_counter() - started)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+def instrument_async_redis(client):
+    """instrument_redis for a redis.asyncio client."""
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    @functools.wraps(execute_command)
+    async def timed_execute_command(*args, **options):
+        started = time.perf_counter()
+        try:
+            return await execute_command(*args, **options)
+        finally:
+            record('redis', str(args[0]).upper(), time.perf_counter() - started)
+
+    @functools.wraps(pipeline)
+    def timed_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        @functools.wraps(execute)
+        async def timed_execute(*execute_args, **execute_kwargs):
+            started = time.perf_counter()
+            try:
+                return await execute(*execute_args, **execute_kwargs)
+            finally:
+                record('redis', 'MULTI' if pipe.is_transaction else 'PIPELINE', time.perf_counter() - started)
+
+        pipe.execute = timed_execute
+        return pipe
+
+    client.execute_command = timed_execute_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+def http_request_metrics(prefix: str = 'flask') -> Tuple:
+    """The request duration, count and exception metrics registered by prometheus_flask_exporter.
+
+    They are module state of the first PrometheusMetrics, so requests served
+    outside of Flask are looked up by name to be recorded in the same series.
+    """
+    collectors = REGISTRY._names_to_collectors
+    return (
+        collectors[f'{prefix}_http_request_duration_seconds'],
+        collectors[f'{prefix}_http_request_total'],
+        collectors[f'{prefix}_http_request_exceptions_total'],
+    )
+
+
+class Instrumentation:
+    """Per-request MongoDB and Redis round trip accounting.
+
+    Exports per-request round trip counts and time per endpoint, optionally
+    adds a Server-Timing header, and logs a breakdown of the requests slower
+    than SLOW_REQUEST_MS.
+    """
+
+    def __init__(self):
+        self.command_listener = CommandTimer()
+        self.server_timing = False
+        self.slow_request_ms = 0
+
+    def init_app(self, app):
+        self.server_timing = app.config['SERVER_TIMING_HEADER']
+        self.slow_request_ms = app.config['SLOW_REQUEST_MS']
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._reset)
+
+    def _start(self):
+        g.request_timings_token = current_timings.set(RequestTimings())
+
+    def _finish(self, response):
+        timings = current_timings.get()
+        if timings is None:
+            return response
+
+        server_timing = self.report(timings, _endpoint(), request.method, request.path, current_app.logger)
+        if server_timing:
+            response.headers['Server-Timing'] = server_timing
+        return response
+
+    def report(self, timings: RequestTimings, endpoint: str, method: str, path: str, logger) -> Optional[str]:
+        """Export the round trips of a finished request and log it if it was slow.
+
+        Returns the value of its Server-Timing header, or None if it is disabled.
+        """
+        elapsed = time.perf_counter() - timings.started
+        db_seconds = 0.0
+        for service in SERVICES:
+            count, seconds = timings.totals(service)
+            db_seconds += seconds
+            ROUND_TRIPS_PER_REQUEST.labels(service=service, endpoint=endpoint).observe(count)
+            DB_TIME_PER_REQUEST.labels(service=service, endpoint=endpoint).observe(seconds)
+
+        server_timing = None
+        if self.server_timing:
+            metrics = []
+            for service in SERVICES:
+                count, seconds = timings.totals(service)
+                metrics.append(f'{service};dur={seconds * 1000:.2f};desc="{count} round trips"')
+            metrics.append(f'app;dur={(elapsed - db_seconds) * 1000:.2f}')
+            server_timing = ', '.join(metrics)
+
+        if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+            breakdown = ', '.join(
+                f'{service} {command} x{count} {seconds * 1000:.1f}ms'
+                for (service, command), (count, seconds) in sorted(
+                    timings.commands.items(), key=lambda item: -item[1][1]
+                )
+            )
+            logger.warning(
+                'Slow request %s %s: %.1fms total, %.1fms in MongoDB/Redis (%s)',
+                method, path, elapsed * 1000, db_seconds * 1000, breakdown or 'no round trips'
+            )
+        return server_timing
+
+    def _reset(self, exc):
+        token = g.pop('request_timings_token', None)
+        if token is not None:
+            current_timings.reset(token)
@@ -0,0 +1,188 @@
+import json
+import logging
+import random
+import smtplib
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from flask_mail import Message
+from prometheus_client import Counter
+
+QUEUE_KEY = 'mail:queue'
+RETRY_KEY = 'mail:retry'  # sorted set of jobs scored by the time of their next attempt
+DEAD_KEY = 'mail:dead'
+PROCESSING_KEY = 'mail:processing:{}'  # jobs a worker has taken but not yet settled
+DEAD_LETTERS_KEPT = 1000
+
+MAIL_SENT = Counter('mail_sent_total', 'Emails delivered by the mail worker')
+MAIL_FAILED = Counter('mail_failed_total', 'Email delivery failures', ['final'])
+
+logger = logging.getLogger(__name__)
+
+# KEYS: retry set, queue
+# ARGV: now, max jobs
+PROMOTE_RETRIES_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('RPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+# KEYS: queue, processing list
+# ARGV: max jobs
+TAKE_BATCH_SCRIPT = """
+local jobs = {}
+for i = 1, tonumber(ARGV[1]) do
+    local job = redis.call('LMOVE', KEYS[1], KEYS[2], 'LEFT', 'RIGHT')
+    if not job then
+        break
+    end
+    jobs[i] = job
+end
+return jobs
+"""
+
+
+class MailQueue:
+    """Outbound mail queue in Redis, delivered by the `flask mail-worker` process.
+
+    Requests only enqueue a job: a kind and a JSON payload. The worker turns
+    each job into a Message with the builder registered for its kind, sends a
+    batch of them over one SMTP connection, and reschedules failed jobs with
+    exponential backoff. Jobs still failing after MAIL_MAX_ATTEMPTS are moved
+    to the `mail:dead` list.
+    """
+
+    def __init__(self, redis_client, mail):
+        self.redis_client = redis_client
+        self.mail = mail
+        self.batch_size = 50
+        self.max_attempts = 5
+        self.backoff = 30
+        self._builders: Dict[str, Callable[..., Optional[Message]]] = {'message': Message}
+
+    def init_app(self, app):
+        self.batch_size = app.config['MAIL_QUEUE_BATCH_SIZE']
+        self.max_attempts = app.config['MAIL_MAX_ATTEMPTS']
+        self.backoff = app.config['MAIL_RETRY_BACKOFF']
+
+    def builder(self, kind: str):
+        """Register a function building the Message of a job kind from its payload.
+
+        The function runs in the worker and may return None to drop the job.
+        """
+        def register(fn):
+            self._builders[kind] = fn
+            return fn
+        return register
+
+    def enqueue(self, kind: str, **payload) -> None:
+        """Queue a job; `message` jobs take the arguments of flask_mail.Message."""
+        self.enqueue_many(kind, [payload])
+
+    def enqueue_many(self, kind: str, payloads: List[Dict], pipe=None) -> None:
+        """Queue a job per payload with one RPUSH, on `pipe` if given."""
+        jobs = [
+            json.dumps({'id': uuid.uuid4().hex, 'kind': kind, 'payload': payload, 'attempts': 0})
+            for payload in payloads
+        ]
+        (pipe if pipe is not None else self.redis_client.client).rpush(QUEUE_KEY, *jobs)
+
+    def run(self, name: str, once: bool = False) -> None:
+        """Deliver jobs until interrupted, or until the queue is empty with once."""
+        requeued = self.requeue_in_flight(name)
+        if requeued:
+            logger.warning('Requeued %d mail jobs left in flight by a previous run', requeued)
+        while self.process_batch(name, timeout=0 if once else 1) or not once:
+            pass
+
+    def requeue_in_flight(self, name: str) -> int:
+        """Put back the jobs a previous run of this worker took but never settled."""
+        client = self.redis_client.client
+        count = 0
+        while client.lmove(PROCESSING_KEY.format(name), QUEUE_KEY, 'RIGHT', 'LEFT') is not None:
+            count += 1
+        return count
+
+    def process_batch(self, name: str, timeout: float = 0) -> int:
+        """Take up to batch_size due jobs and deliver them. Returns the number of jobs taken.
+
+        With a timeout, waits up to that many seconds for a job if the queue is empty.
+        """
+        client = self.redis_client.client
+        processing = PROCESSING_KEY.format(name)
+        self.redis_client.script(PROMOTE_RETRIES_SCRIPT)(
+            keys=[RETRY_KEY, QUEUE_KEY], args=[time.time(), self.batch_size]
+        )
+        jobs = self.redis_client.script(TAKE_BATCH_SCRIPT)(keys=[QUEUE_KEY, processing], args=[self.batch_size])
+        if not jobs and timeout:
+            job = client.blmove(QUEUE_KEY, processing, timeout, 'LEFT', 'RIGHT')
+            if job is None:
+                return 0
+            jobs = [job, *self.redis_client.script(TAKE_BATCH_SCRIPT)(
+                keys=[QUEUE_KEY, processing], args=[self.batch_size - 1]
+            )]
+        if jobs:
+            self._deliver(processing, jobs)
+        return len(jobs)
+
+    def _deliver(self, processing: str, raw_jobs: List[bytes]) -> None:
+        """Send a batch over one SMTP connection and settle every job in one pipeline."""
+        errors: Dict[bytes, str] = {}
+        broken = set()  # jobs that can't be built are not retried
+        pending = list(raw_jobs)
+        connection_error = 'Connection lost'
+        try:
+            with self.mail.connect() as connection:
+                while pending:
+                    raw_job = pending.pop(0)
+                    try:
+                        message = self._build(json.loads(raw_job))
+                        if message is not None:
+                            connection.send(message)
+                            MAIL_SENT.inc()
+                    except (smtplib.SMTPException, OSError) as e:
+                        errors[raw_job] = str(e)
+                        if isinstance(e, smtplib.SMTPServerDisconnected):
+                            break
+                    except Exception as e:
+                        logger.exception('Could not build mail job %s', raw_job)
+                        errors[raw_job] = repr(e)
+                        broken.add(raw_job)
+        except (smtplib.SMTPException, OSError) as e:
+            connection_error = str(e)
+        # Connecting failed, or the connection dropped: nothing left was sent
+        for raw_job in pending:
+            errors.setdefault(raw_job, connection_error)
+
+        pipe = self.redis_client.client.pipeline()
+        for raw_job in raw_jobs:
+            pipe.lrem(processing, 1, raw_job)
+            if raw_job in errors:
+                self._reschedule(pipe, raw_job, errors[raw_job], retry=raw_job not in broken)
+        pipe.execute()
+
+    def _build(self, job: Dict) -> Optional[Message]:
+        return self._builders[job['kind']](**job['payload'])
+
+    def _reschedule(self, pipe, raw_job: bytes, error: str, retry: bool = True) -> None:
+        try:
+            job = json.loads(raw_job)
+            job['attempts'] += 1
+        except (ValueError, TypeError, KeyError):
+            job = {'id': None, 'raw': raw_job.decode('utf-8', 'replace'), 'attempts': 1}
+            retry = False
+        job['error'] = error
+        if not retry or job['attempts'] >= self.max_attempts:
+            MAIL_FAILED.labels(final='true').inc()
+            logger.error('Giving up on mail job %s after %d attempts: %s', job['id'], job['attempts'], error)
+            pipe.lpush(DEAD_KEY, json.dumps(job))
+            pipe.ltrim(DEAD_KEY, 0, DEAD_LETTERS_KEPT - 1)
+            return
+
+        MAIL_FAILED.labels(final='false').inc()
+        delay = self.backoff * 2 ** (job['attempts'] - 1) * random.uniform(0.8, 1.2)
+        pipe.zadd(RETRY_KEY, {json.dumps(job): time.time() + delay})
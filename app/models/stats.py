@@ -0,0 +1,192 @@
+from datetime import datetime, timezone
+from heapq import merge
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.extensions import mongo, redis_client
+
+# Counters are kept for all tasks and for each user in two hashes: one with the
+# fields `total` and `status:<status>`, and one with a field per due day
+# (YYYY-MM-DD, UTC). A counters hash is only trusted once a reconciliation has
+# stamped it with RECONCILED_FIELD. The counters of a user expire once the user
+# has written no task for USER_STATS_EXPIRATION, and are reconciled again on the
+# next read.
+STATS_KEY = 'stats:tasks'
+RECONCILED_FIELD = '_reconciled_at'
+USER_STATS_EXPIRATION = 7 * 86400  # 1 week in seconds
+# Users whose counters reconcile_all stores per pipeline
+RECONCILE_BATCH_SIZE = 500
+
+# (status, due_date) of a task, or None if the task does not exist
+TaskState = Optional[Tuple[str, Optional[datetime]]]
+
+
+def due_day(due_date: datetime) -> str:
+    """Day bucket (UTC) of a due date."""
+    if due_date.tzinfo is not None:
+        due_date = due_date.astimezone(timezone.utc)
+    return due_date.strftime('%Y-%m-%d')
+
+
+class TaskStats:
+    """Task counters maintained by the Task write hooks."""
+
+    @staticmethod
+    def key(user_id: Optional[str] = None) -> str:
+        return f'{STATS_KEY}:{user_id}' if user_id else STATS_KEY
+
+    @classmethod
+    def due_key(cls, user_id: Optional[str] = None) -> str:
+        return f'{cls.key(user_id)}:due'
+
+    @classmethod
+    def record(cls, pipe, user_id: str, before: TaskState, after: TaskState) -> None:
+        """Queue the counter changes for a task going from `before` to `after` on a pipeline."""
+        cls.record_many(pipe, user_id, [(before, after)])
+
+    @classmethod
+    def record_many(cls, pipe, user_id: str, changes: Iterable[Tuple[TaskState, TaskState]]) -> None:
+        """Queue the counter changes for several (before, after) task changes, merged per counter."""
+        deltas: Dict[Tuple[bool, str], int] = {}
+        for before, after in changes:
+            for state, sign in ((before, -1), (after, 1)):
+                if state is None:
+                    continue
+                status, due_date = state
+                for field in ((False, 'total'), (False, f'status:{status}')):
+                    deltas[field] = deltas.get(field, 0) + sign
+                if due_date:
+                    field = (True, due_day(due_date))
+                    deltas[field] = deltas.get(field, 0) + sign
+
+        changed = False
+        for (is_due, field), delta in deltas.items():
+            if not delta:
+                continue
+            changed = True
+            for key in (None, user_id):
+                pipe.hincrby(cls.due_key(key) if is_due else cls.key(key), field, delta)
+        if changed:
+            pipe.expire(cls.key(user_id), USER_STATS_EXPIRATION)
+            pipe.expire(cls.due_key(user_id), USER_STATS_EXPIRATION)
+
+    @classmethod
+    def get(cls, user_id: Optional[str] = None, days: List[str] = ()) -> Dict:
+        """Read the total, the counts by status and the counts due on `days`.
+
+        Counters that were never built are reconciled from MongoDB first.
+        """
+        pipe = redis_client.client.pipeline(transaction=False)
+        cls.queue_read(pipe, user_id, days)
+        counters, *due = pipe.execute()
+        if not cls.is_reconciled(counters):
+            cls.reconcile(user_id)
+            return cls.get(user_id, days)
+        return cls.parse(counters, days, due[0] if due else [])
+
+    @classmethod
+    def queue_read(cls, pipe, user_id: Optional[str] = None, days: List[str] = ()) -> None:
+        """Queue the reads of get() on a (sync or asyncio) pipeline: HGETALL, then HMGET if there are days."""
+        pipe.hgetall(cls.key(user_id))
+        if days:
+            pipe.hmget(cls.due_key(user_id), list(days))
+
+    @staticmethod
+    def is_reconciled(counters: Dict) -> bool:
+        return RECONCILED_FIELD.encode('utf-8') in counters
+
+    @staticmethod
+    def parse(counters: Dict, days: List[str], due: List) -> Dict:
+        """Convert the raw counters hash and the HMGET of the due days into the stats dict."""
+        stats = {'total': 0, 'by_status': {}, 'due_by_day': {}}
+        for field, value in counters.items():
+            field = field.decode('utf-8')
+            if field == 'total':
+                stats['total'] = int(value)
+            elif field.startswith('status:') and int(value):
+                stats['by_status'][field[len('status:'):]] = int(value)
+        for day, value in zip(days, due):
+            stats['due_by_day'][day] = int(value or 0)
+        return stats
+
+    @classmethod
+    def reconcile(cls, user_id: Optional[str] = None) -> None:
+        """Rebuild the counters for one user, or the global counters, from MongoDB.
+
+        Writes that land between the aggregation and the replacement of the
+        hashes are lost until the next reconciliation.
+        """
+        match = {'user_id': user_id} if user_id else {}
+        _, counters, due = next(cls._aggregate(match, by_user=False), (None, {}, {}))
+        pipe = redis_client.client.pipeline()
+        cls._queue_store(pipe, user_id, counters, due)
+        pipe.execute()
+
+    @classmethod
+    def reconcile_all(cls) -> int:
+        """Rebuild the global counters and the counters of every user. Returns the number of users.
+
+        The counters are streamed from MongoDB user by user and stored
+        RECONCILE_BATCH_SIZE users per pipeline, so memory use doesn't grow
+        with the number of users.
+        """
+        cls.reconcile()
+        users = 0
+        pipe = redis_client.client.pipeline()
+        for user_id, counters, due in cls._aggregate({}):
+            if user_id is None:
+                continue
+            cls._queue_store(pipe, user_id, counters, due)
+            users += 1
+            if users % RECONCILE_BATCH_SIZE == 0:
+                pipe.execute()
+        pipe.execute()
+        return users
+
+    @staticmethod
+    def _aggregate(match: Dict, by_user: bool = True) -> Iterator[Tuple[Optional[str], Dict, Dict]]:
+        """Count tasks by status and by due day, yielding (user, counters, due) in user order.
+
+        The user is None if not by_user. Each count is a separate $group
+        pipeline whose cursor is read in batches, so no single result document
+        grows with the number of users or due days.
+        """
+        user = '$user_id' if by_user else None
+        status = mongo.db.tasks.aggregate([
+            {'$match': match},
+            {'$group': {'_id': {'user': user, 'key': '$status'}, 'count': {'$sum': 1}}},
+            {'$sort': {'_id.user': 1}}
+        ], allowDiskUse=True)
+        due = mongo.db.tasks.aggregate([
+            {'$match': {**match, 'due_date': {'$type': 'date'}}},
+            {'$group': {
+                '_id': {'user': user, 'key': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$due_date'}}},
+                'count': {'$sum': 1}
+            }},
+            {'$sort': {'_id.user': 1}}
+        ], allowDiskUse=True)
+
+        items = merge(
+            ((False, item) for item in status), ((True, item) for item in due),
+            key=lambda entry: entry[1]['_id']['user'] or ''
+        )
+        for user_id, user_items in groupby(items, key=lambda entry: entry[1]['_id']['user']):
+            counters: Dict = {}
+            user_due: Dict = {}
+            for is_due, item in user_items:
+                if is_due:
+                    user_due[item['_id']['key']] = item['count']
+                else:
+                    counters[f"status:{item['_id']['key']}"] = item['count']
+                    counters['total'] = counters.get('total', 0) + item['count']
+            yield user_id, counters, user_due
+
+    @classmethod
+    def _queue_store(cls, pipe, user_id: Optional[str], counters: Dict, due: Dict) -> None:
+        pipe.delete(cls.key(user_id), cls.due_key(user_id))
+        pipe.hset(cls.key(user_id), mapping={**counters, RECONCILED_FIELD: datetime.utcnow().isoformat()})
+        if due:
+            pipe.hset(cls.due_key(user_id), mapping=due)
+        if user_id:
+            pipe.expire(cls.key(user_id), USER_STATS_EXPIRATION)
+            pipe.expire(cls.due_key(user_id), USER_STATS_EXPIRATION)
@@ -1,13 +1,408 @@
-from datetime import datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from copy import copy
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
 import json
+import re
+import time
+import zlib
 from bson import ObjectId
-from marshmallow import Schema, fields, validate
+from bson.errors import InvalidId
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from marshmallow import EXCLUDE, Schema, ValidationError, fields, validate
+import msgpack
 
-from app.extensions import mongo, redis_client
+from app.extensions import mongo, redis_client, local_cache, fill_lock, reminder_scheduler
+from app.models.stats import TaskStats
+from app import serialization
 
 CACHE_EXPIRATION = 300  # 5 minutes in seconds
+# Task ids that do not exist are cached for a while, so that repeated 404s
+# don't reach Mongo. The entry has no owner, so unpack_task never returns it.
+NOT_FOUND_EXPIRATION = 60
+NOT_FOUND_ENTRY = b'\n'
+
+# Fields a task list can be ordered by; _id is always the tie-breaker
+SORT_FIELDS = ('created_at', 'updated_at', 'due_date', 'title')
+DATE_SORT_FIELDS = ('created_at', 'updated_at', 'due_date')
+
+# Fields of to_dict(), in the column order of exports
+EXPORT_FIELDS = ('id', 'title', 'description', 'status', 'user_id', 'due_date', 'created_at', 'updated_at', 'version')
+# Fields of a task document, the projection of exports
+DOCUMENT_FIELDS = ('title', 'description', 'status', 'user_id', 'due_date', 'created_at', 'updated_at', 'version')
+# Fields a client can change with PUT /api/tasks/<task_id>
+UPDATABLE_FIELDS = ('title', 'description', 'status', 'due_date')
+
+# Search modes: words of the title and description ranked by relevance (the
+# user_id_text index), or titles starting with the query, for autocomplete
+SEARCH_MODES = ('text', 'prefix')
+# Fields of a task in search results, besides its id
+SEARCH_FIELDS = ('title', 'status', 'due_date')
+
+# Per-line errors returned by an import; further errors are only counted
+MAX_IMPORT_ERRORS = 100
+
+# The per-user list cache is a hash `tasks:{user_id}:items` of task id -> task
+# version and encoded task (see pack_list_entry) and a sorted set
+# `tasks:{user_id}:order` of the task ids scored by creation time (microseconds
+# since the epoch; ties are ordered by id, like the ids of a created_at sort in
+# Mongo), both patched in place on every write. A patch older than the cached
+# task, from a request that flushed after a later write of the same task, is
+# skipped; deleted tasks leave a tombstone of their version in the hash. The
+# default order of GET /api/tasks is served from them; filtered and sorted pages
+# are cached in the `tasks:{user_id}:pages` hash, dropped by every write. The
+# hash's `_v` field marks the list as fully populated.
+# Older releases cached the whole list as a string at `tasks:{user_id}`
+# (LEGACY_LIST_KEY); writes still drop it, so that workers of an older release
+# running against the same Redis don't serve it stale.
+# `tasks:{user_id}:version` is bumped on every write so that a worker which read
+# Mongo before a concurrent write never stores the stale result. It is also the
+# ETag of the user's list, so a missing version is seeded from the clock rather
+# than restarting at 0 and reusing ETags handed out before it expired. The
+# `_d` field holds the time the list took to compute, for early refreshes.
+VERSION_EXPIRATION = 86400  # 1 day in seconds
+LIST_SORT = [('created_at', 1), ('_id', 1)]
+
+# KEYS: list hash, version key, pages hash, list order, legacy list key
+# ARGV: task id, encoded task (empty to remove the task), version TTL, version seed, creation time,
+# task version (of a removed task, its last version plus one)
+# Returns 0 if the cached task is already at the task version or later
+PATCH_LIST_SCRIPT = """
+redis.call('SET', KEYS[2], ARGV[4], 'NX')
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('DEL', KEYS[3], KEYS[5])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 1
+end
+local cached = redis.call('HGET', KEYS[1], ARGV[1])
+local cached_version = cached and tonumber(string.match(cached, '^%d+'))
+if cached_version and cached_version >= tonumber(ARGV[6]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[6] .. '\\n' .. ARGV[2])
+if ARGV[2] == '' then
+    redis.call('ZREM', KEYS[4], ARGV[1])
+else
+    redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: list hash, list order, version key
+# ARGV: version read before querying Mongo, TTL, compute time (ms), then id, creation time, list entry of each task
+FILL_LIST_SCRIPT = """
+local current = redis.call('GET', KEYS[3]) or '0'
+if current ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[1], '_v', ARGV[1], '_d', ARGV[3])
+for i = 4, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+    redis.call('ZADD', KEYS[2], ARGV[i + 1], ARGV[i])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# Reads a page of the list cache, in creation order from the cursor task if any
+# KEYS: list hash, list order
+# ARGV: tasks to read, descending (1 or 0), cursor creation time and id (empty for the first page)
+# Returns nil if the list is not cached, else its compute time, PTTL and size,
+# the ids and creation times of the tasks read and their list entries
+LIST_PAGE_SCRIPT = """
+local compute_ms = redis.call('HMGET', KEYS[1], '_v', '_d')
+if not compute_ms[1] then
+    return false
+end
+local descending = ARGV[2] == '1'
+local start = 0
+if ARGV[3] ~= '' then
+    if descending then
+        start = redis.call('ZCOUNT', KEYS[2], '(' .. ARGV[3], '+inf')
+    else
+        start = redis.call('ZCOUNT', KEYS[2], '-inf', '(' .. ARGV[3])
+    end
+    for _, id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], ARGV[3], ARGV[3])) do
+        if (descending and id >= ARGV[4]) or (not descending and id <= ARGV[4]) then
+            start = start + 1
+        end
+    end
+end
+local stop = start + tonumber(ARGV[1]) - 1
+local ids = redis.call(descending and 'ZREVRANGE' or 'ZRANGE', KEYS[2], start, stop, 'WITHSCORES')
+local tasks = {}
+for i = 1, #ids, 2 do
+    tasks[#tasks + 1] = redis.call('HGET', KEYS[1], ids[i])
+end
+return {compute_ms[2] or '0', redis.call('PTTL', KEYS[1]), redis.call('ZCARD', KEYS[2]), ids, tasks}
+"""
+
+# Every fill extends the TTL of the hash, so that it outlives the expiry of each
+# of its fields (see pack_page)
+# KEYS: hash to fill, version key
+# ARGV: version read before querying Mongo, TTL, field/value pairs
+FILL_HASH_SCRIPT = """
+local current = redis.call('GET', KEYS[2]) or '0'
+if current ~= ARGV[1] then
+    return 0
+end
+for i = 3, #ARGV, 2 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+def version_seed() -> int:
+    """Initial value of a list version: the clock in microseconds."""
+    return time.time_ns() // 1000
+
+
+def list_cache_key(user_id: str) -> str:
+    """Key of the hash of the user's list cache."""
+    return f'tasks:{user_id}:items'
+
+
+def list_order_key(user_id: str) -> str:
+    """Key of the sorted set ordering the user's list cache."""
+    return f'tasks:{user_id}:order'
+
+
+def legacy_list_key(user_id: str) -> str:
+    """Key of the user's list cache in older releases, a single string."""
+    return f'tasks:{user_id}'
+
+
+def pack_list_entry(version: int, data: bytes = b'') -> bytes:
+    """Entry of the list cache hash: the task version, a newline and the encoded task.
+
+    Without an encoded task, the entry is the tombstone of a deleted task.
+    """
+    return b'%d\n%s' % (version, data)
+
+
+def unpack_list_entry(entry: bytes) -> bytes:
+    """The encoded task of a list cache entry, empty for a tombstone. Raises ValueError if malformed."""
+    return entry[entry.index(b'\n') + 1:]
+
+
+def task_cache_key(task_id) -> str:
+    """Key of the cached JSON of one task. It holds no user id, so that it can be
+    read along with the principal before the user is known; pack_task records the owner."""
+    return f'task:{task_id}'
+
+
+def pack_task(user_id: str, version: int, task_json: bytes) -> bytes:
+    """Prefix the encoded task with its owner and version for the task cache."""
+    return b'%s %d\n%s' % (user_id.encode('utf-8'), version, task_json)
+
+
+def unpack_task(entry: bytes, user_id: str) -> Optional[Tuple[bytes, int]]:
+    """The encoded task and version of a task cache entry, or None if the task belongs to another user.
+
+    Entries of older releases have no version in their prefix; it is read from the task.
+    """
+    header, _, task_json = entry.partition(b'\n')
+    owner, _, version = header.partition(b' ')
+    if owner != user_id.encode('utf-8'):
+        return None
+    return task_json, int(version) if version else serialization.loads(task_json).get('version', 0)
+
+
+def list_etag(version, page_id: str) -> str:
+    """ETag of a page of a user's tasks, from the list version and the page id."""
+    return f'{int(version)}-{page_id[:16]}'
+
+
+def task_etag(version: int) -> str:
+    """ETag of a task, from its version."""
+    return str(version)
+
+
+def etag_versions(if_match) -> Optional[List[int]]:
+    """Task versions accepted by an If-Match header (werkzeug ETags), or None if it accepts any."""
+    if not if_match or if_match.star_tag:
+        return None
+    return [int(tag) for tag in if_match.as_set() if tag.isdigit()]
+
+
+def version_filter(versions: Iterable[int]) -> Dict:
+    """Match tasks at any of the given versions; tasks stored without a version are at version 0."""
+    versions = list(versions)
+    return {'$in': versions + [None] if 0 in versions else versions}
+
+
+def pack_page(body: bytes, next_cursor: Optional[str], total: int, compute_ms: float = 0.0) -> bytes:
+    """Pack the encoded tasks of a page with its cursor and total for the pages cache.
+
+    The pages of a user share one hash, so each entry records its own expiry
+    (CACHE_EXPIRATION from now, in milliseconds since the epoch) and the time
+    it took to compute, for refresh_early. The body is compressed like the
+    tasks of the user list cache (see TaskCacheCodec).
+    """
+    expires_ms = time.time_ns() // 1_000_000 + CACHE_EXPIRATION * 1000
+    return b'%d %.3f\n%d\n%s\n%s' % (
+        expires_ms, compute_ms, total, (next_cursor or '').encode('ascii'), cache_codec.compress(body)
+    )
+
+
+def unpack_page(page: bytes) -> Tuple[bytes, Optional[str], int, int, float]:
+    """Split an entry of the pages cache into (body, next cursor, total, TTL, compute time).
+
+    The TTL is the time left until the entry expires in milliseconds, 0 or
+    less once it has. Raises ValueError if malformed.
+    """
+    header, total, next_cursor, body = page.split(b'\n', 3)
+    expires_ms, compute_ms = header.split(b' ')
+    ttl_ms = int(expires_ms) - time.time_ns() // 1_000_000
+    try:
+        body = cache_codec.decompress(body)
+    except zlib.error as e:
+        raise ValueError(f'Malformed page cache value: {e}')
+    return body, next_cursor.decode('ascii') or None, int(total), ttl_ms, float(compute_ms)
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def epoch_micros(value: Optional[datetime]) -> Optional[int]:
+    """Microseconds since the epoch of a naive (UTC) or aware datetime."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_epoch_micros(value: Optional[int]) -> Optional[datetime]:
+    """Naive UTC datetime, as read from MongoDB, of epoch_micros output."""
+    return None if value is None else EPOCH + timedelta(microseconds=value)
+
+
+def stored_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    """A datetime as MongoDB stores and returns it: naive UTC, to the millisecond."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+class JsonTaskFormat:
+    """to_json() output, as the list cache held it before formats were tagged."""
+    name = 'json'
+    tag = b'{'
+
+    def encode(self, task: 'Task') -> bytes:
+        return task.to_json()
+
+    def decode(self, data: bytes, user_id: str) -> 'Task':
+        return Task.from_dict(serialization.loads(data))
+
+
+class MsgpackTaskFormat:
+    """The task's fields as a msgpack array: no field names, no user id (that of the
+    list), the id as its 12 bytes and dates as microseconds since the epoch."""
+    name = 'msgpack'
+    tag = b'\x01'
+
+    def encode(self, task: 'Task') -> bytes:
+        return self.tag + msgpack.packb([
+            ObjectId(task._id).binary, task.title, task.description, task.status,
+            epoch_micros(task.due_date), epoch_micros(task.created_at), epoch_micros(task.updated_at), task.version
+        ])
+
+    def decode(self, data: bytes, user_id: str) -> 'Task':
+        task_id, title, description, status, due_date, created_at, updated_at, version = msgpack.unpackb(data[1:])
+        return Task(
+            title=title,
+            description=description,
+            user_id=user_id,
+            status=status,
+            due_date=from_epoch_micros(due_date),
+            _id=ObjectId(task_id),
+            created_at=from_epoch_micros(created_at),
+            updated_at=from_epoch_micros(updated_at),
+            version=version
+        )
+
+
+TASK_FORMATS = {task_format.tag: task_format for task_format in (JsonTaskFormat(), MsgpackTaskFormat())}
+ZLIB_TAG = b'\x02'  # followed by another value, compressed
+
+
+class TaskCacheCodec:
+    """Encoding of the tasks in the user list cache `tasks:{user_id}:items`.
+
+    Tasks are written in the TASK_CACHE_CODEC format, compressed with zlib
+    from TASK_CACHE_COMPRESS_MIN_BYTES. JSON, the default, is served as it
+    is on a cache hit; msgpack takes about half the memory but every hit
+    decodes and re-encodes it. The first byte of a value tags its
+    format, so every worker reads every format it knows whichever one it
+    writes, and a list holding values of several formats is read as one. A
+    worker that can't read a value (one of a newer format, during a rolling
+    deploy) drops the list like any unreadable cache entry.
+    """
+
+    def __init__(self):
+        self.format = TASK_FORMATS[JsonTaskFormat.tag]
+        self.compress_min_bytes = 1024
+
+    def init_app(self, app):
+        formats = {task_format.name: task_format for task_format in TASK_FORMATS.values()}
+        self.format = formats[app.config['TASK_CACHE_CODEC']]
+        self.compress_min_bytes = app.config['TASK_CACHE_COMPRESS_MIN_BYTES']
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a value from TASK_CACHE_COMPRESS_MIN_BYTES, if that makes it smaller."""
+        if self.compress_min_bytes and len(data) >= self.compress_min_bytes:
+            compressed = ZLIB_TAG + zlib.compress(data)
+            if len(compressed) < len(data):
+                return compressed
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        """Undo compress(); values it left as they are are returned as they are. Raises zlib.error."""
+        if data[:1] == ZLIB_TAG:
+            return zlib.decompress(data[1:])
+        return data
+
+    def encode(self, task: 'Task') -> bytes:
+        return self.compress(self.format.encode(task))
+
+    def decode(self, data: bytes, user_id: str) -> 'Task':
+        """Rebuild a task of the given user's list. Raises ValueError if the value can't be read."""
+        try:
+            data = self.decompress(data)
+            task_format = TASK_FORMATS.get(data[:1])
+            if task_format is None:
+                raise ValueError(f'Unknown task cache format: {data[:1]!r}')
+            return task_format.decode(data, user_id)
+        except (zlib.error, InvalidId, TypeError, KeyError) as e:
+            raise ValueError(f'Malformed task cache value: {e}')
+
+    def to_json(self, data: bytes, user_id: str) -> bytes:
+        """The to_json() output of a task of the given user's list, as GET /api/tasks serves it.
+
+        JSON values are returned as they are, once decompressed. Raises ValueError if the value can't be read.
+        """
+        try:
+            data = self.decompress(data)
+        except zlib.error as e:
+            raise ValueError(f'Malformed task cache value: {e}')
+        if data[:1] == JsonTaskFormat.tag:
+            return data
+        return self.decode(data, user_id).to_json()
+
+
+cache_codec = TaskCacheCodec()
+
 
 class TaskStatus(str, Enum):
     """Task status enumeration."""
@@ -28,10 +423,94 @@ class TaskSchema(Schema):
     user_id = fields.Str(required=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
+    version = fields.Int(dump_only=True)
+
+def parse_iso_date(date_str: str) -> datetime:
+    """Parse ISO 8601 date string to datetime object."""
+    try:
+        # Remove the 'Z' and replace with '+00:00' for UTC
+        if date_str.endswith('Z'):
+            date_str = date_str[:-1] + '+00:00'
+        return datetime.fromisoformat(date_str)
+    except ValueError:
+        return None
+
+class IsoDateTime(fields.DateTime):
+    """DateTime field parsed with parse_iso_date, like the dates of the task routes."""
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        parsed = parse_iso_date(value) if isinstance(value, str) else None
+        if parsed is None:
+            raise self.make_error('invalid', input=value, obj_type=self.OBJ_TYPE)
+        return parsed
+
+class TaskImportSchema(TaskSchema):
+    """Task schema for imported records; fields other than the task's own are ignored."""
+    due_date = IsoDateTime(required=True)
+
+    class Meta:
+        unknown = EXCLUDE
+
+def encode_cursor(sort: str, value, task_id: ObjectId) -> str:
+    """Build an opaque keyset cursor from the sort key and _id of the last task on a page."""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, str(task_id)], separators=(',', ':'))
+    return urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple[object, ObjectId]:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if it is malformed."""
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, task_id = json.loads(raw)
+        if cursor_sort != sort:
+            raise ValueError('Cursor does not match the requested sort order')
+        if value is None and sort != 'due_date':
+            raise ValueError('Only due dates can be null')
+        if value is not None and sort in DATE_SORT_FIELDS:
+            value = datetime.fromisoformat(value)
+        return value, ObjectId(task_id)
+    except (TypeError, ValueError, InvalidId, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def _keyset_filter(field: str, value, task_id: ObjectId, descending: bool) -> Dict:
+    """Match the tasks that come after (value, task_id) in the given order.
+
+    MongoDB sorts null before any date or string, so a null sort key is handled
+    explicitly instead of relying on $gt/$lt, which never match null.
+    """
+    op = '$lt' if descending else '$gt'
+    if value is None:
+        if descending:
+            return {field: None, '_id': {op: task_id}}
+        return {'$or': [{field: {'$ne': None}}, {field: None, '_id': {op: task_id}}]}
+
+    clauses = [{field: {op: value}}, {field: value, '_id': {op: task_id}}]
+    if descending:
+        clauses.append({field: None})
+    return {'$or': clauses}
+
+
+class ImportInterrupted(Exception):
+    """Raised when the input of an import breaks off, e.g. a truncated gzip stream.
+
+    report is the import report of the records imported before it did.
+    """
+
+    def __init__(self, report: Dict):
+        super().__init__(report)
+        self.report = report
+
 
 class Task:
     """Task model for MongoDB."""
-    
+
+    __slots__ = (
+        '_id', 'title', 'description', 'status', 'user_id', 'due_date', 'created_at', 'updated_at', 'version'
+    )
+
     def __init__(
         self,
         title: str,
@@ -41,7 +520,8 @@ class Task:
         status: str = "pending",
         _id: Optional[ObjectId] = None,
         created_at: Optional[datetime] = None,
-        updated_at: Optional[datetime] = None
+        updated_at: Optional[datetime] = None,
+        version: int = 0
     ):
         self.title = title
         self.description = description
@@ -51,6 +531,8 @@ class Task:
         self._id = _id if _id else ObjectId()
         self.created_at = created_at if created_at else datetime.utcnow()
         self.updated_at = updated_at if updated_at else datetime.utcnow()
+        # Incremented by every update, for conditional updates
+        self.version = version
     
     def to_dict(self) -> Dict:
         """Convert task to dictionary."""
@@ -62,12 +544,40 @@ class Task:
             'user_id': self.user_id,
             'due_date': self.due_date.isoformat() if self.due_date else None,
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat()
+            'updated_at': self.updated_at.isoformat(),
+            'version': self.version
         }
+
+    def to_json(self) -> bytes:
+        """Encode to_dict() exactly as the API returns it, for the caches."""
+        return serialization.dumps(self.to_dict())
+
+    def stored(self) -> 'Task':
+        """A copy of the task as read back from MongoDB, so that the list cache serves the same bytes either way."""
+        task = copy(self)
+        task.due_date = stored_datetime(self.due_date)
+        task.created_at = stored_datetime(self.created_at)
+        task.updated_at = stored_datetime(self.updated_at)
+        return task
+
+    @classmethod
+    def from_dict(cls, task_data: Dict) -> 'Task':
+        """Rebuild a task from the output of to_dict (used for cached entries)."""
+        return cls(
+            title=task_data['title'],
+            description=task_data['description'],
+            user_id=task_data['user_id'],
+            status=task_data['status'],
+            due_date=datetime.fromisoformat(task_data['due_date']) if task_data['due_date'] else None,
+            _id=ObjectId(task_data['id']),
+            created_at=datetime.fromisoformat(task_data['created_at']),
+            updated_at=datetime.fromisoformat(task_data['updated_at']),
+            version=task_data.get('version', 0)
+        )
     
-    def save(self) -> None:
-        """Save task to database and update cache."""
-        task_data = {
+    def to_document(self) -> Dict:
+        """Convert task to a MongoDB document."""
+        return {
             '_id': self._id,
             'title': self.title,
             'description': self.description,
@@ -75,118 +585,714 @@ class Task:
             'user_id': self.user_id,
             'due_date': self.due_date,
             'created_at': self.created_at,
-            'updated_at': self.updated_at
+            'updated_at': self.updated_at,
+            'version': self.version
         }
-        mongo.db.tasks.insert_one(task_data)
-        
-        # Invalidate user's tasks cache
-        redis_client.client.delete(f'tasks:{self.user_id}')
 
-    @classmethod
-    def get_by_id(cls, task_id: str, user_id: str) -> Optional['Task']:
-        """Get a task by its ID and user ID with caching."""
-        cache_key = f'task:{task_id}:{user_id}'
-        cached_task = redis_client.client.get(cache_key)
+    def save(self) -> None:
+        """Save task to database and update cache."""
+        mongo.db.tasks.insert_one(self.to_document())
         
+        # Add the task to the user's cached list
+        self._sync_caches(before=None)
+
+    def _sync_caches(self, before, deleted: bool = False) -> None:
+        """Propagate a write of this task to Redis with the request's deferred writes."""
+        with redis_client.deferred() as pipe:
+            self.queue_cache_sync(pipe, before, deleted)
+
+    def queue_cache_sync(self, pipe, before, deleted: bool = False) -> None:
+        """Queue the Redis side of a write of this task on a (sync or asyncio) pipeline.
+
+        Patches the user's cached list in O(log n), unless it already holds a
+        later version of the task, and bumps its version, drops the task
+        cache and cached pages, updates the task counters from
+        `before` (the previous (status, due_date), None for a new task),
+        reschedules the due date reminder and drops the task from the L1 caches.
+        """
+        task_key = task_cache_key(self._id)
+        stored = self.stored()
+        pipe.eval(
+            PATCH_LIST_SCRIPT, 5,
+            list_cache_key(self.user_id), f'tasks:{self.user_id}:version', f'tasks:{self.user_id}:pages',
+            list_order_key(self.user_id), legacy_list_key(self.user_id),
+            str(self._id), '' if deleted else cache_codec.encode(stored), VERSION_EXPIRATION, version_seed(),
+            epoch_micros(stored.created_at), self.version + 1 if deleted else self.version
+        )
+        pipe.delete(task_key)
+        TaskStats.record(pipe, self.user_id, before, None if deleted else (self.status, self.due_date))
+        reminder_scheduler.queue_schedule(pipe, str(self._id), None if deleted else self.due_date, self.status)
+        local_cache.invalidate(pipe, task_key)
+
+    @staticmethod
+    def get_json_by_id(task_id: str, user_id: str) -> Optional[Tuple[bytes, int]]:
+        """Get the encoded task (the response body of GET /api/tasks/<id>) and its version with caching.
+
+        On a miss a single worker reads the task from Mongo while the others
+        wait for it to be cached (see FillLock). Ids that do not exist are
+        cached as NOT_FOUND_ENTRY.
+        """
+        if not ObjectId.is_valid(task_id):
+            return None
+        cache_key = task_cache_key(task_id)
+        local_task = local_cache.get(cache_key)
+        if local_task is not None:
+            return unpack_task(local_task, user_id)
+
+        generation = local_cache.generation
+        cached_task = redis_client.get(cache_key)
+        locked = False
+        if not cached_task:
+            locked = fill_lock.acquire(cache_key)
+            if not locked:
+                cached_task, = fill_lock.wait(cache_key, lambda pipe: pipe.get(cache_key))
         if cached_task:
-            try:
-                task_data = json.loads(cached_task)
-                return cls(
-                    title=task_data['title'],
-                    description=task_data['description'],
-                    user_id=task_data['user_id'],
-                    status=task_data['status'],
-                    due_date=datetime.fromisoformat(task_data['due_date']) if task_data['due_date'] else None,
-                    _id=ObjectId(task_data['id']),
-                    created_at=datetime.fromisoformat(task_data['created_at']),
-                    updated_at=datetime.fromisoformat(task_data['updated_at'])
-                )
-            except (json.JSONDecodeError, KeyError):
-                redis_client.client.delete(cache_key)
+            local_cache.set(cache_key, cached_task, len(cached_task), generation)
+            return unpack_task(cached_task, user_id)
 
         try:
-            task_data = mongo.db.tasks.find_one({
-                '_id': ObjectId(task_id),
-                'user_id': user_id
-            })
-            if not task_data:
-                return None
-                
-            task = cls(**task_data)
-            
-            # Update cache
-            redis_client.client.setex(
-                cache_key,
-                CACHE_EXPIRATION,
-                json.dumps(task.to_dict())
-            )
-            
-            return task
+            # Looked up by id alone, so that the cached task or NOT_FOUND_ENTRY
+            # holds for every user; unpack_task checks the owner
+            task_data = mongo.db.tasks.find_one({'_id': ObjectId(task_id)})
+            if task_data:
+                task = Task(**task_data)
+                entry, expiration = pack_task(task.user_id, task.version, task.to_json()), CACHE_EXPIRATION
+            else:
+                entry, expiration = NOT_FOUND_ENTRY, NOT_FOUND_EXPIRATION
         except:
+            if locked:
+                redis_client.client.delete(fill_lock.key(cache_key))
+            return None
+
+        # Update cache
+        with redis_client.deferred() as pipe:
+            pipe.setex(cache_key, expiration, entry)
+            if locked:
+                fill_lock.queue_release(pipe, cache_key)
+        local_cache.set(cache_key, entry, len(entry), generation)
+        return unpack_task(entry, user_id)
+
+    @classmethod
+    def _read_user_list(cls, user_id: str) -> Tuple[List['Task'], float]:
+        """All of a user's tasks from Mongo in the list order, and the time the read took in milliseconds."""
+        started = time.perf_counter()
+        tasks = [cls(**task_data) for task_data in mongo.db.tasks.find({'user_id': user_id}).sort(LIST_SORT)]
+        return tasks, round((time.perf_counter() - started) * 1000, 3)
+
+    @staticmethod
+    def list_fill_args(tasks: List['Task'], version, compute_ms: float) -> List:
+        """ARGV of FILL_LIST_SCRIPT for a user's full list of tasks read at `version`."""
+        args = [version or 0, CACHE_EXPIRATION, compute_ms]
+        for task in tasks:
+            args.extend([
+                str(task._id), epoch_micros(task.created_at), pack_list_entry(task.version, cache_codec.encode(task))
+            ])
+        return args
+
+    @staticmethod
+    def serves_from_list(sort: str, status: Optional[str], due_from, due_to) -> bool:
+        """Whether a page of GET /api/tasks is read from the list cache rather than the pages cache."""
+        return sort == 'created_at' and not (status or due_from or due_to)
+
+    @staticmethod
+    def list_page_args(limit: int, after: Optional[str], descending: bool) -> List:
+        """ARGV of LIST_PAGE_SCRIPT for a page of the list cache. Raises ValueError for a malformed cursor."""
+        score, last_id = '', ''
+        if after:
+            value, task_id = decode_cursor(after, 'created_at')
+            score, last_id = epoch_micros(stored_datetime(value)), str(task_id)
+        return [limit + 1, int(descending), score, last_id]
+
+    @staticmethod
+    def list_page_from_cache(
+        result: List, user_id: str, limit: int
+    ) -> Optional[Tuple[bytes, Optional[str], int, float, int]]:
+        """Build a page from the LIST_PAGE_SCRIPT result for limit + 1 tasks.
+
+        Returns the encoded tasks, the next cursor, the total number of tasks,
+        and the compute time and PTTL of the list, or None if the hash and its
+        order are out of step. Raises ValueError if a task can't be read.
+        """
+        compute_ms, ttl, total, ids, tasks = result
+        if not all(tasks):
             return None
+        body = b'[' + b','.join(
+            cache_codec.to_json(unpack_list_entry(task), user_id) for task in tasks[:limit]
+        ) + b']'
+        next_cursor = None
+        if len(tasks) > limit:
+            last_id, created_at = ids[2 * limit - 2:2 * limit]
+            next_cursor = encode_cursor(
+                'created_at', from_epoch_micros(int(float(created_at))), ObjectId(last_id.decode('ascii'))
+            )
+        return body, next_cursor, int(total), float(compute_ms), int(ttl)
 
     @classmethod
-    def get_user_tasks(cls, user_id: str) -> List['Task']:
-        """Get all tasks for a specific user with caching."""
-        # Try to get from cache first
-        cache_key = f'tasks:{user_id}'
-        cached_tasks = redis_client.client.get(cache_key)
-        
-        if cached_tasks:
+    def list_page_from_tasks(
+        cls, tasks: List['Task'], limit: int, after: Optional[str], descending: bool
+    ) -> Tuple[bytes, Optional[str], int]:
+        """The page list_page_from_cache builds, from all of the user's tasks in the list order."""
+        total = len(tasks)
+        if descending:
+            tasks = tasks[::-1]
+        if after:
+            value, last_id = decode_cursor(after, 'created_at')
+            last = (stored_datetime(value), last_id)
+            tasks = [
+                task for task in tasks
+                if ((task.created_at, task._id) < last if descending else (task.created_at, task._id) > last)
+            ]
+        tasks, next_cursor = cls.page_result(tasks[:limit + 1], limit, 'created_at')
+        return serialization.dumps([task.to_dict() for task in tasks]), next_cursor, total
+
+    @staticmethod
+    def list_version(user_id: str) -> int:
+        """Current version of a user's task list, seeding it if it has expired."""
+        version_key = f'tasks:{user_id}:version'
+        pipe = redis_client.client.pipeline(transaction=False)
+        pipe.set(version_key, version_seed(), nx=True, ex=VERSION_EXPIRATION)
+        pipe.get(version_key)
+        return int(pipe.execute()[1])
+
+    @classmethod
+    def iter_user_tasks(cls, user_id: str, batch_size: int = 1000) -> Iterator[Dict]:
+        """Yield all of a user's tasks as dicts, oldest first, straight from a MongoDB cursor.
+
+        Only one batch of documents is held in memory at a time, whatever the
+        number of tasks; the cache is bypassed.
+        """
+        cursor = mongo.db.tasks.find(
+            {'user_id': user_id}, projection=list(DOCUMENT_FIELDS), batch_size=batch_size
+        ).sort(LIST_SORT)
+        try:
+            for task_data in cursor:
+                yield cls(**task_data).to_dict()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def page_query(
+        user_id: str,
+        limit: int,
+        after: Optional[str] = None,
+        sort: str = 'created_at',
+        descending: bool = False,
+        status: Optional[str] = None,
+        due_from: Optional[datetime] = None,
+        due_to: Optional[datetime] = None
+    ) -> Tuple[Dict, Dict, List, str]:
+        """Build the queries for a page of tasks.
+
+        Returns the filter query (for the total count), the query for the page,
+        the sort specification and the id of the page in the pages cache.
+        Raises ValueError for an unknown sort field or a malformed cursor.
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f'Invalid sort field: {sort}')
+
+        query: Dict = {'user_id': user_id}
+        if status:
+            query['status'] = status
+        if due_from or due_to:
+            query['due_date'] = {}
+            if due_from:
+                query['due_date']['$gte'] = due_from
+            if due_to:
+                query['due_date']['$lt'] = due_to
+
+        page_query = query
+        if after:
+            value, last_id = decode_cursor(after, sort)
+            page_query = {'$and': [query, _keyset_filter(sort, value, last_id, descending)]}
+
+        direction = -1 if descending else 1
+        page_id = hashlib.sha1(json.dumps(
+            [limit, after, sort, descending, status,
+             due_from.isoformat() if due_from else None,
+             due_to.isoformat() if due_to else None]
+        ).encode('utf-8')).hexdigest()
+        return query, page_query, [(sort, direction), ('_id', direction)], page_id
+
+    @staticmethod
+    def page_result(tasks: List['Task'], limit: int, sort: str) -> Tuple[List['Task'], Optional[str]]:
+        """Trim the limit + 1 tasks fetched for a page and build the next cursor."""
+        if len(tasks) <= limit:
+            return tasks, None
+        tasks = tasks[:limit]
+        last = tasks[-1]
+        return tasks, encode_cursor(sort, getattr(last, sort), last._id)
+
+    @classmethod
+    def get_user_tasks_page_json(
+        cls,
+        user_id: str,
+        limit: int,
+        after: Optional[str] = None,
+        sort: str = 'created_at',
+        descending: bool = False,
+        status: Optional[str] = None,
+        due_from: Optional[datetime] = None,
+        due_to: Optional[datetime] = None,
+        version: Optional[int] = None
+    ) -> Tuple[bytes, Optional[str], int, int]:
+        """Get one page of a user's tasks using keyset pagination.
+
+        Returns the encoded list of tasks on the page (the response body of
+        GET /api/tasks), the cursor for the next page (None on the last page),
+        the total number of tasks matching the filters and the list version.
+        Pages in the default order (by created_at, unfiltered) are read from
+        the list cache, which writes patch in place. Other pages are cached
+        separately as fields of the user's `tasks:{user_id}:pages` hash,
+        which every write drops with a single DEL; a hit is served without
+        decoding it. `version` is the list version if the caller has already
+        read it with list_version; otherwise it is read in the same round
+        trip as the page.
+        Raises ValueError for an unknown sort field or a malformed cursor.
+        """
+        query, page_query, sort_spec, page_id = cls.page_query(
+            user_id, limit, after, sort, descending, status, due_from, due_to
+        )
+        if cls.serves_from_list(sort, status, due_from, due_to):
+            return cls._get_list_page_json(user_id, limit, after, descending, version)
+
+        cached_page, version, locked = cls._read_cached_page(user_id, page_id, version)
+        if cached_page:
+            return (*cached_page, version)
+
+        started = time.perf_counter()
+        cursor = mongo.db.tasks.find(page_query).sort(sort_spec).limit(limit + 1)
+        tasks, next_cursor = cls.page_result([cls(**task_data) for task_data in cursor], limit, sort)
+        total = mongo.db.tasks.count_documents(query)
+        body = serialization.dumps([task.to_dict() for task in tasks])
+        compute_ms = (time.perf_counter() - started) * 1000
+
+        cls._fill_cached_page(user_id, page_id, version, pack_page(body, next_cursor, total, compute_ms), locked)
+        return body, next_cursor, total, version
+
+    @classmethod
+    def _get_list_page_json(
+        cls, user_id: str, limit: int, after: Optional[str], descending: bool, version: Optional[int]
+    ) -> Tuple[bytes, Optional[str], int, int]:
+        """get_user_tasks_page_json for a page of the list cache.
+
+        The version is read before the page, in the same round trip. On a
+        miss a single worker reads the whole list from Mongo and caches it,
+        deferred to the end of the request, while the others wait for it.
+        """
+        cache_key = list_cache_key(user_id)
+        version_key = f'tasks:{user_id}:version'
+        keys = [cache_key, list_order_key(user_id)]
+        args = cls.list_page_args(limit, after, descending)
+        read_page = redis_client.script(LIST_PAGE_SCRIPT)
+
+        pipe = redis_client.client.pipeline(transaction=False)
+        if version is None:
+            pipe.set(version_key, version_seed(), nx=True, ex=VERSION_EXPIRATION)
+            pipe.get(version_key)
+        read_page(keys=keys, args=args, client=pipe)
+        *read_version, cached = pipe.execute()
+        if read_version:
+            version = int(read_version[1])
+
+        locked = False
+        if not cached:
+            locked = fill_lock.acquire(cache_key)
+            if not locked:
+                cached, = fill_lock.wait(cache_key, lambda pipe: read_page(keys=keys, args=args, client=pipe))
+        page = None
+        if cached:
             try:
-                tasks_data = json.loads(cached_tasks)
-                return [cls(
-                    title=task['title'],
-                    description=task['description'],
-                    user_id=task['user_id'],
-                    status=task['status'],
-                    due_date=datetime.fromisoformat(task['due_date']) if task['due_date'] else None,
-                    _id=ObjectId(task['id']),
-                    created_at=datetime.fromisoformat(task['created_at']),
-                    updated_at=datetime.fromisoformat(task['updated_at'])
-                ) for task in tasks_data]
-            except (json.JSONDecodeError, KeyError):
-                # If there's any error parsing the cache, ignore it
-                redis_client.client.delete(cache_key)
-
-        # Get from database
-        tasks_data = mongo.db.tasks.find({'user_id': user_id})
-        tasks = [cls(**task_data) for task_data in tasks_data]
-        
-        # Update cache
+                page = cls.list_page_from_cache(cached, user_id, limit)
+            except ValueError:
+                page = None
+        if page:
+            body, next_cursor, total, compute_ms, ttl = page
+            if not (fill_lock.refresh_early(ttl, compute_ms) and fill_lock.acquire(cache_key)):
+                return body, next_cursor, total, version
+            locked = True
+
+        tasks, compute_ms = cls._read_user_list(user_id)
+        with redis_client.deferred() as pipe:
+            redis_client.script(FILL_LIST_SCRIPT)(
+                keys=[*keys, version_key], args=cls.list_fill_args(tasks, version, compute_ms), client=pipe
+            )
+            if locked:
+                fill_lock.queue_release(pipe, cache_key)
+        return (*cls.list_page_from_tasks(tasks, limit, after, descending), version)
+
+    @staticmethod
+    def search_query(user_id: str, q: str, mode: str = 'text') -> Tuple[Dict, Dict, List]:
+        """Build the filter, projection and sort of a search. Raises ValueError for an unknown mode."""
+        projection = {field: 1 for field in SEARCH_FIELDS}
+        if mode == 'text':
+            projection['score'] = {'$meta': 'textScore'}
+            query = {'user_id': user_id, '$text': {'$search': q}}
+            return query, projection, [('score', {'$meta': 'textScore'}), ('_id', 1)]
+        if mode == 'prefix':
+            # Case-insensitive, so matched against the keys of user_id_title rather than bounded by them
+            query = {'user_id': user_id, 'title': {'$regex': f'^{re.escape(q)}', '$options': 'i'}}
+            return query, projection, [('title', 1), ('_id', 1)]
+        raise ValueError(f'Invalid search mode: {mode}')
+
+    @staticmethod
+    def search_id(q: str, mode: str, limit: int, offset: int) -> str:
+        """Id of a page of search results in the pages cache."""
+        return hashlib.sha1(json.dumps(['search', q, mode, limit, offset]).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def search_json(
+        cls,
+        user_id: str,
+        q: str,
+        mode: str = 'text',
+        limit: int = 50,
+        offset: int = 0,
+        max_results: int = 1000,
+        version: Optional[int] = None
+    ) -> Tuple[bytes, Optional[str], int, int]:
+        """Search a user's tasks, one page of at most `limit` results at a time.
+
+        Returns the encoded results (id and SEARCH_FIELDS of each task, best
+        match first), the cursor for the next page (None on the last page or
+        past max_results), the total number of matches and the list version.
+        Pages are cached in the user's pages hash like those of
+        get_user_tasks_page_json, so the write hooks drop them with it.
+        Raises ValueError for an unknown mode.
+        """
+        query, projection, sort_spec = cls.search_query(user_id, q, mode)
+        search_id = cls.search_id(q, mode, limit, offset)
+        cached_page, version, locked = cls._read_cached_page(user_id, search_id, version)
+        if cached_page:
+            return (*cached_page, version)
+
+        started = time.perf_counter()
+        cursor = mongo.db.tasks.find(query, projection).sort(sort_spec).skip(offset).limit(limit + 1)
+        results = [{
+            'id': str(task_data['_id']),
+            'title': task_data['title'],
+            'status': task_data['status'],
+            'due_date': task_data['due_date'].isoformat() if task_data.get('due_date') else None
+        } for task_data in cursor]
+        next_cursor = None
+        if len(results) > limit and offset + limit < max_results:
+            next_cursor = str(offset + limit)
+        total = mongo.db.tasks.count_documents(query)
+        body = serialization.dumps(results[:limit])
+        compute_ms = (time.perf_counter() - started) * 1000
+
+        cls._fill_cached_page(user_id, search_id, version, pack_page(body, next_cursor, total, compute_ms), locked)
+        return body, next_cursor, total, version
+
+    @staticmethod
+    def _read_cached_page(
+        user_id: str, page_id: str, version: Optional[int]
+    ) -> Tuple[Optional[Tuple], int, bool]:
+        """Read the list version unless given, then a page of the pages cache, in one round trip.
+
+        On a miss, takes the page's fill lock or waits for the worker holding
+        it to cache the page. A page that expired, or that refresh_early picks
+        to be recomputed, is a miss for the worker that takes its lock; the
+        others are served the page meanwhile. Returns the page's body, cursor
+        and total (None on a miss), the version and whether the lock was
+        taken, to pass on to _fill_cached_page.
+        """
+        cache_key = f'tasks:{user_id}:pages'
+        version_key = f'tasks:{user_id}:version'
+        lock_key = f'{cache_key}:{page_id}'
+        # The version is read first, so a write landing in between can only
+        # make the page newer than the version (and ETag) it is served with:
+        # a client revalidating that ETag gets the page again, never a 304 on
+        # a stale one
+        pipe = redis_client.client.pipeline(transaction=False)
+        if version is None:
+            pipe.set(version_key, version_seed(), nx=True, ex=VERSION_EXPIRATION)
+            pipe.get(version_key)
+        pipe.hget(cache_key, page_id)
+        *read_version, cached_page = pipe.execute()
+        if read_version:
+            version = int(read_version[1])
+        locked = False
+        if not cached_page:
+            locked = fill_lock.acquire(lock_key)
+            if not locked:
+                cached_page, = fill_lock.wait(lock_key, lambda pipe: pipe.hget(cache_key, page_id))
+        if not cached_page:
+            return None, version, locked
         try:
-            redis_client.client.setex(
-                cache_key,
-                CACHE_EXPIRATION,
-                json.dumps([task.to_dict() for task in tasks])
+            body, next_cursor, total, ttl, compute_ms = unpack_page(cached_page)
+        except ValueError:
+            redis_client.client.hdel(cache_key, page_id)
+            return None, version, locked
+        if (ttl <= 0 or fill_lock.refresh_early(ttl, compute_ms)) and fill_lock.acquire(lock_key):
+            return None, version, True
+        return (body, next_cursor, total), version, locked
+
+    @staticmethod
+    def _fill_cached_page(user_id: str, page_id: str, version: int, page: bytes, locked: bool) -> None:
+        """Cache a packed page read at `version`, with the request's deferred writes, and release its fill lock."""
+        with redis_client.deferred() as pipe:
+            redis_client.script(FILL_HASH_SCRIPT)(
+                keys=[f'tasks:{user_id}:pages', f'tasks:{user_id}:version'],
+                args=[version, CACHE_EXPIRATION, page_id, page],
+                client=pipe
             )
-        except:
-            # If caching fails, just ignore it
-            pass
-            
-        return tasks
-
-    def update(self, **kwargs) -> None:
-        """Update task in database and update cache."""
-        updates = {'updated_at': datetime.utcnow()}
-        for key, value in kwargs.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
-                updates[key] = value
-
-        mongo.db.tasks.update_one(
-            {'_id': self._id, 'user_id': self.user_id},
-            {'$set': updates}
+            if locked:
+                fill_lock.queue_release(pipe, f'tasks:{user_id}:pages:{page_id}')
+
+    @classmethod
+    def apply_batch(cls, user_id: str, operations: List[Tuple[int, str, object]]) -> Dict[int, Dict]:
+        """Apply a batch of validated operations for one user with a single bulk_write.
+
+        Each operation is (index, op, arg): ('create', Task), ('update', (ObjectId, fields))
+        or ('delete', ObjectId), and touches a different task. Returns the result of each
+        operation keyed by its index; updates of tasks deleted concurrently are 404s. All
+        affected caches are invalidated in one pipeline.
+        """
+        results: Dict[int, Dict] = {}
+        task_ids = [arg[0] if op == 'update' else arg for _, op, arg in operations if op != 'create']
+        existing = {}
+        if task_ids:
+            existing = {
+                task_data['_id']: task_data
+                for task_data in mongo.db.tasks.find({'_id': {'$in': task_ids}, 'user_id': user_id})
+            }
+
+        requests, request_indexes = [], []
+        stats_changes, reminders, update_ids = {}, {}, {}
+        now = datetime.utcnow()
+        for index, op, arg in operations:
+            if op == 'create':
+                requests.append(InsertOne(arg.to_document()))
+                results[index] = {'index': index, 'status': 201, 'task': arg.to_dict()}
+                stats_changes[index] = (None, (arg.status, arg.due_date))
+                reminders[index] = (str(arg._id), arg.due_date, arg.status)
+            elif op == 'update':
+                task_id, updates = arg
+                if task_id not in existing:
+                    results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+                    continue
+                updates = {**updates, 'updated_at': now}
+                requests.append(UpdateOne(
+                    {'_id': task_id, 'user_id': user_id}, {'$set': updates, '$inc': {'version': 1}}
+                ))
+                before = cls(**existing[task_id])
+                task = cls(**{**existing[task_id], **updates, 'version': before.version + 1})
+                results[index] = {'index': index, 'status': 200, 'task': task.to_dict()}
+                stats_changes[index] = ((before.status, before.due_date), (task.status, task.due_date))
+                reminders[index] = (str(task_id), task.due_date, task.status)
+                update_ids[index] = task_id
+            else:
+                if arg not in existing:
+                    results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+                    continue
+                requests.append(DeleteOne({'_id': arg, 'user_id': user_id}))
+                results[index] = {'index': index, 'status': 200, 'id': str(arg)}
+                before = cls(**existing[arg])
+                stats_changes[index] = ((before.status, before.due_date), None)
+                reminders[index] = (str(arg), None, None)
+            request_indexes.append(index)
+
+        if not requests:
+            return results
+
+        try:
+            matched = mongo.db.tasks.bulk_write(requests, ordered=False).matched_count
+        except BulkWriteError as e:
+            matched = e.details['nMatched']
+            for error in e.details['writeErrors']:
+                index = request_indexes[error['index']]
+                results[index] = {'index': index, 'status': 500, 'error': error['errmsg']}
+                stats_changes.pop(index, None)
+                reminders.pop(index, None)
+                update_ids.pop(index, None)
+
+        if matched < len(update_ids):
+            # Some tasks were deleted between the find and the bulk_write
+            updated = {
+                task_data['_id']
+                for task_data in mongo.db.tasks.find(
+                    {'_id': {'$in': list(update_ids.values())}, 'user_id': user_id}, {'_id': 1}
+                )
+            }
+            for index, task_id in update_ids.items():
+                if task_id not in updated:
+                    results[index] = {'index': index, 'status': 404, 'error': 'Task not found'}
+                    stats_changes.pop(index, None)
+                    reminders.pop(index, None)
+
+        cls.invalidate_user_caches(
+            user_id,
+            [task_id for task_id in task_ids if task_id in existing],
+            list(stats_changes.values()),
+            list(reminders.values())
         )
-        
-        # Invalidate caches
-        redis_client.client.delete(f'tasks:{self.user_id}')
-        redis_client.client.delete(f'task:{self._id}:{self.user_id}')
+        return results
 
-    def delete(self) -> None:
-        """Delete task from database and update cache."""
-        mongo.db.tasks.delete_one({'_id': self._id, 'user_id': self.user_id})
-        
-        # Invalidate caches
-        redis_client.client.delete(f'tasks:{self.user_id}')
-        redis_client.client.delete(f'task:{self._id}:{self.user_id}')
\ No newline at end of file
+    @classmethod
+    def import_ndjson(cls, lines: Iterable[bytes], user_id: Optional[str] = None, chunk_size: int = 1000) -> Dict:
+        """Import tasks from NDJSON lines with chunked, unordered insert_many calls.
+
+        Every record is validated with TaskImportSchema; user_id, if given,
+        overrides the user of every record. The task counters are updated after
+        each chunk and the caches of each affected user are invalidated once at
+        the end, so memory use depends on the chunk size, not on the input.
+        Returns the number of imported and failed records, the first
+        MAX_IMPORT_ERRORS errors by line number and the throughput.
+
+        If reading the lines fails (OSError or EOFError), the records read so
+        far are still imported and ImportInterrupted is raised with the report.
+        """
+        started = time.monotonic()
+        schema = TaskImportSchema()
+        report = {'imported': 0, 'failed': 0, 'errors': []}
+        users = set()
+        chunk: List[Tuple[int, 'Task']] = []
+
+        def add_errors(errors):
+            report['failed'] += len(errors)
+            report['errors'].extend(errors[:MAX_IMPORT_ERRORS - len(report['errors'])])
+
+        def flush():
+            inserted, errors = cls._insert_chunk(chunk)
+            report['imported'] += len(inserted)
+            add_errors(errors)
+            users.update(task.user_id for task in inserted)
+            chunk.clear()
+
+        def finish():
+            report['seconds'] = round(time.monotonic() - started, 3)
+            report['tasks_per_second'] = round(report['imported'] / report['seconds']) if report['seconds'] else None
+            return report
+
+        try:
+            for line_number, line in enumerate(lines, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = serialization.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValidationError('Each line must be a JSON object')
+                    if user_id:
+                        record['user_id'] = user_id
+                    chunk.append((line_number, cls(**schema.load(record))))
+                except ValidationError as e:
+                    add_errors([{'line': line_number, 'error': e.messages}])
+                except ValueError:
+                    add_errors([{'line': line_number, 'error': 'Invalid JSON'}])
+                if len(chunk) >= chunk_size:
+                    flush()
+            if chunk:
+                flush()
+        except (OSError, EOFError) as e:
+            if chunk:
+                flush()
+            raise ImportInterrupted(finish()) from e
+        finally:
+            # Whatever was inserted, even if the import failed part way
+            for affected_user in users:
+                cls.invalidate_user_caches(affected_user, [])
+
+        return finish()
+
+    @staticmethod
+    def _insert_chunk(chunk: List[Tuple[int, 'Task']]) -> Tuple[List['Task'], List[Dict]]:
+        """Insert a chunk of (line number, task) and count the inserted tasks. Returns (inserted, errors)."""
+        failed = {}
+        try:
+            mongo.db.tasks.insert_many([task.to_document() for _, task in chunk], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                failed[error['index']] = {'line': chunk[error['index']][0], 'error': error['errmsg']}
+        inserted = [task for index, (_, task) in enumerate(chunk) if index not in failed]
+
+        changes: Dict[str, List] = {}
+        for task in inserted:
+            changes.setdefault(task.user_id, []).append((None, (task.status, task.due_date)))
+        pipe = redis_client.client.pipeline()
+        for user_id, user_changes in changes.items():
+            TaskStats.record_many(pipe, user_id, user_changes)
+        for task in inserted:
+            reminder_scheduler.queue_schedule(pipe, str(task._id), task.due_date, task.status)
+        pipe.execute()
+        return inserted, list(failed.values())
+
+    @staticmethod
+    def invalidate_user_caches(
+        user_id: str, task_ids: List[ObjectId], stats_changes: List[Tuple] = (), reminders: List[Tuple] = ()
+    ) -> None:
+        """Drop a user's list caches and the given task caches with the request's deferred writes.
+
+        stats_changes is a list of (before, after) task states to apply to the task counters,
+        reminders a list of (task id, due date, status) to reschedule, with a None due date for
+        a deleted task.
+        """
+        task_keys = [task_cache_key(task_id) for task_id in task_ids]
+        with redis_client.deferred() as pipe:
+            pipe.set(f'tasks:{user_id}:version', version_seed(), nx=True)
+            pipe.incr(f'tasks:{user_id}:version')
+            pipe.expire(f'tasks:{user_id}:version', VERSION_EXPIRATION)
+            pipe.delete(
+                list_cache_key(user_id), list_order_key(user_id), f'tasks:{user_id}:pages', legacy_list_key(user_id),
+                *task_keys
+            )
+            TaskStats.record_many(pipe, user_id, stats_changes)
+            for task_id, due_date, status in reminders:
+                reminder_scheduler.queue_schedule(pipe, task_id, due_date, status)
+            if task_keys:
+                local_cache.invalidate(pipe, *task_keys)
+
+    @staticmethod
+    def update_query(
+        task_id: str, user_id: str, fields: Dict, versions: Optional[Iterable[int]] = None
+    ) -> Tuple[Dict, Dict]:
+        """Filter and update documents for updating a task by id in one find_one_and_update.
+
+        versions, if given, are the versions the task must be at. Fields other
+        than UPDATABLE_FIELDS are ignored. Raises InvalidId for a malformed id.
+        """
+        query = {'_id': ObjectId(task_id), 'user_id': user_id}
+        if versions is not None:
+            query['version'] = version_filter(versions)
+        updates = {key: value for key, value in fields.items() if key in UPDATABLE_FIELDS}
+        return query, {'$set': {**updates, 'updated_at': datetime.utcnow()}, '$inc': {'version': 1}}
+
+    @classmethod
+    def after_update(cls, before: Dict, update: Dict) -> 'Task':
+        """The task a document returned by find_one_and_update (ReturnDocument.BEFORE) was updated to."""
+        return cls(**{**before, **update['$set'], 'version': before.get('version', 0) + 1})
+
+    @classmethod
+    def update_by_id(
+        cls, task_id: str, user_id: str, fields: Dict, versions: Optional[Iterable[int]] = None
+    ) -> Optional['Task']:
+        """Update a task in one MongoDB round trip, without reading it first.
+
+        The previous document comes back from find_one_and_update for the task
+        counters. Returns the updated task, or None if no task of the user
+        matched (or it was not at one of `versions`).
+        """
+        try:
+            query, update = cls.update_query(task_id, user_id, fields, versions)
+        except InvalidId:
+            return None
+        before = mongo.db.tasks.find_one_and_update(query, update, return_document=ReturnDocument.BEFORE)
+        if not before:
+            return None
+
+        task = cls.after_update(before, update)
+        task._sync_caches((before['status'], before.get('due_date')))
+        return task
+
+    @classmethod
+    def delete_by_id(cls, task_id: str, user_id: str) -> Optional['Task']:
+        """Delete a task in one MongoDB round trip. Returns the deleted task, or None if there was none."""
+        try:
+            task_data = mongo.db.tasks.find_one_and_delete({'_id': ObjectId(task_id), 'user_id': user_id})
+        except InvalidId:
+            return None
+        if not task_data:
+            return None
+
+        task = cls(**task_data)
+        task._sync_caches((task.status, task.due_date), deleted=True)
+        return task
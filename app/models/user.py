@@ -1,9 +1,8 @@
 from datetime import datetime
-import bcrypt
 from bson import ObjectId
 from typing import Optional, Dict
 from flask import current_app
-from app.extensions import mongo
+from app.extensions import mongo, password_hasher
 
 class User:
     def __init__(self, email: str, password: str, name: Optional[str] = None, _id: Optional[ObjectId] = None, 
@@ -18,11 +17,16 @@ class User:
 
     @staticmethod
     def _hash_password(password: str) -> bytes:
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt)
+        return password_hasher.hash(password)
 
     def check_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password)
+        return password_hasher.check(password, self.password)
+
+    def rehash_password_if_needed(self, password: str) -> None:
+        """Re-hash a verified password if it was hashed with a different work factor."""
+        if password_hasher.needs_rehash(self.password):
+            self.password = self._hash_password(password)
+            mongo.db.users.update_one({'_id': self._id}, {'$set': {'password': self.password}})
 
     def to_dict(self) -> Dict:
         return {
@@ -34,6 +38,19 @@ class User:
             'whitelisted': self.whitelisted
         }
 
+    @classmethod
+    def from_principal(cls, principal: Dict) -> 'User':
+        """Rebuild a user from cached to_dict output. The password hash is not available."""
+        return cls(
+            email=principal['email'],
+            password=None,
+            name=principal['name'],
+            _id=ObjectId(principal['id']),
+            created_at=datetime.fromisoformat(principal['created_at']),
+            role=principal['role'],
+            whitelisted=principal['whitelisted']
+        )
+
     @classmethod
     def get_by_email(cls, email: str) -> Optional['User']:
         user_data = mongo.db.users.find_one({'email': email})
@@ -43,8 +60,8 @@ class User:
         user_data['_id'] = user_data.get('_id')
         return cls(**user_data)
 
-    def save(self) -> 'User':
-        user_data = {
+    def to_document(self) -> Dict:
+        return {
             '_id': self._id,
             'email': self.email,
             'password': self.password,
@@ -53,16 +70,21 @@ class User:
             'role': self.role,
             'whitelisted': self.whitelisted
         }
-        mongo.db.users.insert_one(user_data)
+
+    def save(self) -> 'User':
+        mongo.db.users.insert_one(self.to_document())
         return self
 
     @staticmethod
-    def update_password(email: str, new_password: str) -> None:
+    def update_password(email: str, new_password: str) -> Optional[ObjectId]:
+        """Set a new password. Returns the id of the updated user, or None if there is none."""
         hashed_password = User._hash_password(new_password)
-        mongo.db.users.update_one(
+        user_data = mongo.db.users.find_one_and_update(
             {'email': email},
-            {'$set': {'password': hashed_password}}
-        ) 
+            {'$set': {'password': hashed_password}},
+            projection={'_id': 1}
+        )
+        return user_data['_id'] if user_data else None
 
     @staticmethod
     def update_user(user_id: ObjectId, update_data: Dict) -> bool:
@@ -0,0 +1,186 @@
+from functools import wraps
+import hashlib
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from flask import g, jsonify, request
+from prometheus_client import Counter
+import redis
+
+RATE_LIMITED = Counter('rate_limit_rejections_total', 'Requests rejected by a rate limit', ['limit'])
+
+logger = logging.getLogger(__name__)
+
+# Takes a token from every bucket, or from none if one of them is empty.
+# A bucket is a hash of its token count and the time it was last updated; a
+# missing bucket is full, and an untouched bucket expires once it would be.
+# KEYS: buckets
+# ARGV: now, then the capacity and refill rate (tokens per second) of each bucket
+# Returns 0, or the 1-based index of the bucket that is the longest to refill
+# and the seconds until it holds a token again
+RATE_LIMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local rejected, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    tokens = math.min(capacity, tokens + elapsed * rate)
+    if tokens < 1 and (1 - tokens) / rate > wait then
+        rejected, wait = i, (1 - tokens) / rate
+    end
+    levels[i] = tokens
+end
+if rejected > 0 then
+    return {rejected, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', ARGV[1])
+    redis.call('EXPIRE', key, math.ceil(capacity / rate))
+end
+return 0
+"""
+
+
+def parse_limit(value: str) -> Tuple[int, float]:
+    """Parse a "<requests>/<seconds>" limit into a bucket capacity and refill rate per second."""
+    requests, _, seconds = value.partition('/')
+    capacity, period = int(requests), float(seconds or 1)
+    if capacity < 1 or period <= 0:
+        raise ValueError(f'Invalid rate limit: {value!r}')
+    return capacity, capacity / period
+
+
+def digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def client_ip() -> Optional[str]:
+    """The address of the client; taken from X-Forwarded-For by ProxyFix when PROXY_FIX_X_FOR is set."""
+    return request.remote_addr
+
+
+def forwarded_client_ip(remote_addr: Optional[str], forwarded_for: Optional[str], trusted_hops: int) -> Optional[str]:
+    """The client address ProxyFix(x_for=trusted_hops) would set, for requests served outside of Flask.
+
+    The client is the address the outermost trusted proxy appended, trusted_hops
+    from the end of X-Forwarded-For; without enough entries, the peer address.
+    """
+    if trusted_hops and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(',')]
+        if len(addresses) >= trusted_hops:
+            return addresses[-trusted_hops]
+    return remote_addr
+
+
+def email_identity(data) -> Optional[str]:
+    """The email of a decoded JSON body, so that attempts on one account are limited across clients."""
+    email = data.get('email') if isinstance(data, dict) else None
+    return digest(email.strip().lower()) if isinstance(email, str) else None
+
+
+def request_email() -> Optional[str]:
+    return email_identity(request.get_json(silent=True))
+
+
+def current_user_id() -> Optional[str]:
+    """The user authenticated by login_required, which must come first."""
+    return g.get('user_id')
+
+
+class RateLimiter:
+    """Token bucket rate limits in Redis, shared by all the workers.
+
+    Each limit is a RATE_LIMIT_<NAME> setting of "<requests>/<seconds>": a
+    bucket per client identity holding up to <requests> tokens, refilled over
+    <seconds>. A request takes one token from each of its buckets, checked
+    and taken in a single script call, and is answered 429 with Retry-After
+    if one of them is empty. Checks fail open when Redis is unavailable.
+    """
+
+    def __init__(self, redis_client, clock: Callable[[], float] = time.time):
+        self.redis_client = redis_client
+        self.clock = clock
+        self.enabled = True
+        self.limits: Dict[str, Tuple[int, float]] = {}
+
+    def init_app(self, app):
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = {
+            name[len('RATE_LIMIT_'):].lower(): parse_limit(value)
+            for name, value in app.config.items()
+            if name.startswith('RATE_LIMIT_') and name != 'RATE_LIMIT_ENABLED'
+        }
+
+    def script_args(self, identities: Dict[str, str]) -> Tuple[List[str], List]:
+        """Keys and arguments of RATE_LIMIT_SCRIPT for limit name -> client identity."""
+        keys, args = [], [self.clock()]
+        for name, identity in identities.items():
+            capacity, rate = self.limits[name]
+            keys.append(f'ratelimit:{name}:{identity}')
+            args.extend([capacity, rate])
+        return keys, args
+
+    def retry_after(self, names: List[str], result) -> Optional[int]:
+        """Seconds a rejected request should wait, from the script result, or None if it was allowed."""
+        if not result:
+            return None
+        index, wait = result
+        RATE_LIMITED.labels(limit=names[int(index) - 1]).inc()
+        return max(1, math.ceil(float(wait)))
+
+    def check(self, identities: Dict[str, Optional[str]]) -> Optional[int]:
+        """Take a token from each bucket. Returns the seconds to wait if one is empty, else None.
+
+        Limits whose identity is None (e.g. no email in the body) are not checked.
+        """
+        identities = {name: identity for name, identity in identities.items() if identity is not None}
+        if not self.enabled or not identities:
+            return None
+        keys, args = self.script_args(identities)
+        try:
+            result = self.redis_client.script(RATE_LIMIT_SCRIPT)(keys=keys, args=args)
+        except redis.RedisError:
+            logger.exception('Rate limit check failed, letting the request through')
+            return None
+        return self.retry_after(list(identities), result)
+
+    async def check_async(self, client, identities: Dict[str, Optional[str]]) -> Optional[int]:
+        """check() on a redis.asyncio client, for the ASGI routes."""
+        identities = {name: identity for name, identity in identities.items() if identity is not None}
+        if not self.enabled or not identities:
+            return None
+        keys, args = self.script_args(identities)
+        try:
+            result = await client.eval(RATE_LIMIT_SCRIPT, len(keys), *keys, *args)
+        except redis.RedisError:
+            logger.exception('Rate limit check failed, letting the request through')
+            return None
+        return self.retry_after(list(identities), result)
+
+    def limit(self, **identity_functions: Callable[[], Optional[str]]):
+        """Rate limit a route: limit name -> function returning the client identity it is counted by.
+
+            @rate_limiter.limit(auth_ip=client_ip, auth_email=request_email)
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                retry_after = self.check({name: identity() for name, identity in identity_functions.items()})
+                if retry_after is not None:
+                    return too_many_requests(retry_after)
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+
+
+def too_many_requests(retry_after: int):
+    response = jsonify({'error': 'Too many requests'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
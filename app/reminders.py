@@ -0,0 +1,179 @@
+from datetime import datetime, timezone
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from prometheus_client import Counter
+
+DUE_KEY = 'reminders:due'  # sorted set of task ids scored by the time their reminder is due
+LEASED_KEY = 'reminders:leased'  # task ids claimed by a scheduler, scored by the expiry of the claim
+
+REMINDERS_SENT = Counter('task_reminders_total', 'Task reminders queued for delivery')
+
+# Claims up to ARGV[3] due reminders until ARGV[2], first putting back those
+# whose claim expired before ARGV[1] (a scheduler died with them). A put back
+# reminder does not replace one scheduled since by a task write.
+# KEYS: due set, leased set
+# ARGV: now, claim expiry, max reminders
+CLAIM_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, task_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], task_id)
+    redis.call('ZADD', KEYS[1], 'NX', ARGV[1], task_id)
+end
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[3])
+for _, task_id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], task_id)
+    redis.call('ZADD', KEYS[2], ARGV[2], task_id)
+end
+return due
+"""
+
+# Releases claimed reminders, unless another scheduler claimed them since
+# KEYS: leased set
+# ARGV: claim expiry, task ids
+RELEASE_SCRIPT = """
+for i = 2, #ARGV do
+    if tonumber(redis.call('ZSCORE', KEYS[1], ARGV[i])) == tonumber(ARGV[1]) then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+    end
+end
+return 1
+"""
+
+
+def timestamp(value: datetime) -> float:
+    """POSIX timestamp of a datetime, naive ones (as stored by MongoDB) being UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ReminderScheduler:
+    """Due date reminders, sent by the `flask reminder-scheduler` process.
+
+    Task writes keep the `reminders:due` sorted set up to date, so the
+    scheduler only reads the entries that are due, never the tasks
+    collection. Several schedulers can run side by side: each claims a batch
+    of due reminders for REMINDER_LEASE_SECONDS, queues one email per user
+    through the mail queue and releases the batch. Reminders claimed by a
+    scheduler that died are claimed again once the lease expires.
+    """
+
+    def __init__(self, redis_client, mongo, mail_queue, clock: Callable[[], float] = time.time):
+        self.redis_client = redis_client
+        self.mongo = mongo
+        self.mail_queue = mail_queue
+        self.clock = clock
+        self.lead_seconds = 3600
+        self.batch_size = 100
+        self.lease_seconds = 60
+        self.poll_interval = 5
+
+    def init_app(self, app):
+        self.lead_seconds = app.config['REMINDER_LEAD_SECONDS']
+        self.batch_size = app.config['REMINDER_BATCH_SIZE']
+        self.lease_seconds = app.config['REMINDER_LEASE_SECONDS']
+        self.poll_interval = app.config['REMINDER_POLL_INTERVAL']
+
+    def reminder_time(self, due_date: datetime) -> float:
+        return timestamp(due_date) - self.lead_seconds
+
+    def queue_schedule(self, pipe, task_id: str, due_date: Optional[datetime], status: Optional[str]) -> None:
+        """Queue the (re)scheduling of a task's reminder on a (sync or asyncio) pipeline.
+
+        Pass a None due_date for a deleted task. Tasks that are done, or whose
+        reminder time has passed, are not reminded.
+        """
+        if due_date is not None and status != 'done':
+            remind_at = self.reminder_time(due_date)
+            if remind_at > self.clock():
+                pipe.zadd(DUE_KEY, {task_id: remind_at})
+                return
+        pipe.zrem(DUE_KEY, task_id)
+
+    def run(self, once: bool = False) -> None:
+        """Send reminders as they come due until interrupted, or until none are due with once."""
+        while True:
+            claimed = self.process_batch()
+            if claimed < self.batch_size:
+                if once:
+                    return
+                time.sleep(self.poll_interval)
+
+    def claim(self) -> Tuple[List[str], float]:
+        """Claim up to batch_size due reminders. Returns their task ids and the expiry of the claim."""
+        now = self.clock()
+        task_ids = self.redis_client.script(CLAIM_SCRIPT)(
+            keys=[DUE_KEY, LEASED_KEY], args=[now, now + self.lease_seconds, self.batch_size]
+        )
+        return [task_id.decode('utf-8') for task_id in task_ids], now + self.lease_seconds
+
+    def process_batch(self) -> int:
+        """Claim a batch of due reminders and queue their emails. Returns the number of reminders claimed."""
+        task_ids, lease_expiry = self.claim()
+        if not task_ids:
+            return 0
+
+        payloads, reminded = self.reminder_messages(task_ids)
+        # The emails are queued and the claim released atomically
+        pipe = self.redis_client.client.pipeline()
+        if payloads:
+            self.mail_queue.enqueue_many('message', payloads, pipe=pipe)
+        self.redis_client.script(RELEASE_SCRIPT)(keys=[LEASED_KEY], args=[lease_expiry, *task_ids], client=pipe)
+        pipe.execute()
+        REMINDERS_SENT.inc(reminded)
+        return len(task_ids)
+
+    def reminder_messages(self, task_ids: Iterable[str]) -> Tuple[List[Dict], int]:
+        """Build one message job per user for the claimed tasks that are still due for a reminder.
+
+        A task may have been completed, deleted or moved to a later due date
+        since it was claimed; those are skipped. Returns the jobs' payloads and
+        the number of tasks they remind of.
+        """
+        now = self.clock()
+        tasks_by_user: Dict[str, List[Dict]] = {}
+        for task in self.mongo.db.tasks.find(
+            {'_id': {'$in': [ObjectId(task_id) for task_id in task_ids if ObjectId.is_valid(task_id)]}},
+            projection=['title', 'status', 'due_date', 'user_id']
+        ):
+            due_date = task.get('due_date')
+            if due_date is None or task['status'] == 'done' or self.reminder_time(due_date) > now:
+                continue
+            tasks_by_user.setdefault(task['user_id'], []).append(task)
+
+        user_ids = [ObjectId(user_id) for user_id in tasks_by_user if ObjectId.is_valid(user_id)]
+        payloads, reminded = [], 0
+        for user in self.mongo.db.users.find({'_id': {'$in': user_ids}}, projection=['email', 'name']):
+            tasks = sorted(tasks_by_user[str(user['_id'])], key=lambda task: task['due_date'])
+            lines = [f"- {task['title']} (due {task['due_date'].strftime('%Y-%m-%d %H:%M')} UTC)" for task in tasks]
+            payloads.append({
+                'subject': 'Task due soon' if len(tasks) == 1 else f'{len(tasks)} tasks due soon',
+                'recipients': [user['email']],
+                'body': f"Hello {user.get('name') or user['email']},\n\n"
+                        'These tasks are due soon:\n' + '\n'.join(lines) + '\n',
+            })
+            reminded += len(tasks)
+        return payloads, reminded
+
+    def rebuild(self, chunk_size: int = 1000) -> int:
+        """Schedule the reminders of every task with an upcoming due date. Returns the number scheduled.
+
+        Only needed for tasks written before the scheduler existed; reads the
+        tasks through the due_date index.
+        """
+        cutoff = datetime.fromtimestamp(self.clock() + self.lead_seconds, timezone.utc).replace(tzinfo=None)
+        cursor = self.mongo.db.tasks.find(
+            {'due_date': {'$gt': cutoff}, 'status': {'$ne': 'done'}},
+            projection=['due_date', 'status'], batch_size=chunk_size
+        )
+        count = 0
+        pipe = self.redis_client.client.pipeline(transaction=False)
+        for task in cursor:
+            self.queue_schedule(pipe, str(task['_id']), task['due_date'], task['status'])
+            count += 1
+            if count % chunk_size == 0:
+                pipe.execute()
+        pipe.execute()
+        return count
@@ -1,67 +1,239 @@
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import jwt
 from app.models.user import User
-from app.extensions import redis_client, mail
+from app.extensions import redis_client, mail_queue, rate_limiter
+from app.rate_limit import client_ip, request_email
 from flask_mail import Message
+import hashlib
+import secrets
 import uuid
 from functools import wraps
 from bson import ObjectId
 import json
+from typing import List, Tuple
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
-def generate_token(user: User) -> str:
-    payload = {
+SESSION_EXPIRATION = 86400  # 1 day in seconds
+
+# Sorted set of the jtis of live sessions scored by their expiry timestamp, so
+# active sessions can be counted without scanning the session:* keys
+ACTIVE_SESSIONS_KEY = 'sessions:active'
+
+# Caches a resolved principal unless its session ended while it was being
+# resolved, so a fill racing revoke_user_sessions can't restore a stale user
+# KEYS: principal, user principals, session[, legacy sessions revoked marker]
+# ARGV: principal TTL, principal, user principals TTL
+PRINCIPAL_FILL_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 0 or (KEYS[4] and redis.call('EXISTS', KEYS[4]) == 1) then
+    return 0
+end
+redis.call('SETEX', KEYS[1], ARGV[1], ARGV[2])
+redis.call('SADD', KEYS[2], KEYS[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def principal_cache_key(token: str) -> str:
+    return f"principal:{token_digest(token)}"
+
+def session_key(jti: str) -> str:
+    return f"session:{jti}"
+
+def legacy_sessions_revoked_key(user_id) -> str:
+    return f"token:revoked:{user_id}"
+
+def token_session(token: str, claims: dict) -> Tuple[List[str], str]:
+    """The keys of a token's session and its member in the active sessions.
+
+    The session is live while the first key exists and the others don't.
+    Tokens issued before sessions were keyed by jti have no jti claim: their
+    session is still the whole token under token:{jwt}, tracked in the active
+    sessions by the token itself. They are not indexed per user, so
+    revoke_user_sessions ends them with a per-user marker instead. They stay
+    valid until they expire, at most SESSION_EXPIRATION after the deploy that
+    introduced jti sessions, after which this fallback can go.
+    """
+    if 'jti' in claims:
+        return [session_key(claims['jti'])], claims['jti']
+    return [f"token:{token}", legacy_sessions_revoked_key(claims['sub'])], token
+
+def user_sessions_key(user_id) -> str:
+    """Sorted set of the jtis of a user's sessions scored by their expiry timestamp."""
+    return f"sessions:user:{user_id}"
+
+def session_claims(user: User) -> dict:
+    """The claims of a new token for a user, with the jti of its session."""
+    return {
         'sub': str(user._id),
         'email': user.email,
         'name': user.name,
         'role': user.role,
         'whitelisted': user.whitelisted,
-        'exp': datetime.utcnow() + timedelta(days=1)
+        'jti': secrets.token_urlsafe(12),
+        'exp': datetime.utcnow() + timedelta(seconds=SESSION_EXPIRATION)
     }
-    token = jwt.encode(payload, current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
-    
-    # Store token in Redis whitelist
-    redis_client.client.setex(
-        f"token:{token}",
-        86400,  # 1 day in seconds
-        json.dumps({
-            'user_id': str(user._id),
-            'email': user.email,
-            'role': user.role
-        })
-    )
+
+def queue_session(pipe, claims: dict) -> None:
+    """Queue the creation of the session of a token on a (sync or asyncio) pipeline.
+
+    The session only holds the user id (12 bytes): the claims are in the token.
+    It is tracked as an active session and as one of the user's sessions.
+    """
+    expiry = claims['exp'].replace(tzinfo=timezone.utc).timestamp()
+    user_sessions = user_sessions_key(claims['sub'])
+    pipe.setex(session_key(claims['jti']), SESSION_EXPIRATION, ObjectId(claims['sub']).binary)
+    pipe.zadd(ACTIVE_SESSIONS_KEY, {claims['jti']: expiry})
+    pipe.zremrangebyscore(user_sessions, '-inf', datetime.now(timezone.utc).timestamp())
+    pipe.zadd(user_sessions, {claims['jti']: expiry})
+    pipe.expire(user_sessions, SESSION_EXPIRATION)
+
+def encode_token(claims: dict, secret_key: str = None) -> str:
+    return jwt.encode(claims, secret_key or current_app.config['JWT_SECRET_KEY'], algorithm='HS256')
+
+def generate_token(user: User) -> str:
+    claims = session_claims(user)
+    token = encode_token(claims)
+    pipe = redis_client.client.pipeline()
+    queue_session(pipe, claims)
+    pipe.execute()
     return token
 
+def decode_token(token: str, verify_exp: bool = True, secret_key: str = None):
+    """Verify a token's signature (and expiry) and return its claims. Raises jwt.InvalidTokenError.
+
+    The jti claim is not required, for the legacy tokens token_session accepts.
+    """
+    return jwt.decode(
+        token, secret_key or current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'],
+        options={'verify_exp': verify_exp, 'require': ['sub']}
+    )
+
+def queue_revoke_token(pipe, token: str, secret_key: str = None) -> None:
+    """Queue the end of a token's session on a (sync or asyncio) pipeline.
+
+    The cached principal is dropped even if the token can't be decoded.
+    """
+    pipe.delete(principal_cache_key(token))
+    try:
+        claims = decode_token(token, verify_exp=False, secret_key=secret_key)
+    except jwt.InvalidTokenError:
+        return
+    keys, member = token_session(token, claims)
+    pipe.delete(keys[0])
+    pipe.zrem(ACTIVE_SESSIONS_KEY, member)
+    pipe.zrem(user_sessions_key(claims['sub']), member)
+
+def revoke_token(token: str) -> None:
+    """End the session of a token: remove it from the live sessions and drop its cached principal."""
+    pipe = redis_client.client.pipeline()
+    queue_revoke_token(pipe, token)
+    pipe.execute()
+
+def revoke_user_sessions(user_id) -> int:
+    """Log a user out everywhere, e.g. after their password or permissions changed.
+
+    Reads the user's sessions and cached principals, then ends the sessions
+    and drops the principals in one MULTI. A principal cached between the two
+    round trips is dropped in a third; none can be cached after the MULTI, as
+    resolve_principal only caches principals of live sessions. Sessions
+    started meanwhile are kept. Legacy token:{jwt} sessions, which aren't
+    indexed per user, are ended by the marker token_session checks. Returns
+    the number of sessions ended.
+    """
+    user_sessions, principals_key = user_sessions_key(user_id), f"principals:{user_id}"
+    pipe = redis_client.client.pipeline(transaction=False)
+    pipe.zrange(user_sessions, 0, -1)
+    pipe.smembers(principals_key)
+    jtis, principals = pipe.execute()
+
+    pipe = redis_client.client.pipeline()
+    if jtis:
+        pipe.delete(*[session_key(jti.decode('utf-8')) for jti in jtis])
+        pipe.zrem(ACTIVE_SESSIONS_KEY, *jtis)
+        pipe.zrem(user_sessions, *jtis)
+    if principals:
+        pipe.delete(*principals)
+    pipe.setex(legacy_sessions_revoked_key(user_id), SESSION_EXPIRATION, 1)
+    pipe.smembers(principals_key)
+    pipe.delete(principals_key)
+    late_principals = pipe.execute()[-2] - principals
+    if late_principals:
+        redis_client.client.delete(*late_principals)
+    return len(jtis)
+
+def queue_count_active_sessions(pipe) -> None:
+    """Queue the pruning of expired sessions and the count of the remaining ones (the second result)."""
+    pipe.zremrangebyscore(ACTIVE_SESSIONS_KEY, '-inf', datetime.now(timezone.utc).timestamp())
+    pipe.zcard(ACTIVE_SESSIONS_KEY)
+
+def count_active_sessions() -> int:
+    """Prune expired sessions and count the remaining ones in one round trip."""
+    pipe = redis_client.client.pipeline()
+    queue_count_active_sessions(pipe)
+    return pipe.execute()[1]
+
 def verify_token(token):
     try:
-        # First check if token is in Redis whitelist
-        token_data = redis_client.client.get(f"token:{token}")
-        if not token_data:
+        # Verify the JWT signature and expiration, then check that the session is live
+        payload = decode_token(token)
+        session, *revoked = token_session(token, payload)[0]
+        if not redis_client.client.exists(session) or (revoked and redis_client.client.exists(*revoked)):
             return None
-            
-        # Then verify JWT signature and expiration
-        payload = jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
         return payload
     except jwt.ExpiredSignatureError:
-        # Clean up expired token from Redis
-        redis_client.client.delete(f"token:{token}")
+        # Clean up the expired session from Redis
+        revoke_token(token)
         return None
     except jwt.InvalidTokenError:
         return None
 
+def resolve_principal(token: str):
+    """Resolve the user behind a token, caching the verified result.
+
+    The cached principal is keyed by a digest of the token and lives for at most
+    PRINCIPAL_CACHE_TTL seconds (and never past the token expiry), so in the steady
+    state a request costs one Redis GET and no JWT decode or MongoDB lookup.
+    It is dropped on logout and by revoke_user_sessions when the user changes, and
+    only cached if the session is still live, so a revocation racing the fill wins.
+    """
+    cache_key = principal_cache_key(token)
+    cached_principal = redis_client.get(cache_key)
+    if cached_principal:
+        try:
+            return User.from_principal(json.loads(cached_principal))
+        except (json.JSONDecodeError, KeyError):
+            redis_client.client.delete(cache_key)
+
+    payload = verify_token(token)
+    if not payload:
+        return None
+    user = User.get_by_id(payload['sub'])
+    if not user:
+        return None
+
+    ttl = min(
+        current_app.config['PRINCIPAL_CACHE_TTL'],
+        int(payload['exp'] - datetime.now(timezone.utc).timestamp())
+    )
+    if ttl > 0:
+        redis_client.script(PRINCIPAL_FILL_SCRIPT)(
+            keys=[cache_key, f"principals:{user._id}", *token_session(token, payload)[0]],
+            args=[ttl, json.dumps(user.to_dict()), SESSION_EXPIRATION]
+        )
+    return user
+
 def get_current_user():
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
     
     token = auth_header.split(' ')[1]
-    payload = verify_token(token)
-    if not payload:
-        return None
-    
-    return User.get_by_id(payload['sub'])
+    return resolve_principal(token)
 
 def admin_required(f):
     @wraps(f)
@@ -75,6 +247,7 @@ def admin_required(f):
     return decorated_function
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limiter.limit(auth_ip=client_ip)
 def register():
     data = request.get_json()
     
@@ -91,12 +264,14 @@ def register():
     return jsonify({'message': 'User registered successfully'}), 201
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limiter.limit(auth_ip=client_ip, auth_email=request_email)
 def login():
     data = request.get_json()
     user = User.get_by_email(data['email'])
     
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
+    user.rehash_password_if_needed(data['password'])
     
     token = generate_token(user)
     
@@ -111,16 +286,15 @@ def logout():
     if auth_header and auth_header.startswith('Bearer '):
         token = auth_header.split(' ')[1]
         # Remove token from Redis whitelist
-        redis_client.client.delete(f"token:{token}")
+        revoke_token(token)
     return jsonify({'message': 'Logged out successfully'})
 
-@auth_bp.route('/reset-password', methods=['POST'])
-def request_password_reset():
-    data = request.get_json()
-    user = User.get_by_email(data['email'])
-    
+@mail_queue.builder('password_reset')
+def password_reset_message(email: str, host_url: str):
+    """Build the password reset email in the mail worker, or None if there is no such account."""
+    user = User.get_by_email(email)
     if not user:
-        return jsonify({'message': 'If the email exists, a reset link will be sent'}), 200
+        return None
     
     # Generate reset token
     reset_token = str(uuid.uuid4())
@@ -130,19 +304,27 @@ def request_password_reset():
         user.email
     )
     
-    # Send reset email
-    reset_url = f"{request.host_url}auth/reset-password/{reset_token}"
-    msg = Message(
+    reset_url = f"{host_url}auth/reset-password/{reset_token}"
+    return Message(
         'Password Reset Request',
         recipients=[user.email],
         body=f'To reset your password, visit the following link: {reset_url}\n'
              f'This link will expire in 5 minutes.'
     )
-    mail.send(msg)
+
+@auth_bp.route('/reset-password', methods=['POST'])
+@rate_limiter.limit(auth_ip=client_ip, auth_email=request_email)
+def request_password_reset():
+    data = request.get_json()
+    
+    # The account is looked up by the mail worker, so that the response takes
+    # the same time whether or not it exists
+    mail_queue.enqueue('password_reset', email=data['email'], host_url=request.host_url)
     
     return jsonify({'message': 'If the email exists, a reset link will be sent'}), 200
 
 @auth_bp.route('/reset-password/<token>', methods=['POST'])
+@rate_limiter.limit(auth_ip=client_ip)
 def reset_password(token):
     data = request.get_json()
     email = redis_client.client.get(f"reset:{token}")
@@ -150,8 +332,10 @@ def reset_password(token):
     if not email:
         return jsonify({'error': 'Invalid or expired reset token'}), 400
     
-    User.update_password(email.decode('utf-8'), data['new_password'])
+    user_id = User.update_password(email.decode('utf-8'), data['new_password'])
     redis_client.client.delete(f"reset:{token}")
+    if user_id:
+        revoke_user_sessions(user_id)
     
     return jsonify({'message': 'Password updated successfully'}) 
 
@@ -173,6 +357,7 @@ def update_user_permissions(current_user, user_id):
         }
         
         if User.update_user(target_user._id, update_data):
+            revoke_user_sessions(target_user._id)
             return jsonify({'message': 'User permissions updated successfully'})
         else:
             return jsonify({'error': 'Failed to update user permissions'}), 500
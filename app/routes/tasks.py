@@ -1,21 +1,23 @@
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, stream_with_context
 from functools import wraps
-from app.models.task import Task
-from app.extensions import redis_client
-from datetime import datetime
+import gzip
+from app.models.task import (
+    Task, TaskSchema, EXPORT_FIELDS, SEARCH_MODES, ImportInterrupted, etag_versions, list_etag, parse_iso_date,
+    task_cache_key, task_etag
+)
+from app.streaming import csv_chunks, gzip_chunks, ndjson_chunks
+from app.models.stats import TaskStats, due_day
+from app.extensions import rate_limiter, redis_client
+from app.rate_limit import current_user_id
+from app.routes.auth import principal_cache_key, resolve_principal
+from datetime import datetime, timedelta
 from bson import ObjectId
-import jwt
+from marshmallow import ValidationError
 from flask import current_app
 
 tasks_bp = Blueprint('tasks', __name__)
 
-def verify_token(token):
-    try:
-        return jwt.decode(token, current_app.config['JWT_SECRET_KEY'], algorithms=['HS256'])
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+MAX_SEARCH_LENGTH = 200
 
 def login_required(f):
     @wraps(f)
@@ -25,28 +27,93 @@ def login_required(f):
             return jsonify({'error': 'No token provided'}), 401
         
         token = auth_header.split(' ')[1]
-        payload = verify_token(token)
+        # The principal and the task of the route are read in one round trip
+        # (mutations do not read the task)
+        keys = [principal_cache_key(token)]
+        if 'task_id' in kwargs and request.method == 'GET':
+            keys.append(task_cache_key(kwargs['task_id']))
+        redis_client.prefetch(*keys)
+        user = resolve_principal(token)
         
-        if not payload:
+        if not user:
             return jsonify({'error': 'Invalid or expired token'}), 401
         
-        g.user_email = payload['email']
-        g.user_id = payload['sub']
+        g.user_email = user.email
+        g.user_id = str(user._id)
         return f(*args, **kwargs)
     return decorated_function
 
-def parse_iso_date(date_str: str) -> datetime:
-    """Parse ISO 8601 date string to datetime object."""
+def json_body_response(body: bytes):
+    """Response for an already encoded JSON body, formatted as jsonify would outside debug mode."""
+    return current_app.response_class(body + b'\n', mimetype='application/json')
+
+def not_modified(etag: str):
+    response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    return response
+
+def page_response(body: bytes, etag: str, next_cursor, total: int):
+    response = json_body_response(body)
+    response.set_etag(etag)
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def page_limit(args, config) -> int:
+    """Parse the limit query parameter, capped at TASKS_MAX_PAGE_SIZE. Raises ValueError if invalid."""
     try:
-        # Remove the 'Z' and replace with '+00:00' for UTC
-        if date_str.endswith('Z'):
-            date_str = date_str[:-1] + '+00:00'
-        return datetime.fromisoformat(date_str)
+        limit = int(args.get('limit', config['TASKS_PAGE_SIZE']))
     except ValueError:
-        return None
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, config['TASKS_MAX_PAGE_SIZE'])
+
+def page_args(args, config) -> dict:
+    """Parse the list query parameters into Task.get_user_tasks_page_json arguments.
+
+    Raises ValueError with a message for the client if a parameter is invalid.
+    """
+    limit = page_limit(args, config)
+
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError('order must be asc or desc')
+
+    due_range = {}
+    for param in ('due_from', 'due_to'):
+        if args.get(param):
+            due_range[param] = parse_iso_date(args[param])
+            if due_range[param] is None:
+                raise ValueError('Invalid date format. Use ISO 8601 format (e.g., 2024-12-31T23:59:59Z)')
+
+    return {
+        'limit': limit,
+        'after': args.get('after'),
+        'sort': args.get('sort', 'created_at'),
+        'descending': order == 'desc',
+        'status': args.get('status'),
+        **due_range
+    }
+
+def update_fields(data: dict) -> dict:
+    """Pick the updatable task fields from a PUT body."""
+    updates = {}
+    
+    if 'title' in data:
+        updates['title'] = data['title']
+    if 'description' in data:
+        updates['description'] = data['description']
+    if 'status' in data:
+        updates['status'] = data['status']
+    if 'due_date' in data:
+        updates['due_date'] = parse_iso_date(data['due_date']) if data['due_date'] else None
+    return updates
 
 @tasks_bp.route('', methods=['POST'])
 @login_required
+@rate_limiter.limit(task_writes=current_user_id)
 def create_task():
     data = request.get_json()
     
@@ -71,46 +138,215 @@ def create_task():
 @tasks_bp.route('', methods=['GET'])
 @login_required
 def get_tasks():
-    tasks = Task.get_user_tasks(g.user_id)  # Using user_id from JWT token
-    return jsonify([task.to_dict() for task in tasks])
+    """List the user's tasks one page at a time.
+
+    Query parameters: limit, after (cursor from X-Next-Cursor), sort, order
+    (asc/desc), status, due_from and due_to (ISO 8601).
+    The ETag changes with every write to the user's tasks; a request with a
+    matching If-None-Match gets a 304 without the page being read. Without
+    If-None-Match, the version is read along with the page.
+    """
+    try:
+        args = page_args(request.args, current_app.config)
+        page_id = Task.page_query(g.user_id, **args)[3]  # Using user_id from JWT token
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    version = None
+    if request.if_none_match:
+        version = Task.list_version(g.user_id)
+        etag = list_etag(version, page_id)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+    body, next_cursor, total, version = Task.get_user_tasks_page_json(g.user_id, **args, version=version)
+    return page_response(body, list_etag(version, page_id), next_cursor, total)
+
+@tasks_bp.route('/search', methods=['GET'])
+@login_required
+def search_tasks():
+    """Search the user's tasks, one page at a time.
+
+    Query parameters: q, mode (text: words of the title and description,
+    best match first; prefix: titles starting with q, for autocomplete),
+    limit and after (cursor from X-Next-Cursor). Each result holds the id,
+    title, status and due date of a task. Results are cached until the
+    user's tasks change, with the same ETag handling as GET /api/tasks.
+    """
+    q = request.args.get('q', '').strip()
+    if not q or len(q) > MAX_SEARCH_LENGTH:
+        return jsonify({'error': f'q must be 1 to {MAX_SEARCH_LENGTH} characters'}), 400
+    mode = request.args.get('mode', 'text')
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    try:
+        limit = page_limit(request.args, current_app.config)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    after = request.args.get('after', '0')
+    if not after.isdigit():
+        return jsonify({'error': 'Invalid cursor'}), 400
+    offset = int(after)
+
+    search_id = Task.search_id(q, mode, limit, offset)
+    version = None
+    if request.if_none_match:
+        version = Task.list_version(g.user_id)
+        etag = list_etag(version, search_id)
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
+
+    body, next_cursor, total, version = Task.search_json(
+        g.user_id, q, mode, limit, offset, current_app.config['TASKS_SEARCH_MAX_RESULTS'], version=version
+    )
+    return page_response(body, list_etag(version, search_id), next_cursor, total)
+
+@tasks_bp.route('/summary', methods=['GET'])
+@login_required
+def get_summary():
+    """Task counts for the user's dashboard: total, by status and due over the next 7 days."""
+    today = datetime.utcnow()
+    days = [due_day(today + timedelta(days=offset)) for offset in range(7)]
+    summary = TaskStats.get(g.user_id, days=days)
+    summary['due_today'] = summary['due_by_day'][days[0]]
+    return jsonify(summary)
+
+@tasks_bp.route('/export', methods=['GET'])
+@login_required
+def export_tasks():
+    """Stream all of the user's tasks as NDJSON (default) or CSV (?format=csv).
+
+    The body is gzipped on the fly if the client accepts it.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    tasks = Task.iter_user_tasks(g.user_id, current_app.config['TASKS_EXPORT_BATCH_SIZE'])
+    if export_format == 'csv':
+        chunks, mimetype = csv_chunks(tasks, EXPORT_FIELDS), 'text/csv'
+    else:
+        chunks, mimetype = ndjson_chunks(tasks), 'application/x-ndjson'
+
+    headers = {'Content-Disposition': f'attachment; filename=tasks.{export_format}', 'Vary': 'Accept-Encoding'}
+    if request.accept_encodings['gzip'] > 0:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+@tasks_bp.route('/import', methods=['POST'])
+@login_required
+@rate_limiter.limit(task_writes=current_user_id)
+def import_tasks():
+    """Import tasks for the user from an NDJSON body, one task per line, read as a stream.
+
+    The body may be gzipped (Content-Encoding: gzip). Returns the number of
+    imported and failed lines, the errors by line number and the throughput,
+    with a 400 and the error if the gzip stream breaks off.
+    """
+    stream = request.stream
+    if request.content_encoding == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream)
+    try:
+        report = Task.import_ndjson(stream, g.user_id, current_app.config['TASKS_IMPORT_CHUNK_SIZE'])
+    except ImportInterrupted as e:
+        # The tasks read before the body broke off are imported
+        return jsonify({'error': 'Invalid gzip body', **e.report}), 400
+    return jsonify(report)
+
+@tasks_bp.route('/batch', methods=['POST'])
+@login_required
+@rate_limiter.limit(task_writes=current_user_id)
+def batch_tasks():
+    """Apply a list of create, update and delete operations in one request.
+
+    Body: {"operations": [{"op": "create", "data": {...}},
+                          {"op": "update", "id": "...", "data": {...}},
+                          {"op": "delete", "id": "..."}]}
+    Returns the result of each operation in request order.
+    """
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'operations must be a non-empty list'}), 400
+
+    limit = current_app.config['TASKS_BATCH_LIMIT']
+    if len(operations) > limit:
+        return jsonify({'error': f'A batch can contain at most {limit} operations'}), 413
+
+    results = {}
+    valid = []
+    seen_ids = set()
+    for index, item in enumerate(operations):
+        op = item.get('op') if isinstance(item, dict) else None
+        try:
+            if op == 'create':
+                fields = TaskSchema().load({**item.get('data', {}), 'user_id': g.user_id})
+                valid.append((index, op, Task(**fields)))
+                continue
+            if op not in ('update', 'delete'):
+                raise ValidationError('op must be create, update or delete')
+
+            if not isinstance(item.get('id'), str) or not ObjectId.is_valid(item['id']):
+                raise ValidationError('Invalid task id')
+            task_id = ObjectId(item['id'])
+            if task_id in seen_ids:
+                raise ValidationError('A task can only appear once per batch')
+            seen_ids.add(task_id)
+            if op == 'update':
+                fields = TaskSchema(partial=True, exclude=('user_id',)).load(item.get('data', {}))
+                valid.append((index, op, (task_id, fields)))
+            else:
+                valid.append((index, op, task_id))
+        except ValidationError as e:
+            results[index] = {'index': index, 'status': 400, 'error': e.messages}
+        except TypeError:
+            results[index] = {'index': index, 'status': 400, 'error': 'data must be an object'}
+
+    if valid:
+        results.update(Task.apply_batch(g.user_id, valid))
+
+    return jsonify({'results': [results[index] for index in range(len(operations))]})
 
 @tasks_bp.route('/<task_id>', methods=['GET'])
 @login_required
 def get_task(task_id):
-    task = Task.get_by_id(task_id, g.user_id)  # Using user_id from JWT token
-    if not task:
+    cached = Task.get_json_by_id(task_id, g.user_id)  # Using user_id from JWT token
+    if not cached:
         return jsonify({'error': 'Task not found'}), 404
-    
-    return jsonify(task.to_dict())
+
+    task_json, version = cached
+    etag = task_etag(version)
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+
+    response = json_body_response(task_json)
+    response.set_etag(etag)
+    return response
 
 @tasks_bp.route('/<task_id>', methods=['PUT'])
 @login_required
+@rate_limiter.limit(task_writes=current_user_id)
 def update_task(task_id):
-    task = Task.get_by_id(task_id, g.user_id)  # Using user_id from JWT token
+    # Optimistic concurrency: If-Match must hold the ETag (the version) of the current task
+    task = Task.update_by_id(
+        task_id, g.user_id, update_fields(request.get_json()), etag_versions(request.if_match)
+    )  # Using user_id from JWT token
     if not task:
+        if request.if_match:
+            return jsonify({'error': 'Task has been modified'}), 412
         return jsonify({'error': 'Task not found'}), 404
-    
-    data = request.get_json()
-    updates = {}
-    
-    if 'title' in data:
-        updates['title'] = data['title']
-    if 'description' in data:
-        updates['description'] = data['description']
-    if 'status' in data:
-        updates['status'] = data['status']
-    if 'due_date' in data:
-        updates['due_date'] = parse_iso_date(data['due_date']) if data['due_date'] else None
-    
-    task.update(**updates)
-    return jsonify(task.to_dict())
+
+    response = jsonify(task.to_dict())
+    response.set_etag(task_etag(task.version))
+    return response
 
 @tasks_bp.route('/<task_id>', methods=['DELETE'])
 @login_required
+@rate_limiter.limit(task_writes=current_user_id)
 def delete_task(task_id):
-    task = Task.get_by_id(task_id, g.user_id)  # Using user_id from JWT token
-    if not task:
+    if not Task.delete_by_id(task_id, g.user_id):  # Using user_id from JWT token
         return jsonify({'error': 'Task not found'}), 404
     
-    task.delete()
     return jsonify({'message': 'Task deleted successfully'})
\ No newline at end of file
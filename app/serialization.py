@@ -0,0 +1,37 @@
+from flask.json.provider import DefaultJSONProvider
+import orjson
+
+# Compact, sorted keys: the same bytes jsonify produces with JSONProvider outside
+# debug mode, so cached entries can be served as response bodies as they are.
+# Unlike Flask's default provider, which escapes non-ASCII characters
+# (ensure_ascii), orjson writes them as UTF-8; both decode to the same values.
+DUMPS_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+loads = orjson.loads
+
+
+def dumps(obj, indent: bool = False) -> bytes:
+    """Encode obj as JSON bytes without the trailing newline jsonify adds."""
+    return orjson.dumps(obj, option=DUMPS_OPTIONS | orjson.OPT_INDENT_2 if indent else DUMPS_OPTIONS)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    Objects orjson can't encode natively (datetimes, Decimal, ...) go through
+    Flask's default hook, so responses keep the format of the default provider.
+    Anything orjson rejects outright, like non-string dict keys, falls back to it,
+    with non-ASCII characters left unescaped like orjson does.
+    """
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = DUMPS_OPTIONS | orjson.OPT_INDENT_2 if kwargs.get('indent') else DUMPS_OPTIONS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -0,0 +1,48 @@
+import csv
+import io
+from typing import Dict, Iterable, Iterator, Sequence
+import zlib
+
+from app import serialization
+
+# Encoded rows are grouped into chunks of about this size before being yielded,
+# so that a response isn't written to the socket one small row at a time
+CHUNK_SIZE = 64 * 1024
+
+
+def ndjson_chunks(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON."""
+    buffer = bytearray()
+    for row in rows:
+        buffer += serialization.dumps(row)
+        buffer += b'\n'
+        if len(buffer) >= CHUNK_SIZE:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def csv_chunks(rows: Iterable[Dict], fields: Sequence[str]) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line; None becomes an empty cell."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of chunks into a single gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16 + 15: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
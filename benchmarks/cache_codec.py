@@ -0,0 +1,86 @@
+"""Micro-benchmark of the encodings of the task caches, on the path that serves GET /api/tasks.
+
+Compares, for one user's list, the JSON of older releases with msgpack field
+arrays, uncompressed and zlib-compressed. For the user list cache
+`tasks:{user_id}:items` it measures the bytes stored in Redis, the time to encode
+every task and the time to build the response body from the cached values;
+for the pages cache `tasks:{user_id}:pages` the bytes of the cached page and
+the time to unpack it into the response body. --description-length makes the
+tasks large enough for compression to matter. Needs neither MongoDB nor Redis:
+
+    python -m benchmarks.cache_codec [--tasks 1000] [--description-length 50] [--repeat 20]
+"""
+import argparse
+import json
+import timeit
+
+from benchmarks.serialization import make_documents
+from app import serialization
+from app.models.task import (
+    JsonTaskFormat, MsgpackTaskFormat, Task, cache_codec, pack_list_entry, pack_page, unpack_list_entry, unpack_page
+)
+
+
+def configure(task_format, compress_min_bytes: int) -> None:
+    # pack_page and unpack_page use the app's codec
+    cache_codec.format = task_format
+    cache_codec.compress_min_bytes = compress_min_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000, help='tasks in the list')
+    parser.add_argument('--description-length', type=int, default=50, help='characters per task description')
+    parser.add_argument('--repeat', type=int, default=20, help='lists per measurement')
+    args = parser.parse_args()
+
+    user_id = 'bench-user'
+    tasks = []
+    for document in make_documents(args.tasks):
+        document['user_id'] = user_id
+        document['description'] = (document['description'] * (args.description_length // 50 + 1))[
+            :args.description_length
+        ]
+        tasks.append(Task(**document))
+    expected = serialization.dumps([task.to_dict() for task in tasks])
+
+    codecs = (
+        ('json', JsonTaskFormat(), 0),
+        ('json + zlib', JsonTaskFormat(), 1),
+        ('msgpack', MsgpackTaskFormat(), 0),
+        ('msgpack + zlib', MsgpackTaskFormat(), 1),
+    )
+    baseline = None
+    print(f'{"codec":<18}{"list bytes/task":>17}{"vs json":>10}{"encode us/task":>16}{"serve us/task":>15}'
+          f'{"page bytes/task":>17}{"serve us/task":>15}')
+    for name, task_format, compress_min_bytes in codecs:
+        configure(task_format, compress_min_bytes)
+        values = [pack_list_entry(task.version, cache_codec.encode(task)) for task in tasks]
+        size = sum(len(value) for value in values)
+        baseline = baseline or size
+        page = pack_page(expected, None, args.tasks)
+
+        def serve_list():
+            # What GET /api/tasks does with the values of the list cache
+            return b'[' + b','.join(cache_codec.to_json(unpack_list_entry(value), user_id) for value in values) + b']'
+
+        def serve_page():
+            body, *_ = unpack_page(page)
+            return body
+
+        assert json.loads(serve_list()) == json.loads(expected)
+        assert serve_page() == expected
+
+        encode = min(timeit.repeat(
+            lambda: [cache_codec.encode(task) for task in tasks], number=args.repeat, repeat=3
+        ))
+        list_serve = min(timeit.repeat(serve_list, number=args.repeat, repeat=3))
+        page_serve = min(timeit.repeat(serve_page, number=args.repeat, repeat=3))
+        per_task = 1e6 / (args.repeat * args.tasks)
+        print(f'{name:<18}{size / args.tasks:>17.1f}{size / baseline - 1:>+10.0%}'
+              f'{encode * per_task:>16.3f}{list_serve * per_task:>15.3f}'
+              f'{len(page) / args.tasks:>17.1f}{page_serve * per_task:>15.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""Model-layer micro-benchmarks against in-memory MongoDB and Redis.
+
+Runs the app factory on the stand-ins of benchmarks.standins, each round trip
+costing --latency-ms, and times the model operations the routes use: the first
+page of Task.get_user_tasks_page_json (list cache miss and hit, per list
+size), Task.get_json_by_id, Task.update_by_id, generate_token/verify_token and
+GET /api/metrics. Reports ops/sec, p50 and p99.
+
+    python -m benchmarks.models --sizes 10,1000,100000 --latency-ms 0.5 --save baseline.json
+    python -m benchmarks.models --compare baseline.json  # exits with 1 on a regression
+
+Needs the packages in benchmarks/requirements.txt.
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.standins import Latency, in_memory_services
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(op: Callable, iterations: int, setup: Optional[Callable] = None) -> Dict:
+    """Time op `iterations` times; setup runs before each call, outside the timing."""
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        op()
+        samples.append(time.perf_counter() - started)
+    return {
+        'iterations': iterations,
+        'ops_per_sec': round(iterations / sum(samples), 1),
+        'p50_ms': round(percentile(samples, 0.5) * 1000, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 4),
+    }
+
+
+def seed_tasks(user_id: str, count: int) -> None:
+    from app.extensions import mongo
+    from app.models.task import Task
+
+    now = datetime.utcnow()
+    for start in range(0, count, 10000):
+        mongo.db.tasks.insert_many([Task(
+            title=f'Task {i}',
+            description='Write the quarterly report and send it to the team',
+            user_id=user_id,
+            status='todo',
+            due_date=now + timedelta(days=i % 30),
+            created_at=now + timedelta(microseconds=i)
+        ).to_document() for i in range(start, min(start + 10000, count))])
+
+
+def run(sizes: List[int], iterations: int, latency_ms: float) -> Dict[str, Dict]:
+    from app import create_app
+    from app.config import Config
+    from app.extensions import redis_client
+    from app.models.task import Task, task_cache_key
+    from app.models.user import User
+    from app.routes.auth import generate_token, verify_token
+
+    class BenchmarkConfig(Config):
+        TESTING = True
+        SECRET_KEY = JWT_SECRET_KEY = 'benchmark'
+        MONGO_URI = 'mongodb://localhost:27017/taskmanager_benchmark'
+        REDIS_URL = 'redis://localhost:6379/0'
+        MONGO_QUERY_PLAN_CHECK = 'off'
+        BCRYPT_ROUNDS = 4
+
+    results = {}
+    with in_memory_services():
+        app = create_app(BenchmarkConfig)
+        client = app.test_client()
+        page_size = app.config['TASKS_PAGE_SIZE']
+        with app.app_context():
+            user = User(email='bench@example.com', password='benchmark')
+            user.save()
+
+            for size in sizes:
+                user_id = f'bench-{size}'
+                seed_tasks(user_id, size)
+                Latency.seconds = latency_ms / 1000
+                # Fewer iterations for the large lists, so that a run stays short
+                size_iterations = max(3, min(iterations, 100000 // size))
+                results[f'list_page[miss,{size}]'] = measure(
+                    lambda: Task.get_user_tasks_page_json(user_id, page_size), size_iterations,
+                    setup=lambda: redis_client.client.delete(f'tasks:{user_id}:items')
+                )
+                results[f'list_page[hit,{size}]'] = measure(
+                    lambda: Task.get_user_tasks_page_json(user_id, page_size), size_iterations
+                )
+                Latency.seconds = 0
+
+            task = Task(title='Task', description='Description', user_id=str(user._id))
+            task.save()
+            task_id = str(task._id)
+            Latency.seconds = latency_ms / 1000
+            results['get_json_by_id[miss]'] = measure(
+                lambda: Task.get_json_by_id(task_id, task.user_id), iterations,
+                setup=lambda: redis_client.client.delete(task_cache_key(task_id))
+            )
+            results['get_json_by_id[hit]'] = measure(lambda: Task.get_json_by_id(task_id, task.user_id), iterations)
+            results['update_by_id'] = measure(
+                lambda: Task.update_by_id(task_id, task.user_id, {'title': 'Renamed'}), iterations
+            )
+
+            tokens = []
+            results['generate_token'] = measure(lambda: tokens.append(generate_token(user)), iterations)
+            results['verify_token'] = measure(lambda: verify_token(tokens[-1]), iterations)
+            results['get_metrics'] = measure(lambda: client.get('/api/metrics'), iterations)
+            Latency.seconds = 0
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Names of the benchmarks whose p50 or throughput got worse than the baseline by more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if (result['p50_ms'] > before['p50_ms'] * (1 + threshold)
+                or result['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold)):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000', help='comma-separated task list sizes')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per benchmark')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='injected latency per round trip')
+    parser.add_argument('--save', metavar='PATH', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='tolerated slowdown before flagging (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    results = run([int(size) for size in args.sizes.split(',')], args.iterations, args.latency_ms)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        if saved['latency_ms'] != args.latency_ms:
+            print(f"warning: the baseline was run with --latency-ms {saved['latency_ms']}", file=sys.stderr)
+    regressions = compare(results, baseline, args.threshold)
+
+    print(f'{"benchmark":<30}{"ops/sec":>12}{"p50 ms":>10}{"p99 ms":>10}{"vs base":>10}')
+    for name, result in results.items():
+        change = ''
+        if name in baseline:
+            change = f"{result['p50_ms'] / baseline[name]['p50_ms'] - 1:+.0%}" if baseline[name]['p50_ms'] else ''
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<30}{result['ops_per_sec']:>12}{result['p50_ms']:>10}{result['p99_ms']:>10}{change:>10}{flag}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'created_at': datetime.utcnow().isoformat(),
+                'python': platform.python_version(),
+                'latency_ms': args.latency_ms,
+                'results': results
+            }, f, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark of the task serialization paths of GET /api/tasks.
+
+Compares, per task, the old cache-hit path (decode the cached page, rebuild
+every Task, re-encode with the json module) with serving the cached bytes as
+they are, and the json module with orjson on the cache-miss path.
+Needs neither MongoDB nor Redis:
+
+    python -m benchmarks.serialization [--tasks 200] [--repeat 200]
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import timeit
+
+from bson import ObjectId
+
+from app import serialization
+from app.models.task import Task, pack_page, unpack_page
+
+
+def make_documents(count: int):
+    now = datetime.utcnow()
+    return [{
+        '_id': ObjectId(),
+        'title': f'Task {i}',
+        'description': 'Write the quarterly report and send it to the team',
+        'status': 'todo',
+        'user_id': str(ObjectId()),
+        'due_date': now + timedelta(days=i),
+        'created_at': now,
+        'updated_at': now
+    } for i in range(count)]
+
+
+def jsonify_dumps(data) -> bytes:
+    # What flask.jsonify did with the default provider
+    return (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200, help='tasks per page')
+    parser.add_argument('--repeat', type=int, default=200, help='pages per measurement')
+    args = parser.parse_args()
+
+    documents = make_documents(args.tasks)
+    old_page = json.dumps({
+        'tasks': [Task(**document).to_dict() for document in documents], 'next': None, 'total': args.tasks
+    })
+    new_page = pack_page(serialization.dumps([Task(**document).to_dict() for document in documents]), None, args.tasks)
+
+    def hit_rehydrate():
+        page = json.loads(old_page)
+        tasks = [Task.from_dict(task) for task in page['tasks']]
+        return jsonify_dumps([task.to_dict() for task in tasks])
+
+    def hit_bytes():
+        body, *_ = unpack_page(new_page)
+        return body + b'\n'
+
+    def miss_json():
+        return jsonify_dumps([Task(**document).to_dict() for document in documents])
+
+    def miss_orjson():
+        return serialization.dumps([Task(**document).to_dict() for document in documents]) + b'\n'
+
+    assert json.loads(hit_rehydrate()) == json.loads(hit_bytes())
+    assert json.loads(miss_json()) == json.loads(miss_orjson())
+
+    print(f'{"path":<32}{"us/task":>10}')
+    for name, fn in (
+        ('cache hit, rehydrate + json', hit_rehydrate),
+        ('cache hit, pre-encoded bytes', hit_bytes),
+        ('cache miss, json', miss_json),
+        ('cache miss, orjson', miss_orjson),
+    ):
+        seconds = min(timeit.repeat(fn, number=args.repeat, repeat=3))
+        print(f'{name:<32}{seconds / (args.repeat * args.tasks) * 1e6:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
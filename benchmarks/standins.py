@@ -0,0 +1,85 @@
+"""In-memory MongoDB and Redis stand-ins with an injected round-trip latency.
+
+mongomock and fakeredis implement the commands; every Redis round trip (a
+command or a whole pipeline) and every MongoDB operation first sleeps for the
+configured latency, so the number of round trips shows up in the timings the
+way it would against real servers.
+"""
+from contextlib import contextmanager
+from unittest import mock
+import time
+
+import fakeredis
+from fakeredis import FakeRedisConnection
+import flask_pymongo
+import mongomock
+import redis
+
+
+class Latency:
+    """Injected latency in seconds, shared by the stand-ins and changeable between runs."""
+    seconds = 0.0
+
+    @classmethod
+    def wait(cls) -> None:
+        if cls.seconds:
+            time.sleep(cls.seconds)
+
+
+class LatencyRedisConnection(FakeRedisConnection):
+    def send_packed_command(self, command, check_health=True):
+        Latency.wait()
+        return super().send_packed_command(command, check_health)
+
+
+class LatencyCollection:
+    """mongomock collection whose operations each cost one round trip."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            Latency.wait()
+            return attr(*args, **kwargs)
+        return call
+
+
+class LatencyDatabase:
+    def __init__(self, database):
+        self._database = database
+
+    def __getitem__(self, name):
+        return LatencyCollection(self._database[name])
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class LatencyMongoClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getitem__(self, name):
+        return LatencyDatabase(self._client[name])
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+@contextmanager
+def in_memory_services():
+    """Route redis.from_url and flask-pymongo's MongoClient to fresh in-memory stand-ins."""
+    server = fakeredis.FakeServer()
+    mongo_client = LatencyMongoClient(mongomock.MongoClient())
+
+    def from_url(url, **kwargs):
+        return fakeredis.FakeRedis(server=server, connection_class=LatencyRedisConnection)
+
+    with mock.patch.object(redis, 'from_url', from_url), \
+            mock.patch.object(flask_pymongo, 'MongoClient', lambda *args, **kwargs: mongo_client):
+        yield
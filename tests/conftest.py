@@ -0,0 +1,68 @@
+import json
+import pytest
+from app import create_app
+from app.config import Config
+from app.extensions import mongo, redis_client
+
+class TestConfig(Config):
+    TESTING = True
+    MONGO_URI = 'mongodb://mongodb:27017/taskmanager_test'
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def config():
+    # Modules with their own settings override this with a subclass of it
+    return TestConfig
+
+@pytest.fixture
+def app(config):
+    return create_app(config)
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    def install(target, now):
+        clock = FakeClock(now)
+        monkeypatch.setattr(target, 'clock', clock)
+        return clock
+    return install
+
+@pytest.fixture
+def cleanup(app):
+    yield
+    # Clean up the test database after each test
+    with app.app_context():
+        mongo.db.users.delete_many({})
+        mongo.db.tasks.delete_many({})
+        for key in redis_client.client.keys('*'):
+            redis_client.client.delete(key)
+
+@pytest.fixture
+def auth_headers(client):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    token = json.loads(login_response.data)['token']
+    return {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,133 @@
+import pytest
+from starlette.testclient import TestClient
+from app.aio import create_asgi_app
+from app.extensions import mongo
+
+@pytest.fixture
+def asgi_app(config):
+    return create_asgi_app(config)
+
+@pytest.fixture
+def app(asgi_app):
+    # The mounted Flask app, for cleanup and for comparing with the Flask routes
+    return asgi_app.state.flask_app
+
+@pytest.fixture
+def asgi_client(asgi_app):
+    with TestClient(asgi_app) as client:
+        yield client
+
+@pytest.fixture
+def asgi_headers(asgi_client):
+    asgi_client.post('/api/auth/register', json={'email': 'test@example.com', 'password': 'test123'})
+    token = asgi_client.post('/api/auth/login', json={
+        'email': 'test@example.com', 'password': 'test123'
+    }).json()['token']
+    return {'Authorization': f'Bearer {token}'}
+
+def test_register_and_login(asgi_client, client, cleanup):
+    response = asgi_client.post('/api/auth/register', json={
+        'email': 'test@example.com', 'password': 'test123', 'name': 'Test User'
+    })
+    assert response.status_code == 201
+    assert response.json() == {'message': 'User registered successfully'}
+    response = asgi_client.post('/api/auth/register', json={'email': 'test@example.com', 'password': 'other'})
+    assert response.status_code == 400
+
+    response = asgi_client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'wrong'})
+    assert response.status_code == 401
+    response = asgi_client.post('/api/auth/login', json={'email': 'test@example.com', 'password': 'test123'})
+    assert response.status_code == 200
+    assert response.json()['user']['name'] == 'Test User'
+
+    # The session is shared with the Flask routes
+    headers = {'Authorization': f"Bearer {response.json()['token']}"}
+    assert client.get('/api/tasks', headers=headers).status_code == 200
+    assert asgi_client.post('/api/auth/logout', headers=headers).status_code == 200
+    assert asgi_client.get('/api/tasks', headers=headers).status_code == 401
+    assert client.get('/api/tasks', headers=headers).status_code == 401
+
+def test_task_routes(asgi_client, asgi_headers, client, cleanup):
+    headers = asgi_headers
+    for i in range(3):
+        response = asgi_client.post('/api/tasks', headers=headers, json={
+            'title': f'Task {i}', 'description': 'Description', 'due_date': f'2024-12-0{i + 1}T12:00:00Z'
+        })
+        assert response.status_code == 201
+    assert response.json()['title'] == 'Task 2'
+    assert response.json()['due_date'] == '2024-12-03T12:00:00+00:00'
+    response = asgi_client.post('/api/tasks', headers=headers, json={
+        'title': 'Task', 'description': 'Description', 'due_date': 'tomorrow'
+    })
+    assert response.status_code == 400
+    assert mongo.db.tasks.count_documents({}) == 3
+
+    response = asgi_client.get('/api/tasks?limit=2', headers=headers)
+    assert response.status_code == 200
+    assert response.headers['X-Total-Count'] == '3'
+    assert [task['title'] for task in response.json()] == ['Task 0', 'Task 1']
+    # Same body as the Flask route, served from the same cache entries
+    assert client.get('/api/tasks?limit=2', headers=headers).data == response.content
+    etag = response.headers['ETag']
+    assert asgi_client.get('/api/tasks?limit=2', headers={**headers, 'If-None-Match': etag}).status_code == 304
+
+    task_id = response.json()[0]['id']
+    response = asgi_client.get(f'/api/tasks/{task_id}', headers=headers)
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Task 0'
+    task_etag = response.headers['ETag']
+    assert asgi_client.get(f'/api/tasks/{task_id}', headers={**headers, 'If-None-Match': task_etag}).status_code == 304
+
+    response = asgi_client.put(f'/api/tasks/{task_id}', headers={**headers, 'If-Match': task_etag},
+                               json={'status': 'done'})
+    assert response.status_code == 200
+    assert response.json()['status'] == 'done'
+    response = asgi_client.put(f'/api/tasks/{task_id}', headers={**headers, 'If-Match': task_etag},
+                               json={'status': 'pending'})
+    assert response.status_code == 412
+    assert client.get(f'/api/tasks/{task_id}', headers=headers).json['status'] == 'done'
+    response = asgi_client.get('/api/tasks?limit=2', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json()[0]['status'] == 'done'
+
+    assert asgi_client.delete(f'/api/tasks/{task_id}', headers=headers).status_code == 200
+    assert asgi_client.get(f'/api/tasks/{task_id}', headers=headers).status_code == 404
+    assert asgi_client.put(f'/api/tasks/{task_id}', headers=headers, json={'status': 'done'}).status_code == 404
+    assert asgi_client.delete(f'/api/tasks/{task_id}', headers=headers).status_code == 404
+    assert asgi_client.get('/api/tasks', headers=headers).headers['X-Total-Count'] == '2'
+
+    # Tasks of other users are not found
+    asgi_client.post('/api/auth/register', json={'email': 'other@example.com', 'password': 'test123'})
+    token = asgi_client.post('/api/auth/login', json={
+        'email': 'other@example.com', 'password': 'test123'
+    }).json()['token']
+    task_id = mongo.db.tasks.find_one()['_id']
+    assert asgi_client.get(f'/api/tasks/{task_id}', headers={'Authorization': f'Bearer {token}'}).status_code == 404
+
+def test_task_routes_require_a_token(asgi_client, cleanup):
+    assert asgi_client.get('/api/tasks').status_code == 401
+    assert asgi_client.post('/api/tasks', json={'title': 'Task'}).status_code == 401
+    response = asgi_client.get('/api/tasks', headers={'Authorization': 'Bearer invalid'})
+    assert response.status_code == 401
+
+@pytest.mark.parametrize('method, path, content_type, body', [
+    ('post', '/api/auth/register', 'application/json', b'{"email": '),
+    ('post', '/api/auth/login', 'application/json', b'{"email": '),
+    ('post', '/api/tasks', 'application/json', b'{"title": '),
+    ('post', '/api/tasks', 'text/plain', b'{"title": "Task"}'),
+    ('put', '/api/tasks/{task_id}', 'application/json', b'not json'),
+])
+def test_bad_bodies_are_rejected_like_flask(asgi_client, asgi_headers, client, cleanup,
+                                            method, path, content_type, body):
+    task_id = asgi_client.post('/api/tasks', headers=asgi_headers, json={
+        'title': 'Task', 'description': 'Description'
+    }).json()['id']
+    path = path.format(task_id=task_id)
+    headers = {**asgi_headers, 'Content-Type': content_type, 'Origin': 'http://localhost:3000'}
+
+    response = asgi_client.request(method, path, headers=headers, content=body)
+    expected = getattr(client, method)(path, headers=headers, data=body)
+    assert response.status_code == expected.status_code
+    assert response.status_code == (415 if content_type == 'text/plain' else 400)
+    assert response.headers['Access-Control-Allow-Origin'] == 'http://localhost:3000'
+    assert mongo.db.tasks.find_one()['title'] == 'Task'
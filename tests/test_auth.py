@@ -1,26 +1,8 @@
-import pytest
-from app import create_app
 from app.extensions import mongo, redis_client
+from bson import ObjectId
 import json
-
-@pytest.fixture
-def app():
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['MONGO_URI'] = 'mongodb://mongodb:27017/taskmanager_test'
-    return app
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
-
-@pytest.fixture
-def cleanup():
-    yield
-    # Clean up the test database after each test
-    mongo.db.users.delete_many({})
-    for key in redis_client.client.keys('*'):
-        redis_client.client.delete(key)
+import jwt
+from datetime import datetime, timedelta, timezone
 
 def test_register(client, cleanup):
     response = client.post('/api/auth/register', json={
@@ -74,4 +56,178 @@ def test_logout(client, cleanup):
         'Authorization': f'Bearer {token}'
     })
     assert response.status_code == 200
-    assert b'Logged out successfully' in response.data 
\ No newline at end of file
+    assert b'Logged out successfully' in response.data
+
+def test_active_sessions_metric(client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    token = json.loads(login_response.data)['token']
+
+    response = client.get('/api/metrics')
+    assert json.loads(response.data)['active_sessions'] == 1
+
+    client.post('/api/auth/logout', headers={
+        'Authorization': f'Bearer {token}'
+    })
+    response = client.get('/api/metrics')
+    assert json.loads(response.data)['active_sessions'] == 0
+
+def test_permission_change_invalidates_cached_principal(client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'admin@example.com',
+        'password': 'test123'
+    })
+    mongo.db.users.update_one({'email': 'admin@example.com'}, {'$set': {'role': 'admin'}})
+    login_response = client.post('/api/auth/login', json={
+        'email': 'admin@example.com',
+        'password': 'test123'
+    })
+    data = json.loads(login_response.data)
+    headers = {'Authorization': f"Bearer {data['token']}"}
+
+    response = client.patch(f"/api/auth/permissions/{data['user']['id']}", headers=headers, json={
+        'role': 'user',
+        'whitelisted': False
+    })
+    assert response.status_code == 200
+
+    # The change logged the user out everywhere
+    response = client.patch(f"/api/auth/permissions/{data['user']['id']}", headers=headers, json={
+        'role': 'admin',
+        'whitelisted': False
+    })
+    assert response.status_code == 401
+
+    login_response = client.post('/api/auth/login', json={
+        'email': 'admin@example.com',
+        'password': 'test123'
+    })
+    headers = {'Authorization': f"Bearer {json.loads(login_response.data)['token']}"}
+    response = client.patch(f"/api/auth/permissions/{data['user']['id']}", headers=headers, json={
+        'role': 'admin',
+        'whitelisted': False
+    })
+    assert response.status_code == 403
+
+def test_logout_revokes_task_access(client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    headers = {'Authorization': f"Bearer {json.loads(login_response.data)['token']}"}
+    assert client.get('/api/tasks', headers=headers).status_code == 200
+
+    client.post('/api/auth/logout', headers=headers)
+    assert client.get('/api/tasks', headers=headers).status_code == 401
+
+def test_sessions_are_stored_by_jti(client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    data = json.loads(login_response.data)
+    jti = jwt.decode(data['token'], options={'verify_signature': False})['jti']
+
+    assert redis_client.client.get(f'session:{jti}') == ObjectId(data['user']['id']).binary
+    assert redis_client.client.zrange(f"sessions:user:{data['user']['id']}", 0, -1) == [jti.encode()]
+    assert redis_client.client.zrange('sessions:active', 0, -1) == [jti.encode()]
+    assert not redis_client.client.keys('token:*')
+
+def test_password_reset_logs_out_everywhere(client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    tokens = [json.loads(client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    }).data)['token'] for _ in range(2)]
+    for token in tokens:
+        assert client.get('/api/tasks', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+    redis_client.client.setex('reset:reset-token', 300, 'test@example.com')
+    response = client.post('/api/auth/reset-password/reset-token', json={'new_password': 'changed'})
+    assert response.status_code == 200
+
+    for token in tokens:
+        assert client.get('/api/tasks', headers={'Authorization': f'Bearer {token}'}).status_code == 401
+    assert json.loads(client.get('/api/metrics').data)['active_sessions'] == 0
+    assert not redis_client.client.keys('principal*')
+    assert not redis_client.client.keys('session*')
+    assert client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'changed'
+    }).status_code == 200
+
+def test_revocation_during_principal_fill_is_not_undone(client, cleanup, monkeypatch):
+    from app.models.user import User
+    from app.routes.auth import revoke_user_sessions
+
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    login_response = client.post('/api/auth/login', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    headers = {'Authorization': f"Bearer {json.loads(login_response.data)['token']}"}
+
+    # The sessions are revoked after the session check, while the user is being read
+    get_by_id = User.get_by_id
+    def get_and_revoke(user_id):
+        user = get_by_id(user_id)
+        revoke_user_sessions(user_id)
+        return user
+    monkeypatch.setattr(User, 'get_by_id', staticmethod(get_and_revoke))
+    client.get('/api/tasks', headers=headers)
+    monkeypatch.undo()
+
+    assert not redis_client.client.keys('principal:*')
+    assert client.get('/api/tasks', headers=headers).status_code == 401
+
+def test_legacy_token_sessions_are_accepted_until_revoked(app, client, cleanup):
+    client.post('/api/auth/register', json={
+        'email': 'test@example.com',
+        'password': 'test123'
+    })
+    user = mongo.db.users.find_one()
+
+    def legacy_login():
+        # A token and session as stored before sessions were keyed by jti
+        expires_at = datetime.now(timezone.utc) + timedelta(days=1)
+        token = jwt.encode({
+            'sub': str(user['_id']), 'email': user['email'], 'role': 'user', 'exp': expires_at
+        }, app.config['JWT_SECRET_KEY'], algorithm='HS256')
+        redis_client.client.setex(f'token:{token}', 86400, json.dumps({'user_id': str(user['_id'])}))
+        redis_client.client.zadd('sessions:active', {token: expires_at.timestamp()})
+        return {'Authorization': f'Bearer {token}'}
+
+    headers = legacy_login()
+    assert client.get('/api/tasks', headers=headers).status_code == 200
+    assert json.loads(client.get('/api/metrics').data)['active_sessions'] == 1
+    assert client.post('/api/auth/logout', headers=headers).status_code == 200
+    assert client.get('/api/tasks', headers=headers).status_code == 401
+    assert not redis_client.client.keys('token:*')
+    assert json.loads(client.get('/api/metrics').data)['active_sessions'] == 0
+
+    # Legacy sessions aren't indexed per user: a password reset ends them all the same
+    headers = legacy_login()
+    assert client.get('/api/tasks', headers=headers).status_code == 200
+    redis_client.client.setex('reset:reset-token', 300, 'test@example.com')
+    client.post('/api/auth/reset-password/reset-token', json={'new_password': 'changed'})
+    assert client.get('/api/tasks', headers=headers).status_code == 401
@@ -0,0 +1,62 @@
+import pytest
+from app.cache import FillLock, LocalCache
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+@pytest.fixture
+def cache():
+    cache = LocalCache()
+    cache.enabled = True
+    cache.max_entries = 2
+    cache.max_bytes = 100
+    # Don't start the pub/sub listener thread
+    cache._ensure_listener = lambda: None
+    return cache
+
+def test_evicts_least_recently_used(cache):
+    cache.set('a', 1, 10, cache.generation)
+    cache.set('b', 2, 10, cache.generation)
+    assert cache.get('a') == 1
+    cache.set('c', 3, 10, cache.generation)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+def test_evicts_over_memory_limit(cache):
+    cache.set('a', 1, 60, cache.generation)
+    cache.set('b', 2, 60, cache.generation)
+
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+def test_expired_entries_are_misses(cache):
+    cache.ttl = -1
+    cache.set('a', 1, 10, cache.generation)
+    assert cache.get('a') is None
+
+def test_stale_value_is_not_stored_after_invalidation(cache):
+    redis_conn = FakeRedis()
+    generation = cache.generation
+    cache.invalidate(redis_conn, 'a')
+    cache.set('a', 'stale', 10, generation)
+
+    assert cache.get('a') is None
+    assert redis_conn.published == [('cache:invalidate', '["a"]')]
+
+def test_refresh_early_grows_likelier_near_expiry(monkeypatch):
+    fill_lock = FillLock(redis_client=None)
+    monkeypatch.setattr('random.random', lambda: 0.5)
+    # -ln(0.5) * 100ms ~ 69ms ahead of the expiry
+    assert not fill_lock.refresh_early(ttl_ms=1000, delta_ms=100)
+    assert fill_lock.refresh_early(ttl_ms=50, delta_ms=100)
+    assert not fill_lock.refresh_early(ttl_ms=-1, delta_ms=100)
+    assert not fill_lock.refresh_early(ttl_ms=50, delta_ms=0)
+
+    fill_lock.beta = 0
+    assert not fill_lock.refresh_early(ttl_ms=50, delta_ms=100)
@@ -0,0 +1,29 @@
+import pytest
+from app.hashing import PasswordHasher, PasswordHasherBusy
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher()
+    hasher.rounds = 4
+    hasher.workers = 1
+    hasher.max_pending = 1
+    return hasher
+
+def test_hash_and_check(hasher):
+    hashed = hasher.hash('secret')
+    assert hasher.check('secret', hashed)
+    assert not hasher.check('wrong', hashed)
+
+def test_needs_rehash_when_work_factor_changes(hasher):
+    hashed = hasher.hash('secret')
+    assert not hasher.needs_rehash(hashed)
+    hasher.rounds = 5
+    assert hasher.needs_rehash(hashed)
+
+def test_sheds_when_queue_is_full(hasher):
+    hasher._get_executor()
+    hasher._slots.acquire()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('secret')
+    hasher._slots.release()
+    assert hasher.check('secret', hasher.hash('secret'))
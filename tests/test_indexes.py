@@ -0,0 +1,78 @@
+from app.indexes import INDEXES, OBSOLETE_INDEXES, _canonical_queries, check_query_plans, ensure_indexes
+
+class FakeCursor:
+    def __init__(self, collection, query):
+        self.collection = collection
+        self.query = query
+        self.sort_spec = []
+
+    def sort(self, sort_spec):
+        self.sort_spec = sort_spec
+        return self
+
+    def limit(self, limit):
+        return self
+
+    def explain(self):
+        return {'queryPlanner': {'winningPlan': self.collection.plan(self)}}
+
+class FakeCollection:
+    def __init__(self, existing=()):
+        self.created = []
+        self.dropped = []
+        self.existing = list(existing)
+        self.plan = lambda cursor: {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}
+
+    def create_indexes(self, indexes):
+        self.created.extend(indexes)
+        return [index.document['name'] for index in indexes]
+
+    def index_information(self):
+        return {name: {} for name in ['_id_', *self.existing]}
+
+    def drop_index(self, name):
+        self.dropped.append(name)
+
+    def find(self, query, projection=None):
+        return FakeCursor(self, query)
+
+class FakeDb(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+def fake_db(**existing):
+    return FakeDb({name: FakeCollection(existing.get(name, ())) for name in ('tasks', 'users')})
+
+def test_ensure_indexes_creates_declared_and_drops_obsolete():
+    db = fake_db(tasks=['status', 'user_id_status_created_at', 'user_id_created_at'])
+    names = ensure_indexes(db)
+
+    assert names == [index.document['name'] for indexes in INDEXES.values() for index in indexes]
+    assert db.tasks.created == INDEXES['tasks']
+    assert db.tasks.dropped == OBSOLETE_INDEXES['tasks']
+    assert db.users.dropped == []
+
+def test_sorted_canonical_queries_have_a_matching_index():
+    keys = [list(index.document['key'].items()) for index in INDEXES['tasks']]
+    for name, cursor in _canonical_queries(fake_db()).items():
+        if not cursor.sort_spec:
+            continue
+        # Equality fields first, in any order, then the sort keys with the _id tie-breaker
+        equality = {field for field, value in cursor.query.items() if not isinstance(value, dict)} - {'_id'}
+        assert any(
+            {field for field, _ in key[:len(equality)]} == equality
+            and key[len(equality):len(equality) + len(cursor.sort_spec)] == cursor.sort_spec
+            for key in keys
+        ), name
+
+def test_check_query_plans_reports_blocking_sorts_and_collscans():
+    db = fake_db()
+    assert check_query_plans(db) == []
+
+    db.tasks.plan = lambda cursor: (
+        {'stage': 'SORT', 'inputStage': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}
+        if 'status' in cursor.query and not cursor.sort_spec[0][0] == 'due_date'
+        else {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}
+    )
+    db.users.plan = lambda cursor: {'stage': 'COLLSCAN'}
+    assert check_query_plans(db) == ['tasks by user and status', 'user by email']
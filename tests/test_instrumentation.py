@@ -0,0 +1,137 @@
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from flask import Flask
+from prometheus_client import REGISTRY
+from prometheus_flask_exporter import PrometheusMetrics
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route, Router
+from app.aio.middleware import RequestMetricsMiddleware
+from app.extensions import instrumentation
+from app.instrumentation import (
+    CommandTimer, Instrumentation, RequestTimings, current_timings, instrument_async_redis, instrument_redis, record
+)
+
+class FakePipeline:
+    transaction = False
+
+    def execute(self):
+        return []
+
+class FakeRedis:
+    def execute_command(self, *args, **options):
+        return None
+
+    def get(self, key):
+        return self.execute_command('GET', key)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline()
+
+class FakeAsyncPipeline:
+    is_transaction = True
+
+    async def execute(self):
+        return []
+
+class FakeAsyncRedis:
+    async def execute_command(self, *args, **options):
+        return None
+
+    async def get(self, key):
+        return await self.execute_command('GET', key)
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline()
+
+@pytest.fixture
+def timings():
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    yield timings
+    current_timings.reset(token)
+
+def test_redis_round_trips_are_counted_per_command(timings):
+    client = instrument_redis(FakeRedis())
+    client.get('a')
+    client.get('b')
+    client.pipeline().execute()
+
+    assert timings.commands[('redis', 'GET')][0] == 2
+    assert timings.commands[('redis', 'PIPELINE')][0] == 1
+    assert timings.totals('redis')[0] == 3
+
+def test_async_redis_round_trips_are_counted_per_command(timings):
+    client = instrument_async_redis(FakeAsyncRedis())
+
+    async def requests():
+        await client.get('a')
+        await client.pipeline().execute()
+    asyncio.run(requests())
+
+    assert timings.commands[('redis', 'GET')][0] == 1
+    assert timings.commands[('redis', 'MULTI')][0] == 1
+
+def test_mongo_commands_are_timed(timings):
+    CommandTimer().succeeded(SimpleNamespace(command_name='find', duration_micros=1500))
+    assert timings.commands[('mongo', 'find')] == [1, 0.0015]
+
+def test_server_timing_header_and_slow_request_log(caplog):
+    app = Flask(__name__)
+    app.config.update(SERVER_TIMING_HEADER=True, SLOW_REQUEST_MS=1)
+    Instrumentation().init_app(app)
+
+    @app.route('/slow')
+    def slow():
+        record('redis', 'GET', 0.002)
+        time.sleep(0.002)
+        return 'ok'
+
+    response = app.test_client().get('/slow')
+    assert 'redis;dur=2.00;desc="1 round trips"' in response.headers['Server-Timing']
+    assert 'mongo;dur=0.00;desc="0 round trips"' in response.headers['Server-Timing']
+    assert 'redis GET x1 2.0ms' in caplog.text
+    assert current_timings.get() is None
+
+def asgi_get(app, path):
+    """The response start message of a GET request to an ASGI app."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'root_path': '', 'query_string': b'', 'headers': []
+    }
+    asyncio.run(app(scope, receive, send))
+    return messages[0]
+
+def test_asgi_routes_are_instrumented(monkeypatch):
+    flask_app = Flask(__name__)
+    PrometheusMetrics(flask_app)
+    monkeypatch.setattr(instrumentation, 'server_timing', True)
+
+    async def native(request):
+        record('redis', 'GET', 0.002)
+        return PlainTextResponse('ok')
+
+    routes = [Route('/native', native, name='native.get')]
+    router = Router(routes=[*routes, Mount('/', app=PlainTextResponse('flask'))])
+    app = RequestMetricsMiddleware(router, routes=routes, flask_app=flask_app)
+    labels = {'method': 'GET', 'status': '200'}
+    requests = REGISTRY.get_sample_value('flask_http_request_total', labels) or 0
+    round_trips = {'service': 'redis', 'endpoint': 'native.get'}
+
+    headers = dict(asgi_get(app, '/native')['headers'])
+    assert b'redis;dur=2.00;desc="1 round trips"' in headers[b'server-timing']
+    assert REGISTRY.get_sample_value('flask_http_request_total', labels) == requests + 1
+    assert REGISTRY.get_sample_value('db_round_trips_per_request_sum', round_trips) == 1
+
+    # Requests the mounted Flask app serves are left to its own hooks
+    assert b'server-timing' not in dict(asgi_get(app, '/flask')['headers'])
+    assert REGISTRY.get_sample_value('flask_http_request_total', labels) == requests + 1
+    assert current_timings.get() is None
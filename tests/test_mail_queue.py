@@ -0,0 +1,100 @@
+import socketserver
+import threading
+import pytest
+from app.extensions import redis_client, mail_queue
+from app.mail_queue import DEAD_KEY, QUEUE_KEY, RETRY_KEY
+import json
+
+pytestmark = pytest.mark.usefixtures('app_context')
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: records messages, optionally refuses recipients."""
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply(b'220 localhost')
+        while True:
+            command = self.rfile.readline()[:4].upper()
+            if not command:
+                return
+            if command == b'RCPT' and self.server.refuse:
+                self.reply(b'550 No such user')
+            elif command == b'DATA':
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for line in iter(self.rfile.readline, b'.\r\n'):
+                    lines.append(line)
+                self.server.messages.append(b''.join(lines))
+                self.reply(b'250 OK')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            else:
+                self.reply(b'250 OK')
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.refuse = False
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPStandIn()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def config(config, smtp_server):
+    class MailConfig(config):
+        MAIL_SERVER = '127.0.0.1'
+        MAIL_PORT = smtp_server.server_address[1]
+        MAIL_USE_TLS = False
+        MAIL_SUPPRESS_SEND = False
+        MAIL_USERNAME = None
+        MAIL_DEFAULT_SENDER = 'noreply@example.com'
+        MAIL_MAX_ATTEMPTS = 2
+
+    return MailConfig
+
+def test_password_reset_is_queued_and_sent_in_one_connection(client, smtp_server, cleanup):
+    client.post('/api/auth/register', json={'email': 'test@example.com', 'password': 'test123'})
+
+    for email in ('test@example.com', 'nobody@example.com', 'test@example.com'):
+        response = client.post('/api/auth/reset-password', json={'email': email})
+        assert response.status_code == 200
+    assert redis_client.client.llen(QUEUE_KEY) == 3
+    assert smtp_server.messages == []
+
+    assert mail_queue.process_batch('test') == 3
+    assert smtp_server.connections == 1
+    assert len(smtp_server.messages) == 2
+    assert b'reset-password/' in smtp_server.messages[0]
+    assert len(redis_client.client.keys('reset:*')) == 2
+    assert redis_client.client.llen(QUEUE_KEY) == 0
+
+def test_failed_delivery_is_retried_then_dead_lettered(app, smtp_server, cleanup):
+    smtp_server.refuse = True
+    mail_queue.enqueue('message', subject='Hello', recipients=['test@example.com'], body='Hi')
+
+    mail_queue.process_batch('test')
+    (job, retry_at), = redis_client.client.zrange(RETRY_KEY, 0, -1, withscores=True)
+    assert json.loads(job)['attempts'] == 1
+
+    # Not due yet
+    assert mail_queue.process_batch('test') == 0
+
+    redis_client.client.zadd(RETRY_KEY, {job: 0})
+    assert mail_queue.process_batch('test') == 1
+    assert redis_client.client.zcard(RETRY_KEY) == 0
+    dead = json.loads(redis_client.client.lindex(DEAD_KEY, 0))
+    assert dead['attempts'] == 2
+    assert smtp_server.messages == []
@@ -0,0 +1,100 @@
+import json
+import pytest
+from app import create_app
+from app.extensions import mongo, rate_limiter, redis_client
+from app.rate_limit import forwarded_client_ip, parse_limit
+
+@pytest.fixture
+def config(config):
+    class RateLimitConfig(config):
+        RATE_LIMIT_AUTH_IP = '5/60'
+        RATE_LIMIT_AUTH_EMAIL = '2/60'
+        RATE_LIMIT_TASK_WRITES = '3/30'
+
+    return RateLimitConfig
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(rate_limiter, 1733043600.0)
+
+def login(client, email, password='test123', ip='10.0.0.1'):
+    return client.post('/api/auth/login', json={'email': email, 'password': password},
+                       environ_base={'REMOTE_ADDR': ip})
+
+def test_parse_limit():
+    assert parse_limit('30/60') == (30, 0.5)
+    assert parse_limit('10') == (10, 10.0)
+    with pytest.raises(ValueError):
+        parse_limit('0/60')
+
+def test_login_is_limited_by_email_and_ip(client, clock, cleanup):
+    assert login(client, 'a@example.com').status_code == 401
+    assert login(client, 'A@example.com ', ip='10.0.0.2').status_code == 401
+    response = login(client, 'a@example.com', ip='10.0.0.3')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+    assert json.loads(response.data) == {'error': 'Too many requests'}
+
+    # Another account from the same address is only held by the IP limit
+    assert login(client, 'b@example.com').status_code == 401
+    assert login(client, 'c@example.com').status_code == 401
+    assert login(client, 'd@example.com').status_code == 401
+    assert login(client, 'e@example.com').status_code == 401
+    assert login(client, 'f@example.com').status_code == 429
+    assert login(client, 'f@example.com', ip='10.0.0.4').status_code == 401
+
+    clock.advance(30)
+    assert login(client, 'a@example.com', ip='10.0.0.5').status_code == 401
+
+def test_task_writes_are_limited_per_user(client, clock, cleanup):
+    client.post('/api/auth/register', json={'email': 'test@example.com', 'password': 'test123'})
+    token = json.loads(login(client, 'test@example.com').data)['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    task = {'title': 'Task', 'description': 'Description'}
+
+    for _ in range(3):
+        assert client.post('/api/tasks', headers=headers, json=task).status_code == 201
+    response = client.post('/api/tasks', headers=headers, json=task)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '10'
+    assert mongo.db.tasks.count_documents({}) == 3
+
+    # Reads are not limited
+    assert client.get('/api/tasks', headers=headers).status_code == 200
+
+    clock.advance(10)
+    assert client.post('/api/tasks', headers=headers, json=task).status_code == 201
+    assert client.post('/api/tasks', headers=headers, json=task).status_code == 429
+
+def test_limits_can_be_disabled(app, client, clock, cleanup):
+    app.config['RATE_LIMIT_ENABLED'] = False
+    rate_limiter.init_app(app)
+    for _ in range(3):
+        assert login(client, 'a@example.com').status_code == 401
+    assert redis_client.client.keys('ratelimit:*') == []
+
+def test_client_ip_is_taken_from_trusted_proxies(config, clock, cleanup):
+    class ProxiedConfig(config):
+        RATE_LIMIT_AUTH_IP = '2/60'
+        RATE_LIMIT_AUTH_EMAIL = '100/60'
+        PROXY_FIX_X_FOR = 1
+
+    client = create_app(ProxiedConfig).test_client()
+    def login_via_proxy(email, forwarded_for):
+        return client.post('/api/auth/login', json={'email': email, 'password': 'test123'},
+                           headers={'X-Forwarded-For': forwarded_for}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+
+    # Every request comes from the proxy: the clients are told apart by the address it appended
+    assert login_via_proxy('a@example.com', '203.0.113.1').status_code == 401
+    assert login_via_proxy('b@example.com', '203.0.113.1').status_code == 401
+    assert login_via_proxy('c@example.com', '203.0.113.1').status_code == 429
+    assert login_via_proxy('c@example.com', '203.0.113.2').status_code == 401
+    # An address the client put in front of the proxy's is not trusted
+    assert login_via_proxy('d@example.com', '198.51.100.7, 203.0.113.1').status_code == 429
+
+def test_forwarded_client_ip():
+    assert forwarded_client_ip('10.0.0.1', '203.0.113.1, 10.0.0.2', 0) == '10.0.0.1'
+    assert forwarded_client_ip('10.0.0.1', '203.0.113.1, 10.0.0.2', 1) == '10.0.0.2'
+    assert forwarded_client_ip('10.0.0.1', '203.0.113.1, 10.0.0.2', 2) == '203.0.113.1'
+    assert forwarded_client_ip('10.0.0.1', '203.0.113.1', 2) == '10.0.0.1'
+    assert forwarded_client_ip('10.0.0.1', None, 1) == '10.0.0.1'
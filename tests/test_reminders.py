@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+import json
+import pytest
+from app.extensions import mongo, redis_client, reminder_scheduler
+from app.mail_queue import QUEUE_KEY
+from app.reminders import DUE_KEY, LEASED_KEY, ReminderScheduler
+
+pytestmark = pytest.mark.usefixtures('app_context')
+
+@pytest.fixture
+def config(config):
+    class ReminderConfig(config):
+        REMINDER_LEAD_SECONDS = 3600
+        REMINDER_LEASE_SECONDS = 60
+
+    return ReminderConfig
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(reminder_scheduler, datetime(2024, 12, 1, 9, 0, tzinfo=timezone.utc).timestamp())
+
+def create_task(client, headers, title, due_date):
+    response = client.post('/api/tasks', headers=headers, json={
+        'title': title, 'description': 'Description', 'due_date': due_date
+    })
+    return json.loads(response.data)['id']
+
+def queued_messages():
+    return [json.loads(job)['payload'] for job in redis_client.client.lrange(QUEUE_KEY, 0, -1)]
+
+def test_task_writes_schedule_reminders(client, auth_headers, clock, cleanup):
+    task_id = create_task(client, auth_headers, 'Report', '2024-12-01T12:00:00Z')
+    remind_at = datetime(2024, 12, 1, 11, 0, tzinfo=timezone.utc).timestamp()
+    assert redis_client.client.zscore(DUE_KEY, task_id) == remind_at
+
+    client.put(f'/api/tasks/{task_id}', headers=auth_headers, json={'due_date': '2024-12-02T12:00:00Z'})
+    assert redis_client.client.zscore(DUE_KEY, task_id) == remind_at + 86400
+
+    client.put(f'/api/tasks/{task_id}', headers=auth_headers, json={'status': 'done'})
+    assert redis_client.client.zscore(DUE_KEY, task_id) is None
+
+    # Already within the lead time
+    task_id = create_task(client, auth_headers, 'Soon', '2024-12-01T09:30:00Z')
+    assert redis_client.client.zscore(DUE_KEY, task_id) is None
+
+    task_id = create_task(client, auth_headers, 'Later', '2024-12-05T12:00:00Z')
+    client.delete(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert redis_client.client.zcard(DUE_KEY) == 0
+
+def test_due_reminders_are_mailed_in_one_message_per_user(client, auth_headers, clock, cleanup):
+    create_task(client, auth_headers, 'Report', '2024-12-01T12:00:00Z')
+    create_task(client, auth_headers, 'Slides', '2024-12-01T11:30:00Z')
+    create_task(client, auth_headers, 'Next week', '2024-12-08T12:00:00Z')
+
+    assert reminder_scheduler.process_batch() == 0
+
+    clock.advance(3 * 3600)
+    assert reminder_scheduler.process_batch() == 2
+    message, = queued_messages()
+    assert message['recipients'] == ['test@example.com']
+    assert message['subject'] == '2 tasks due soon'
+    assert message['body'].index('Slides') < message['body'].index('Report')
+    assert redis_client.client.zcard(DUE_KEY) == 1
+    assert redis_client.client.zcard(LEASED_KEY) == 0
+
+    # Sent reminders are not scheduled again by later writes
+    assert reminder_scheduler.process_batch() == 0
+
+def test_claims_expire_for_other_schedulers(app, client, auth_headers, clock, cleanup):
+    task_id = create_task(client, auth_headers, 'Report', '2024-12-01T12:00:00Z')
+    other = ReminderScheduler(redis_client, mongo, reminder_scheduler.mail_queue, clock=clock)
+    other.init_app(app)
+    clock.advance(2 * 3600)
+
+    task_ids, _ = reminder_scheduler.claim()
+    assert task_ids == [task_id]
+    # The first scheduler dies before sending: the reminder stays leased until the claim expires
+    assert other.process_batch() == 0
+    clock.advance(61)
+    assert other.process_batch() == 1
+    assert len(queued_messages()) == 1
+    assert redis_client.client.zcard(LEASED_KEY) == 0
+
+def test_rescheduled_task_is_skipped_when_claimed(client, auth_headers, clock, cleanup):
+    task_id = create_task(client, auth_headers, 'Report', '2024-12-01T12:00:00Z')
+    clock.advance(2 * 3600)
+    task_ids, _ = reminder_scheduler.claim()
+
+    mongo.db.tasks.update_one({'_id': mongo.db.tasks.find_one()['_id']}, {'$set': {
+        'due_date': datetime(2024, 12, 3, 12, 0)
+    }})
+    assert reminder_scheduler.reminder_messages(task_ids) == ([], 0)
+    assert task_ids == [task_id]
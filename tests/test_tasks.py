@@ -0,0 +1,604 @@
+import pytest
+from app.extensions import fill_lock, instrumentation, local_cache, mongo, redis_client
+from app.models import stats as stats_module, task as task_module
+from app.models.stats import TaskStats
+from app.models.task import Task, TaskCacheCodec
+from bson import ObjectId
+import csv
+from datetime import datetime, timedelta, timezone
+import gzip
+import io
+import json
+import os
+import threading
+import time
+
+def create_tasks(client, headers, count, **fields):
+    for i in range(count):
+        client.post('/api/tasks', headers=headers, json={
+            'title': f'Task {i}',
+            'description': 'Description',
+            'due_date': f'2024-12-{i + 1:02d}T12:00:00Z',
+            **fields
+        })
+
+def test_get_tasks_paginates_with_cursor(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 5)
+
+    response = client.get('/api/tasks?limit=2', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers['X-Total-Count'] == '5'
+    titles = [task['title'] for task in json.loads(response.data)]
+
+    while 'X-Next-Cursor' in response.headers:
+        response = client.get(
+            f"/api/tasks?limit=2&after={response.headers['X-Next-Cursor']}",
+            headers=auth_headers
+        )
+        titles += [task['title'] for task in json.loads(response.data)]
+
+    assert titles == [f'Task {i}' for i in range(5)]
+
+def test_get_tasks_filters_and_sorts(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 3, status='done')
+    create_tasks(client, auth_headers, 2, status='todo')
+
+    response = client.get('/api/tasks?status=done&sort=due_date&order=desc', headers=auth_headers)
+    data = json.loads(response.data)
+    assert response.headers['X-Total-Count'] == '3'
+    assert [task['title'] for task in data] == ['Task 2', 'Task 1', 'Task 0']
+
+    response = client.get(
+        '/api/tasks?due_from=2024-12-02T00:00:00Z&due_to=2024-12-03T00:00:00Z',
+        headers=auth_headers
+    )
+    assert len(json.loads(response.data)) == 2
+
+def test_get_tasks_invalid_cursor(client, auth_headers, cleanup):
+    response = client.get('/api/tasks?after=not-a-cursor', headers=auth_headers)
+    assert response.status_code == 400
+
+def test_cached_responses_match_uncached(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 3)
+
+    uncached = client.get('/api/tasks?limit=2', headers=auth_headers)
+    cached = client.get('/api/tasks?limit=2', headers=auth_headers)
+    assert cached.data == uncached.data
+    assert cached.headers['X-Next-Cursor'] == uncached.headers['X-Next-Cursor']
+    assert cached.headers['X-Total-Count'] == '3'
+
+    task_id = json.loads(uncached.data)[0]['id']
+    uncached = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    cached = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert cached.data == uncached.data
+    assert json.loads(cached.data)['title'] == 'Task 0'
+
+def test_non_ascii_text_round_trips(client, auth_headers, cleanup):
+    title = 'Café ☕ 日本語'
+    create_tasks(client, auth_headers, 1, title=title, status='todo')
+
+    for url in ('/api/tasks', '/api/tasks?status=todo'):
+        uncached = client.get(url, headers=auth_headers)
+        cached = client.get(url, headers=auth_headers)
+        assert cached.data == uncached.data
+        assert title.encode('utf-8') in cached.data
+        assert json.loads(cached.data)[0]['title'] == title
+
+    task_id = json.loads(cached.data)[0]['id']
+    uncached = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    cached = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert cached.data == uncached.data
+    assert json.loads(cached.data)['title'] == title
+
+def page_tasks(user_id):
+    """The first page of the user's tasks in the default order, as the list route reads it."""
+    return json.loads(Task.get_user_tasks_page_json(user_id, 50)[0])
+
+def test_user_tasks_cache_is_patched_in_place(app, client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 2)
+
+    with app.app_context():
+        user_id = mongo.db.tasks.find_one()['user_id']
+        assert len(page_tasks(user_id)) == 2
+        assert redis_client.client.hlen(f'tasks:{user_id}:items') == 4
+        version = int(redis_client.client.get(f'tasks:{user_id}:version'))
+
+        create_tasks(client, auth_headers, 1)
+        first, second, _ = page_tasks(user_id)
+        client.put(f"/api/tasks/{first['id']}", headers=auth_headers, json={'title': 'Renamed'})
+        client.delete(f"/api/tasks/{second['id']}", headers=auth_headers)
+
+        # The deleted task leaves a tombstone
+        cached = redis_client.client.hgetall(f'tasks:{user_id}:items')
+        assert len(cached) == 5
+        assert [task['title'] for task in page_tasks(user_id)] == ['Renamed', 'Task 0']
+        assert int(redis_client.client.get(f'tasks:{user_id}:version')) == version + 3
+
+def test_late_list_patches_do_not_undo_later_writes(app, client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 2)
+    first, second = json.loads(client.get('/api/tasks', headers=auth_headers).data)
+    with app.app_context():
+        # Read before the writes below, flushed after them
+        stale = [Task(**mongo.db.tasks.find_one({'_id': ObjectId(task['id'])})) for task in (first, second)]
+        user_id = first['user_id']
+        redis_client.client.set(f'tasks:{user_id}', b'[]')
+
+    client.put(f"/api/tasks/{first['id']}", headers=auth_headers, json={'title': 'Renamed'})
+    client.delete(f"/api/tasks/{second['id']}", headers=auth_headers)
+    with app.app_context():
+        assert not redis_client.client.exists(f'tasks:{user_id}')
+        for task in stale:
+            task.title = 'Stale'
+            task._sync_caches(before=(task.status, task.due_date))
+
+    response = client.get('/api/tasks', headers=auth_headers)
+    assert [task['title'] for task in json.loads(response.data)] == ['Renamed']
+
+def read_pages(client, headers, url):
+    pages = [client.get(url, headers=headers)]
+    while 'X-Next-Cursor' in pages[-1].headers:
+        pages.append(client.get(f"{url}&after={pages[-1].headers['X-Next-Cursor']}", headers=headers))
+    return pages
+
+def test_task_list_is_served_from_the_patched_cache(client, auth_headers, cleanup, monkeypatch):
+    create_tasks(client, auth_headers, 3)
+    first = json.loads(client.get('/api/tasks', headers=auth_headers).data)[0]
+    client.put(f"/api/tasks/{first['id']}", headers=auth_headers, json={'title': 'Renamed'})
+    create_tasks(client, auth_headers, 1, title='Task 3')
+
+    reads = []
+    read_user_list = Task._read_user_list
+    monkeypatch.setattr(Task, '_read_user_list', classmethod(
+        lambda cls, user_id: reads.append(user_id) or read_user_list(user_id)
+    ))
+    cached = {}
+    for order in ('asc', 'desc'):
+        pages = read_pages(client, auth_headers, f'/api/tasks?limit=3&order={order}')
+        assert all(page.headers['X-Total-Count'] == '4' for page in pages)
+        cached[order] = [page.data for page in pages]
+    assert reads == []
+    titles = [task['title'] for body in cached['asc'] for task in json.loads(body)]
+    assert titles == ['Renamed', 'Task 1', 'Task 2', 'Task 3']
+    assert [task['title'] for body in cached['desc'] for task in json.loads(body)] == titles[::-1]
+
+    # The patched cache serves the bytes a reload from Mongo does
+    user_id = mongo.db.tasks.find_one()['user_id']
+    for order in ('asc', 'desc'):
+        redis_client.client.delete(f'tasks:{user_id}:items', f'tasks:{user_id}:order')
+        pages = read_pages(client, auth_headers, f'/api/tasks?limit=3&order={order}')
+        assert [page.data for page in pages] == cached[order]
+    assert len(reads) == 2
+
+def test_conditional_get_returns_not_modified(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 2)
+
+    response = client.get('/api/tasks', headers=auth_headers)
+    etag = response.headers['ETag']
+    response = client.get('/api/tasks', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    # Another page of the same list has its own ETag
+    response = client.get('/api/tasks?limit=1', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+
+    create_tasks(client, auth_headers, 1)
+    response = client.get('/api/tasks', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+    task_id = json.loads(response.data)[0]['id']
+    etag = client.get(f'/api/tasks/{task_id}', headers=auth_headers).headers['ETag']
+    response = client.get(f'/api/tasks/{task_id}', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_update_honors_if_match(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 1)
+    task = json.loads(client.get('/api/tasks', headers=auth_headers).data)[0]
+    etag = client.get(f"/api/tasks/{task['id']}", headers=auth_headers).headers['ETag']
+
+    response = client.put(f"/api/tasks/{task['id']}", headers={**auth_headers, 'If-Match': etag}, json={
+        'title': 'First'
+    })
+    assert response.status_code == 200
+
+    response = client.put(f"/api/tasks/{task['id']}", headers={**auth_headers, 'If-Match': etag}, json={
+        'title': 'Second'
+    })
+    assert response.status_code == 412
+    assert json.loads(client.get(f"/api/tasks/{task['id']}", headers=auth_headers).data)['title'] == 'First'
+
+    response = client.put(f"/api/tasks/{task['id']}", headers={**auth_headers, 'If-Match': '*'}, json={
+        'title': 'Third'
+    })
+    assert response.status_code == 200
+    assert json.loads(response.data)['version'] == 2
+    assert response.headers['ETag'] == '"2"'
+    response = client.delete(f"/api/tasks/{task['id']}", headers=auth_headers)
+    assert response.status_code == 200
+    response = client.put(f"/api/tasks/{task['id']}", headers={**auth_headers, 'If-Match': '"2"'}, json={
+        'title': 'Fourth'
+    })
+    assert response.status_code == 412
+
+def test_export_streams_ndjson_and_csv(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 3)
+
+    response = client.get('/api/tasks/export', headers=auth_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.data.decode('utf-8').splitlines()
+    assert [json.loads(line)['title'] for line in lines] == ['Task 0', 'Task 1', 'Task 2']
+
+    response = client.get('/api/tasks/export?format=csv', headers={**auth_headers, 'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.data).decode('utf-8'))))
+    assert [row['title'] for row in rows] == ['Task 0', 'Task 1', 'Task 2']
+    assert rows[0]['due_date'] == '2024-12-01T12:00:00'
+
+def test_import_reports_errors_per_line(app, client, auth_headers, cleanup):
+    app.config['TASKS_IMPORT_CHUNK_SIZE'] = 2
+    create_tasks(client, auth_headers, 1)
+    client.get('/api/tasks', headers=auth_headers)  # fill the list cache
+
+    lines = [
+        json.dumps({'title': f'Imported {i}', 'description': 'D', 'status': 'todo', 'due_date': '2024-12-31T12:00:00Z'})
+        for i in range(3)
+    ]
+    lines.insert(1, '{not json')
+    lines.append(json.dumps({'title': 'No status', 'description': 'D', 'due_date': '2024-12-31T12:00:00Z'}))
+    body = gzip.compress('\n'.join(lines).encode('utf-8'))
+
+    response = client.post('/api/tasks/import', data=body, headers={
+        **auth_headers, 'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'
+    })
+    report = json.loads(response.data)
+    assert report['imported'] == 3
+    assert report['failed'] == 2
+    assert [error['line'] for error in report['errors']] == [2, 5]
+
+    response = client.get('/api/tasks', headers=auth_headers)
+    assert response.headers['X-Total-Count'] == '4'
+    summary = json.loads(client.get('/api/tasks/summary', headers=auth_headers).data)
+    assert summary['by_status'] == {'todo': 3, 'pending': 1}
+
+def test_truncated_import_keeps_what_was_imported(app, client, auth_headers, cleanup):
+    app.config['TASKS_IMPORT_CHUNK_SIZE'] = 10
+    create_tasks(client, auth_headers, 1)
+    client.get('/api/tasks', headers=auth_headers)  # fill the list cache
+
+    # Incompressible descriptions, so that half of the body holds many lines
+    lines = [
+        json.dumps({
+            'title': f'Imported {i}', 'description': os.urandom(100).hex(), 'status': 'todo',
+            'due_date': '2024-12-31T12:00:00Z'
+        })
+        for i in range(200)
+    ]
+    body = gzip.compress('\n'.join(lines).encode('utf-8'))
+
+    response = client.post('/api/tasks/import', data=body[:len(body) // 2], headers={
+        **auth_headers, 'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip'
+    })
+    assert response.status_code == 400
+    report = json.loads(response.data)
+    assert report['error'] == 'Invalid gzip body'
+    assert 0 < report['imported'] < 200
+    assert mongo.db.tasks.count_documents({}) == report['imported'] + 1
+
+    response = client.get('/api/tasks', headers=auth_headers)
+    assert response.headers['X-Total-Count'] == str(report['imported'] + 1)
+
+def test_import_command(app, client, auth_headers, cleanup, tmp_path):
+    path = tmp_path / 'tasks.ndjson'
+    path.write_text(json.dumps({
+        'title': 'From file', 'description': 'D', 'status': 'done', 'due_date': '2024-12-31T12:00:00Z', 'user_id': 'u1'
+    }) + '\n')
+
+    result = app.test_cli_runner().invoke(args=['import-tasks', str(path)])
+    assert 'Imported 1 tasks, 0 failed' in result.output
+    assert mongo.db.tasks.find_one({'user_id': 'u1'})['title'] == 'From file'
+
+def test_batch_applies_mixed_operations(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 2)
+    first, second = json.loads(client.get('/api/tasks', headers=auth_headers).data)
+
+    response = client.post('/api/tasks/batch', headers=auth_headers, json={'operations': [
+        {'op': 'create', 'data': {
+            'title': 'New', 'description': 'D', 'status': 'todo', 'due_date': '2024-12-31T12:00:00Z'
+        }},
+        {'op': 'update', 'id': first['id'], 'data': {'status': 'done'}},
+        {'op': 'delete', 'id': second['id']},
+        {'op': 'delete', 'id': str(ObjectId())},
+        {'op': 'create', 'data': {'title': 'Missing fields'}},
+    ]})
+    assert response.status_code == 200
+    results = json.loads(response.data)['results']
+    assert [result['status'] for result in results] == [201, 200, 200, 404, 400]
+    assert results[1]['task']['status'] == 'done'
+
+    tasks = json.loads(client.get('/api/tasks', headers=auth_headers).data)
+    assert sorted(task['title'] for task in tasks) == ['New', 'Task 0']
+
+def test_batch_reports_tasks_deleted_concurrently(client, auth_headers, cleanup, monkeypatch):
+    create_tasks(client, auth_headers, 2, status='todo')
+    first, second = json.loads(client.get('/api/tasks', headers=auth_headers).data)
+    client.get('/api/tasks/summary', headers=auth_headers)
+
+    collection = type(mongo.db.tasks)
+    bulk_write = collection.bulk_write
+    def delete_first(self, requests, **kwargs):
+        self.delete_one({'_id': ObjectId(first['id'])})
+        return bulk_write(self, requests, **kwargs)
+    monkeypatch.setattr(collection, 'bulk_write', delete_first)
+
+    response = client.post('/api/tasks/batch', headers=auth_headers, json={'operations': [
+        {'op': 'update', 'id': first['id'], 'data': {'status': 'done'}},
+        {'op': 'update', 'id': second['id'], 'data': {'status': 'done'}},
+    ]})
+    results = json.loads(response.data)['results']
+    assert [result['status'] for result in results] == [404, 200]
+    # Only the update that was applied is counted
+    summary = json.loads(client.get('/api/tasks/summary', headers=auth_headers).data)
+    assert summary['by_status'] == {'todo': 1, 'done': 1}
+
+def test_batch_rejects_too_many_operations(app, client, auth_headers, cleanup):
+    app.config['TASKS_BATCH_LIMIT'] = 1
+    response = client.post('/api/tasks/batch', headers=auth_headers, json={'operations': [
+        {'op': 'delete', 'id': str(ObjectId())},
+        {'op': 'delete', 'id': str(ObjectId())},
+    ]})
+    assert response.status_code == 413
+
+def test_summary_tracks_task_writes(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 2, status='todo')
+    summary = json.loads(client.get('/api/tasks/summary', headers=auth_headers).data)
+    assert summary['total'] == 2
+    assert summary['by_status'] == {'todo': 2}
+
+    task = json.loads(client.get('/api/tasks', headers=auth_headers).data)[0]
+    client.put(f"/api/tasks/{task['id']}", headers=auth_headers, json={'status': 'done'})
+    create_tasks(client, auth_headers, 1, status='todo')
+
+    summary = json.loads(client.get('/api/tasks/summary', headers=auth_headers).data)
+    assert summary['total'] == 3
+    assert summary['by_status'] == {'todo': 2, 'done': 1}
+
+    metrics = json.loads(client.get('/api/metrics').data)
+    assert metrics['total_tasks'] == 3
+    assert metrics['tasks_by_status'] == {'todo': 2, 'done': 1}
+
+def test_reconcile_all_streams_counters_per_user(app, cleanup, monkeypatch):
+    monkeypatch.setattr(stats_module, 'RECONCILE_BATCH_SIZE', 2)
+    due = datetime(2024, 12, 1, 12, 0)
+    with app.app_context():
+        mongo.db.tasks.insert_many([
+            Task(title='Task', description='', user_id=f'user-{i % 3}', status=('todo', 'done')[i % 2],
+                 due_date=due + timedelta(days=i % 2)).to_document()
+            for i in range(7)
+        ])
+        assert TaskStats.reconcile_all() == 3
+
+        assert TaskStats.get(days=['2024-12-01', '2024-12-02']) == {
+            'total': 7, 'by_status': {'todo': 4, 'done': 3}, 'due_by_day': {'2024-12-01': 4, '2024-12-02': 3}
+        }
+        assert TaskStats.get('user-0', days=['2024-12-01', '2024-12-02']) == {
+            'total': 3, 'by_status': {'todo': 2, 'done': 1}, 'due_by_day': {'2024-12-01': 2, '2024-12-02': 1}
+        }
+        assert 0 < redis_client.client.ttl(TaskStats.key('user-0')) <= stats_module.USER_STATS_EXPIRATION
+        assert redis_client.client.ttl(TaskStats.due_key('user-0')) > 0
+        assert redis_client.client.ttl(TaskStats.key()) == -1
+
+def round_trips(response, service='redis'):
+    timings = dict(metric.split(';', 1) for metric in response.headers['Server-Timing'].split(', '))
+    return int(timings[service].split('desc="')[1].split(' ')[0])
+
+def test_task_requests_batch_redis_round_trips(client, auth_headers, cleanup, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'server_timing', True)
+    create_tasks(client, auth_headers, 1)
+    task_id = str(mongo.db.tasks.find_one()['_id'])
+
+    # Principal and task in one MGET, the fill lock, the cache fill deferred to the end of the request
+    response = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert round_trips(response) == 3
+    response = client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert round_trips(response) == 1
+
+    # The task is not read before find_one_and_update, the rate limit check takes one round trip
+    response = client.put(f'/api/tasks/{task_id}', headers=auth_headers, json={'title': 'Renamed'})
+    assert round_trips(response) == 3
+    assert json.loads(client.get(f'/api/tasks/{task_id}', headers=auth_headers).data)['title'] == 'Renamed'
+
+    response = client.get('/api/tasks', headers=auth_headers)
+    assert round_trips(response) == 4
+    response = client.get('/api/tasks', headers=auth_headers)
+    assert round_trips(response) == 2
+
+def test_missing_task_is_cached(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 1)
+    task = mongo.db.tasks.find_one()
+    task_id = ObjectId()
+    assert client.get(f'/api/tasks/{task_id}', headers=auth_headers).status_code == 404
+    assert redis_client.client.ttl(f'task:{task_id}') > 0
+
+    # Inserted behind the cache's back: the 404 is served without reading Mongo
+    mongo.db.tasks.insert_one({**task, '_id': task_id})
+    assert client.get(f'/api/tasks/{task_id}', headers=auth_headers).status_code == 404
+
+def test_cache_miss_waits_for_the_worker_filling_it(app, auth_headers, cleanup, monkeypatch):
+    monkeypatch.setattr(fill_lock, 'ttl_ms', 500)
+    task_id = str(ObjectId())
+    entry = b'user-1 3\n{"title": "Filled by another worker"}'
+
+    with app.app_context():
+        # Another worker holds the lock and fills the entry
+        assert fill_lock.acquire(f'task:{task_id}')
+        threading.Timer(0.05, redis_client.client.set, (f'task:{task_id}', entry)).start()
+        assert Task.get_json_by_id(task_id, 'user-1') == (b'{"title": "Filled by another worker"}', 3)
+
+        # The lock expires without a fill: the waiter reads Mongo itself
+        task_id = str(ObjectId())
+        assert fill_lock.acquire(f'task:{task_id}')
+        started = time.monotonic()
+        assert Task.get_json_by_id(task_id, 'user-1') is None
+        assert time.monotonic() - started >= 0.5
+        assert redis_client.client.get(f'task:{task_id}') == b'\n'
+
+def test_user_tasks_are_refreshed_before_they_expire(app, client, auth_headers, cleanup, monkeypatch):
+    create_tasks(client, auth_headers, 1)
+
+    with app.app_context():
+        user_id = mongo.db.tasks.find_one()['user_id']
+        assert [task['title'] for task in page_tasks(user_id)] == ['Task 0']
+        # Changed behind the cache's back
+        mongo.db.tasks.update_many({}, {'$set': {'title': 'Renamed'}})
+        assert [task['title'] for task in page_tasks(user_id)] == ['Task 0']
+
+        monkeypatch.setattr(fill_lock, 'refresh_early', lambda ttl_ms, delta_ms: True)
+        assert [task['title'] for task in page_tasks(user_id)] == ['Renamed']
+        assert redis_client.client.ttl(f'tasks:{user_id}:items') > 0
+        assert not redis_client.client.exists(f'lock:tasks:{user_id}:items')
+
+def test_cached_page_is_read_after_the_list_version(client, auth_headers, cleanup, monkeypatch):
+    create_tasks(client, auth_headers, 1, status='todo')
+    client.get('/api/tasks?status=todo', headers=auth_headers)
+
+    # A write landing between the two reads must leave a page newer than the ETag, not older
+    executed = []
+    pipeline = redis_client.client.pipeline
+
+    def recording_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+        pipe.execute = lambda: executed.append([command[0][0] for command in pipe.command_stack]) or execute()
+        return pipe
+
+    monkeypatch.setattr(redis_client.client, 'pipeline', recording_pipeline)
+    with client.application.test_request_context():
+        Task.get_user_tasks_page_json(mongo.db.tasks.find_one()['user_id'], 50, status='todo')
+    assert executed == [['SET', 'GET', 'HGET']]
+
+def test_task_pages_are_refreshed_before_they_expire(client, auth_headers, cleanup, monkeypatch):
+    create_tasks(client, auth_headers, 1, status='todo')
+    url = '/api/tasks?status=todo'
+
+    def titles():
+        return [task['title'] for task in json.loads(client.get(url, headers=auth_headers).data)]
+
+    assert titles() == ['Task 0']
+    # Changed behind the cache's back
+    mongo.db.tasks.update_many({}, {'$set': {'title': 'Renamed'}})
+    assert titles() == ['Task 0']
+
+    # Pages share one hash, so each one expires on its own
+    monkeypatch.setattr(task_module, 'CACHE_EXPIRATION', 0)
+    with monkeypatch.context() as patch:
+        patch.setattr(fill_lock, 'refresh_early', lambda ttl_ms, delta_ms: True)
+        assert titles() == ['Renamed']
+    assert not redis_client.client.keys('lock:*')
+
+    mongo.db.tasks.update_many({}, {'$set': {'title': 'Expired'}})
+    assert titles() == ['Expired']
+
+def test_cache_codec_reads_every_format():
+    codec = TaskCacheCodec()
+    task = Task(title='Report', description='Quarterly numbers', user_id='user-1', version=3,
+                due_date=datetime(2024, 12, 1, 12, 0, tzinfo=timezone.utc))
+    # JSON by default, served as it is once decompressed
+    assert codec.encode(task) == task.to_json()
+    large = Task(**{**task.to_document(), 'description': 'Quarterly numbers ' * 100})
+    encoded = codec.encode(large)
+    assert encoded[:1] == b'\x02'
+    assert codec.to_json(encoded, 'user-1') == large.to_json()
+
+    codec.format = task_module.MsgpackTaskFormat()
+    encoded = codec.encode(task)
+    assert encoded[:1] == b'\x01'
+    assert len(encoded) < len(task.to_json()) / 2
+    # Dates come back as naive UTC, like those read from MongoDB
+    assert codec.decode(encoded, 'user-1').to_dict() == {**task.to_dict(), 'due_date': '2024-12-01T12:00:00'}
+
+    task.description = 'Quarterly numbers ' * 100
+    encoded = codec.encode(task)
+    assert encoded[:1] == b'\x02'
+    assert codec.decode(encoded, 'user-1').description == task.description
+
+    # Written by a worker of an older release
+    assert codec.decode(task.to_json(), 'user-1').to_dict() == task.to_dict()
+    with pytest.raises(ValueError):
+        codec.decode(b'\x7f', 'user-1')
+
+def test_cached_pages_are_compressed(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 20, status='todo')
+    response = client.get('/api/tasks?status=todo', headers=auth_headers)
+    assert len(json.loads(response.data)) == 20
+
+    (page,) = [value for key in redis_client.client.keys('tasks:*:pages')
+               for value in redis_client.client.hvals(key)]
+    body = page.split(b'\n', 3)[3]
+    assert body[:1] == b'\x02'
+    assert len(body) < len(response.data) / 2
+    assert client.get('/api/tasks?status=todo', headers=auth_headers).data == response.data
+
+def test_l1_cache_holds_single_tasks_only(client, auth_headers, cleanup, monkeypatch):
+    monkeypatch.setattr(local_cache, 'enabled', True)
+    monkeypatch.setattr(local_cache, '_ensure_listener', lambda: None)
+    invalidated = []
+    invalidate = local_cache.invalidate
+    monkeypatch.setattr(
+        local_cache, 'invalidate', lambda conn, *keys: invalidated.append(keys) or invalidate(conn, *keys)
+    )
+    local_cache.clear()
+
+    create_tasks(client, auth_headers, 1)
+    task_id = str(mongo.db.tasks.find_one()['_id'])
+    client.get('/api/tasks', headers=auth_headers)
+    client.get(f'/api/tasks/{task_id}', headers=auth_headers)
+    assert list(local_cache._entries) == [f'task:{task_id}']
+
+    client.put(f'/api/tasks/{task_id}', headers=auth_headers, json={'title': 'Renamed'})
+    assert invalidated[-1] == (f'task:{task_id}',)
+    assert json.loads(client.get(f'/api/tasks/{task_id}', headers=auth_headers).data)['title'] == 'Renamed'
+
+def test_cached_task_is_not_served_to_other_users(client, auth_headers, cleanup):
+    create_tasks(client, auth_headers, 1)
+    task_id = str(mongo.db.tasks.find_one()['_id'])
+    assert client.get(f'/api/tasks/{task_id}', headers=auth_headers).status_code == 200
+
+    client.post('/api/auth/register', json={'email': 'other@example.com', 'password': 'test123'})
+    token = json.loads(client.post('/api/auth/login', json={
+        'email': 'other@example.com', 'password': 'test123'
+    }).data)['token']
+    response = client.get(f'/api/tasks/{task_id}', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 404
+
+def test_search_ranks_and_invalidates(client, auth_headers, cleanup):
+    for title, description in [('Quarterly report', 'Send it to the team'),
+                               ('Groceries', 'Milk and a report on prices'),
+                               ('Call the plumber', 'Kitchen sink')]:
+        client.post('/api/tasks', headers=auth_headers, json={'title': title, 'description': description})
+
+    response = client.get('/api/tasks/search?q=report', headers=auth_headers)
+    assert response.status_code == 200
+    assert [task['title'] for task in json.loads(response.data)] == ['Quarterly report', 'Groceries']
+    assert set(json.loads(response.data)[0]) == {'id', 'title', 'status', 'due_date'}
+    assert response.headers['X-Total-Count'] == '2'
+
+    response = client.get('/api/tasks/search?q=report&limit=1', headers=auth_headers)
+    assert len(json.loads(response.data)) == 1
+    response = client.get(f"/api/tasks/search?q=report&limit=1&after={response.headers['X-Next-Cursor']}",
+                          headers=auth_headers)
+    assert [task['title'] for task in json.loads(response.data)] == ['Groceries']
+    assert 'X-Next-Cursor' not in response.headers
+
+    etag = client.get('/api/tasks/search?q=qua&mode=prefix', headers=auth_headers).headers['ETag']
+    response = client.get('/api/tasks/search?q=qua&mode=prefix', headers={**auth_headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+
+    task_id = json.loads(client.get('/api/tasks/search?q=CALL&mode=prefix', headers=auth_headers).data)[0]['id']
+    client.put(f'/api/tasks/{task_id}', headers=auth_headers, json={'title': 'Quarantine the cat'})
+    response = client.get('/api/tasks/search?q=qua&mode=prefix', headers=auth_headers)
+    assert [task['title'] for task in json.loads(response.data)] == ['Quarantine the cat', 'Quarterly report']
+
+    assert client.get('/api/tasks/search?q=', headers=auth_headers).status_code == 400
+    assert client.get('/api/tasks/search?q=a&mode=fuzzy', headers=auth_headers).status_code == 400